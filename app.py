@@ -1,12 +1,13 @@
 import os
 # import chalice
-from chalice import Chalice
+from chalice import Chalice, Rate
 
 from chalicelib import auth, orders, carts, menu_items, restaurants, images, users, triggers
 # from chalicelib.auth import MonsterAuthorizer
-from chalicelib.constants.constants import UNAUTHORIZED_USER
-from chalicelib.utils import data as utils_data
+from chalicelib.constants.constants import UNAUTHORIZED_USER, AUTHORIZER_TTL_SECONDS
+from chalicelib.utils import data as utils_data, db as utils_db
 from chalicelib.utils.auth import get_company_id_by_request
+from chalicelib.utils.logger import logger
 
 app = Chalice(app_name='restmonster-backend')
 
@@ -20,9 +21,24 @@ def get_customers_table_stream_arn():
     return os.environ.get("CUSTOMERS_TABLE_STREAM_ARN")
 
 
+@app.middleware('http')
+def db_request_scope(event, get_response):
+    # routes without auth decorators must not get items read by a previous request of a warm container
+    utils_db.reset_identity_map()
+    utils_db.start_capacity_accounting(f"{event.method} {event.context.get('resourcePath')}")
+    utils_db.start_request_retry_budget()
+    try:
+        return get_response(event)
+    finally:
+        utils_db.finish_capacity_accounting()
+        retry_stats = utils_db.finish_request_retry_budget()
+        if retry_stats['retries']:
+            logger.warning(f"db_request_scope ::: db retry stats={retry_stats}")
+
+
 # cognito lambdas
 # OAuth login/logout callbacks
-@app.authorizer()
+@app.authorizer(ttl_seconds=AUTHORIZER_TTL_SECONDS)
 def role_authorizer(auth_request):
     return auth.role_authorizer(auth_request)
 
@@ -32,6 +48,11 @@ def db_customers_table_stream_trigger(event):
     return triggers.db_customers_table_stream_trigger(event)
 
 
+@app.schedule(Rate(1, unit=Rate.DAYS))
+def archive_orders(event):
+    return orders.archive_orders()
+
+
 @app.lambda_function(name='restmonster_CognitoPreSignup')
 def cognito_pre_signup(event, context):
     return auth.cognito_pre_signup(event, context)
@@ -237,7 +258,6 @@ def get_user_orders(user_id):
     return orders.endpoint_get_orders(app.current_request, 'user', user_id)
 
 
-# Todo: TO BE IMPLEMENTED
 @app.route('/orders/archived/{year_month}', methods=['GET'], authorizer=role_authorizer, cors=True)
 def get_archived_orders(year_month):
     """
@@ -248,7 +268,6 @@ def get_archived_orders(year_month):
     return orders.get_archived_orders(app.current_request, year_month)
 
 
-# Todo: TO BE IMPLEMENTED
 @app.route('/orders/archived/restaurant/{restaurant_id}/{year_month}', methods=['GET'], authorizer=role_authorizer, cors=True)
 def get_restaurant_archived_orders(restaurant_id, year_month):
     """
@@ -257,7 +276,6 @@ def get_restaurant_archived_orders(restaurant_id, year_month):
     return orders.get_restaurant_archived_orders(app.current_request, restaurant_id, year_month)
 
 
-# Todo: TO BE IMPLEMENTED
 @app.route('/orders/archived/user/{user_id}/{year_month}', methods=['GET'], authorizer=role_authorizer, cors=True)
 def get_user_archived_orders(user_id, year_month):
     """
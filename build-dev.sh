@@ -12,5 +12,7 @@ export PYTHONPATH=.
 which chalice
 chalice --version
 echo $APP_S3_BUCKET
+# the jwt token mode trusts custom:role and custom:company_id, the app client must not be able to write them
+python -m tools.check_cognito_client --stage dev || exit 1
 chalice package --merge-template pipeline.json tmp/packaged/
 aws cloudformation package --template-file ./tmp/packaged/sam.json --s3-bucket "${APP_S3_BUCKET}" --output-template-file transformed.yaml
@@ -1,24 +1,28 @@
 import os
+import time
 import uuid
 from datetime import datetime
+from types import MappingProxyType
 from typing import Dict, Any
 
 from chalice import AuthResponse, AuthRoute
 from chalice.app import AuthRequest, ChaliceAuthorizer, Response
 
-from chalicelib.constants.keys_structure import users_pk, users_sk
-from chalicelib.users import User
-from chalicelib.utils import data as utils_data
-from chalicelib.utils.auth import get_company_id_by_host
-from chalicelib.utils.boto_clients import cognito_client
-from chalicelib.utils.db import get_main_table
-from chalicelib.utils.exceptions import AuthorizationException, RecordNotFound, ValidationException
-from pycognito import Cognito
+from chalicelib.constants.constants import AUTHORIZER_TTL_SECONDS, LEGACY_TOKEN_COMPANY_ID
+from chalicelib.constants.keys_structure import users_pk, users_sk, emails_pk, emails_sk
+from chalicelib.utils import data as utils_data, jwt_verifier
+from chalicelib.utils.auth import get_company_id_by_host, get_user_role_and_permissions
+from chalicelib.utils.cache import TTLCache
+from chalicelib.utils.cognito import get_cognito
+from chalicelib.utils.db import get_main_table, reset_identity_map, get_db_item, transact_write, STRONG_READ
+from chalicelib.utils.exceptions import AuthorizationException, RecordNotFound, ValidationException, \
+    ConditionalCheckFailed
 
 from chalicelib.utils.logger import logger
 
 UUID_PATTERN = '????????-????-4???-????-????????????'
 ORDER_ID_PATTERN = '????????'
+YEAR_MONTH_PATTERN = '????-??'
 
 
 # class CustomAuthRequest(AuthRequest):
@@ -33,81 +37,104 @@ ORDER_ID_PATTERN = '????????'
 #                                  event['methodArn'], event.get('headers').get('host'))
 
 
+# Routes allowed for every role, built once per container. AuthResponse gets a list copy of the tuple,
+# so a response can't change the table
+ROLE_ROUTES = MappingProxyType({
+    'user': (
+        AuthRoute(path=f'/users', methods=['GET', 'PUT']),
+        AuthRoute(path=f'/restaurants', methods=['GET']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
+        AuthRoute(path=f'/menu-items/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/carts/{UUID_PATTERN}', methods=['GET', 'POST', 'DELETE']),
+        AuthRoute(path=f'/carts/{UUID_PATTERN}/{UUID_PATTERN}', methods=['DELETE']),
+        AuthRoute(path=f'/orders', methods=['GET', 'POST']),
+        AuthRoute(path=f'/orders/id/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['GET', 'DELETE']),
+        AuthRoute(path=f'/orders/archived/*', methods=['GET']),
+        AuthRoute(path=f'/orders/pre-order/{UUID_PATTERN}', methods=['POST'])
+    ),
+    'restaurant_manager': (
+        AuthRoute(path=f'/users', methods=['GET']),
+        AuthRoute(path=f'/restaurants', methods=['GET']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
+        AuthRoute(path=f'/menu-items/{UUID_PATTERN}', methods=['GET', 'POST']),
+        AuthRoute(path=f'/menu-items/{UUID_PATTERN}/{UUID_PATTERN}', methods=['PUT', 'DELETE']),
+        AuthRoute(path=f'/orders', methods=['GET']),
+        AuthRoute(path=f'/orders/restaurant/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/archived/{YEAR_MONTH_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['PUT', 'DELETE']),
+        AuthRoute(path=f'/image-upload', methods=['POST'])
+    ),
+    'company_admin': (
+        AuthRoute(path=f'/users', methods=['GET', 'PUT']),
+        AuthRoute(path=f'/restaurants', methods=['GET', 'POST']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
+        AuthRoute(path=f'/menu-items/{UUID_PATTERN}', methods=['GET', 'POST']),
+        AuthRoute(path=f'/menu-items/{UUID_PATTERN}/{UUID_PATTERN}', methods=['PUT', 'DELETE']),
+        AuthRoute(path=f'/orders', methods=['GET']),
+        AuthRoute(path=f'/orders/restaurant/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/archived/{YEAR_MONTH_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['PUT', 'DELETE']),
+        AuthRoute(path=f'/image-upload', methods=['POST']),
+        AuthRoute(path=f'/users/managers', methods=['GET', 'POST', 'DELETE']),
+    ),
+    'admin': (
+        AuthRoute(path=f'/restaurants', methods=['GET', 'POST']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET', 'PUT', 'DELETE']),
+        AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
+        AuthRoute(path=f'/orders/restaurant/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/user/{UUID_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/archived/restaurant/{UUID_PATTERN}/{YEAR_MONTH_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/archived/user/{UUID_PATTERN}/{YEAR_MONTH_PATTERN}', methods=['GET']),
+        AuthRoute(path=f'/orders/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['DELETE'])
+    )
+})
+
+# token: (AuthResponse, token expiration time) of tokens authorized by this container, denials are not cached.
+# API Gateway caches the policy for AUTHORIZER_TTL_SECONDS too, so a role change reaches a user
+# after the larger of the two at the latest
+authorizer_cache = TTLCache(max_size=int(os.environ.get('AUTHORIZER_CACHE_MAX_SIZE', 1000)),
+                            ttl_seconds=float(os.environ.get('AUTHORIZER_CACHE_TTL_SECONDS', AUTHORIZER_TTL_SECONDS)))
+
+
+def get_role_auth_response(role: str) -> AuthResponse:
+    routes = ROLE_ROUTES.get(role)
+    if routes is None:
+        return AuthResponse(routes=[], principal_id='')
+    return AuthResponse(routes=list(routes), principal_id=role)
+
+
+def get_token_role(token: str):
+    """
+    :return:
+    role of the token owner and the unix time the token expires at (None for legacy user id tokens)
+    """
+    if jwt_verifier.get_token_mode() == jwt_verifier.TOKEN_MODE_JWT:
+        claims = jwt_verifier.verify_token(token)
+        return jwt_verifier.get_identity(claims)['role'], claims['exp']
+    user_id = token
+    reset_identity_map()
+    role, _ = get_user_role_and_permissions(LEGACY_TOKEN_COMPANY_ID, user_id)
+    return role, None
+
+
 def role_authorizer(auth_request):
-    user_id = auth_request.token
-    company_id = 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
+    token = auth_request.token
+    auth_response, expires_at = authorizer_cache.get(token, (None, None))
+    if auth_response is not None and (expires_at is None or expires_at > time.time()):
+        return auth_response
     try:
-        user: User = User.init_by_id(company_id, user_id)
-    except RecordNotFound:
-        return AuthResponse(routes=[], principal_id='')
-    if user.role == 'user':
-        return AuthResponse(
-            routes=[
-                AuthRoute(path=f'/users', methods=['GET', 'PUT']),
-                AuthRoute(path=f'/restaurants', methods=['GET']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
-                AuthRoute(path=f'/menu-items/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/carts/{UUID_PATTERN}', methods=['GET', 'POST', 'DELETE']),
-                AuthRoute(path=f'/carts/{UUID_PATTERN}/{UUID_PATTERN}', methods=['DELETE']),
-                AuthRoute(path=f'/orders', methods=['GET', 'POST']),
-                AuthRoute(path=f'/orders/id/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['GET', 'DELETE']),
-                AuthRoute(path=f'/orders/archived/*', methods=['GET']),
-                AuthRoute(path=f'/orders/pre-order/{UUID_PATTERN}', methods=['POST'])
-            ],
-            principal_id='user'
-        )
-    elif user.role == 'restaurant_manager':
-        return AuthResponse(
-            routes=[
-                AuthRoute(path=f'/users', methods=['GET']),
-                AuthRoute(path=f'/restaurants', methods=['GET']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
-                AuthRoute(path=f'/menu-items/{UUID_PATTERN}', methods=['GET', 'POST']),
-                AuthRoute(path=f'/menu-items/{UUID_PATTERN}/{UUID_PATTERN}', methods=['PUT', 'DELETE']),
-                AuthRoute(path=f'/orders', methods=['GET']),
-                AuthRoute(path=f'/orders/restaurant/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/archived/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['PUT', 'DELETE']),
-                AuthRoute(path=f'/image-upload', methods=['POST'])
-            ],
-            principal_id='restaurant_manager'
-        )
-    elif user.role == 'company_admin':
-        return AuthResponse(
-            routes=[
-                AuthRoute(path=f'/users', methods=['GET', 'PUT']),
-                AuthRoute(path=f'/restaurants', methods=['GET', 'POST']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
-                AuthRoute(path=f'/menu-items/{UUID_PATTERN}', methods=['GET', 'POST']),
-                AuthRoute(path=f'/menu-items/{UUID_PATTERN}/{UUID_PATTERN}', methods=['PUT', 'DELETE']),
-                AuthRoute(path=f'/orders', methods=['GET']),
-                AuthRoute(path=f'/orders/restaurant/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/archived/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['PUT', 'DELETE']),
-                AuthRoute(path=f'/image-upload', methods=['POST']),
-                AuthRoute(path=f'/users/managers', methods=['GET', 'POST', 'DELETE']),
-            ],
-            principal_id='company_admin'
-        )
-    elif user.role == 'admin':
-        return AuthResponse(
-            routes=[
-                AuthRoute(path=f'/restaurants', methods=['GET', 'POST']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}', methods=['GET', 'PUT', 'DELETE']),
-                AuthRoute(path=f'/restaurants/{UUID_PATTERN}/delivery-price', methods=['POST']),
-                AuthRoute(path=f'/orders/restaurant/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/user/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/archived/restaurant/{UUID_PATTERN}/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/archived/user/{UUID_PATTERN}/{UUID_PATTERN}', methods=['GET']),
-                AuthRoute(path=f'/orders/{UUID_PATTERN}/{ORDER_ID_PATTERN}', methods=['DELETE'])
-            ],
-            principal_id='admin'
-        )
-    else:
+        role, expires_at = get_token_role(token)
+    except (RecordNotFound, AuthorizationException) as error:
+        logger.info(f"role_authorizer ::: denied, {error=}")
         return AuthResponse(routes=[], principal_id='')
+    auth_response = get_role_auth_response(role)
+    if auth_response.routes:
+        authorizer_cache.set(token, (auth_response, expires_at))
+    logger.info(f"role_authorizer ::: {role=} authorizer cache stats={authorizer_cache.stats}")
+    return auth_response
 
 
 def login_cognito(current_request):
@@ -115,8 +142,7 @@ def login_cognito(current_request):
     password = body['password']
     username = body['username']
     try:
-        u = Cognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'],
-                    username=username, user_pool_region=os.environ['DEFAULT_REGION'])
+        u = get_cognito(username=username)
 
         u.authenticate(password=password)
         return {
@@ -140,8 +166,7 @@ def refresh_id_token_cognito(current_request):
     id_token = body['id_token']
     refresh_token = body['refresh_token']
     try:
-        u = Cognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'],
-                    id_token=id_token, refresh_token=refresh_token)
+        u = get_cognito(id_token=id_token, refresh_token=refresh_token)
         logger.debug(f'original id_token={u.id_token}')
 
         u.renew_access_token()
@@ -152,23 +177,29 @@ def refresh_id_token_cognito(current_request):
         return Response(status_code=400, body={'status': 'error', 'error': str(e)})
 
 
-def get_all_cognito_users_email():
-    users = cognito_client.list_users(
-        UserPoolId=os.environ['COGNITO_ADMIN_POOL_ID'],
-        AttributesToGet=['email']
-    )['Users']
-    all_registered_emails = [user['Attributes'][0]['Value'] for user in users]
+def get_email_index_key(company_id: str, email: str) -> dict:
+    return {
+        'partkey': emails_pk.format(company_id=company_id),
+        'sortkey': emails_sk.format(email=email.strip().lower())
+    }
 
-    logger.info(f'get_all_cognito_users_email ::: get {len(all_registered_emails)} emails')
-    return all_registered_emails
+
+def is_email_registered(company_id: str, email: str) -> bool:
+    email_key = get_email_index_key(company_id, email)
+    try:
+        get_db_item(email_key['partkey'], email_key['sortkey'], table=get_main_table, read_policy=STRONG_READ)
+    except RecordNotFound:
+        return False
+    return True
 
 
 def cognito_pre_signup(event, context):
     logger.info(f'cognito_pre_signup ::: triggered: event={event}, context={context}')
-    registered_emails = get_all_cognito_users_email()
-
-    new_user_email = event['request']['userAttributes'].get('email')
-    if new_user_email in registered_emails:
+    attributes = event['request']['userAttributes']
+    new_user_email = attributes.get('email')
+    company_id = attributes.get('custom:company_id')
+    # admins sign up with a new company, which is created on confirmation, so there is nothing to check against
+    if new_user_email and company_id and is_email_registered(company_id, new_user_email):
         msg = f"User with email {new_user_email} already exists and cannot be created"
         logger.info(msg)
         raise ValidationException(msg)
@@ -196,7 +227,19 @@ def create_db_user(user_id: str, username: str, email: str, phone: str, role: st
 
     item_cleaned = utils_data.cleanup_dict(user_item, ['n/a', '', ' ', None])
     utils_data.substitute_keys_to_db(item_cleaned)
-    resp = get_main_table().put_item(Item=item_cleaned)
+    transact_items = [{'Put': {'Item': item_cleaned}}]
+    if email:
+        # a retried confirmation of the same user may write its email again, another user may not
+        transact_items.append({'Put': {
+            'Item': {**get_email_index_key(company_id, email), 'record_type': 'email', 'user_id': user_id,
+                     'company_id': company_id},
+            'ConditionExpression': 'attribute_not_exists(partkey) OR user_id = :user_id',
+            'ExpressionAttributeValues': {':user_id': user_id}
+        }})
+    try:
+        resp = transact_write(transact_items, table=get_main_table)
+    except ConditionalCheckFailed:
+        raise ValidationException(f"User with email {email} already exists and cannot be created")
     logger.debug(f'create_user_cognito ::: SUCCESS resp: {resp}, items_cleaned: {item_cleaned}')
 
     return user_id
@@ -293,7 +336,7 @@ def signup_confirmation(client_id, user_name, confirmation_code):
     try:
         logger.debug(f'signup_confirmation ::: {client_id}, {user_name}, {confirmation_code}')
 
-        u = Cognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'])
+        u = get_cognito()
         params = {
             'ClientId': client_id,
             'Username': user_name,
@@ -1,8 +1,10 @@
 from datetime import datetime
-from typing import Tuple, Dict, List, Any
+from typing import Tuple, Dict, List, Any, Optional
+
+from boto3.dynamodb.conditions import Attr
 
 from chalicelib.constants.substitute_keys import from_db, to_db
-from chalicelib.utils import db as utils_db
+from chalicelib.utils import db as utils_db, exceptions
 from chalicelib.utils.data import substitute_keys
 from chalicelib.utils.logger import logger
 
@@ -15,11 +17,63 @@ class EntityBase:
     required_mutable_fields_validation = {}
     optional_fields_validation = {}
 
+    # Sparse fieldsets: UI names of attributes which list endpoints return for fields= query parameter,
+    # projection_required_attrs are always read because the entity can't be initialized without them
+    list_fields: Tuple[str, ...] = ()
+    projection_required_attrs: Tuple[str, ...] = ('company_id', 'id_')
+
+    # Default read policy of the entity's items, see utils_db.ReadPolicy
+    read_policy: utils_db.ReadPolicy = utils_db.EVENTUAL_READ
+
+    # Optimistic concurrency: versioned records have version_ attribute which is incremented by every update,
+    # an update is applied only if the record still has the version which was read (self.version_)
+    versioned = False
+
     def __init__(self, company_id, id_):
         self.company_id = company_id
         self.id_: str = id_
         self.record_type: str = ''
         self.request_data: Any[Dict, None] = None
+        self.version_: Optional[int] = None
+
+    @classmethod
+    def parse_fields(cls, request) -> Optional[List[str]]:
+        """
+        Validates comma separated fields= query parameter against list_fields
+        :return:
+        requested UI field names, None if the parameter is not set (whole items are returned)
+        """
+        fields_param = (request.query_params or {}).get('fields')
+        if fields_param is None:
+            return None
+        fields = list(dict.fromkeys(field.strip() for field in fields_param.split(',') if field.strip()))
+        invalid_fields = [field for field in fields if field not in cls.list_fields]
+        if not fields or invalid_fields:
+            raise exceptions.InvalidFields(f'fields must be a comma separated list of {", ".join(cls.list_fields)}, '
+                                           f'{invalid_fields=}')
+        return fields
+
+    @classmethod
+    def get_projection(cls, fields: Optional[List[str]]) -> Optional[List[str]]:
+        """
+        :return:
+        db attributes to read for the requested UI fields, None to read whole items
+        """
+        if fields is None:
+            return None
+        return list(dict.fromkeys([*cls.projection_required_attrs, *(to_db.get(field, field) for field in fields)]))
+
+    @staticmethod
+    def select_fields(item: Dict, fields: Optional[List[str]]) -> Dict:
+        """
+        Drops attributes which were not requested (and so were not read) from UI item, id and version are always kept
+        """
+        if fields is None:
+            return item
+        return {key: value for key, value in item.items() if key in ('id', 'version') or key in fields}
+
+    def _set_version(self, version) -> None:
+        self.version_ = int(version) if version is not None else None
 
     def _get_pk_sk(self) -> Tuple[str, str]:
         """
@@ -30,7 +84,7 @@ class EntityBase:
         return self.pk, self.sk
 
     def _get_db_item(self) -> Dict:
-        return utils_db.get_db_item(*self._get_pk_sk())
+        return utils_db.get_db_item(*self._get_pk_sk(), read_policy=self.read_policy)
 
     def _to_dict(self) -> Dict:
         """
@@ -57,6 +111,9 @@ class EntityBase:
             'record_type': self.record_type,
             **self._to_dict()
         }
+        if self.versioned:
+            self._set_version(1)
+            self.db_record['version_'] = self.version_
 
     def _validate_mandatory_fields(self):
         """
@@ -104,7 +161,13 @@ class EntityBase:
         self._init_db_record()
         self._validate_mandatory_fields()
         self._validate_optional_fields()
-        utils_db.put_db_record(self.db_record)
+        try:
+            utils_db.put_db_record(
+                self.db_record,
+                condition_expression=Attr('partkey').not_exists() if self.versioned else None
+            )
+        except exceptions.ConditionalCheckFailed:
+            raise exceptions.VersionConflict(f'{self.record_type} {self.id_} was already created')
         logger.info(f"_create_db_record ::: {self.record_type=} {self.id_=} {self.db_record.get('partkey')=} "
                     f"{self.db_record.get('sortkey')=} successfully created")
 
@@ -123,16 +186,29 @@ class EntityBase:
             self.updated_by = self.request_data.get('auth_result', {}).get('user_id')
         update_dict = self._get_validated_update_dict()
         substitute_keys(dict_to_process=update_dict, base_keys=to_db)
-        utils_db.update_db_record(
-            key={'partkey': pk, 'sortkey': sk},
-            update_body=update_dict,
-            allowed_attrs_to_update=self._update_fields_whitelist(),
-            allowed_attrs_to_delete=[]
-        )
+        condition_expression = None
+        if self.versioned and self.version_ is not None:
+            condition_expression = Attr('version_').eq(self.version_)
+        try:
+            response = utils_db.update_db_record(
+                key={'partkey': pk, 'sortkey': sk},
+                update_body=update_dict,
+                allowed_attrs_to_update=self._update_fields_whitelist(),
+                allowed_attrs_to_delete=[],
+                increment_attrs=['version_'] if self.versioned else None,
+                condition_expression=condition_expression
+            )
+        except exceptions.ConditionalCheckFailed:
+            raise exceptions.VersionConflict(f'{self.record_type} {self.id_} was changed by another request, '
+                                             f'read version={self.version_}')
+        if self.versioned:
+            self._set_version(response['Attributes']['version_'])
         logger.info(f"_update_db_record ::: {self.record_type=} "
                     f"{self.id_=} {pk=} {sk=} successfully updated")
 
     def _to_ui(self) -> Dict:
         item = self._to_dict()
+        if self.versioned:
+            item['version'] = self.version_
         substitute_keys(dict_to_process=item, base_keys=from_db)
         return item
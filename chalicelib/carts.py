@@ -24,6 +24,9 @@ class Cart(EntityBase):
         'delivery_address': lambda x: isinstance(x, str)
     }
 
+    versioned = True
+    read_policy = utils_db.STRONG_READ
+
     def __init__(self, company_id, id_, restaurant_id, request_body=None):
         EntityBase.__init__(self, company_id, id_)
 
@@ -43,6 +46,7 @@ class Cart(EntityBase):
             self.restaurant_id = self.db_record.get('restaurant_id')
             self.delivery_address = self.db_record.get('delivery_address')
             self.menu_items = self.db_record.get('menu_items')
+            self._set_version(self.db_record.get('version_'))
         except exceptions.RecordNotFound:
             self._create_db_record()
 
@@ -112,11 +116,13 @@ class Cart(EntityBase):
 
     def _check_and_update_available_items(self) -> bool:
         items_qnt = len(self.menu_items)
+        menu_items: Dict[str, MenuItem] = MenuItem.init_get_by_ids(
+            self.company_id, list(self.menu_items.keys()), self.restaurant_id)
         self.menu_items = {item_id: info for item_id, info in self.menu_items.items() if
-                           MenuItem.init_get_by_id(self.company_id, item_id, self.restaurant_id).is_available}
+                           menu_items[item_id].is_available}
         return True if items_qnt == len(self.menu_items) else False
 
     def delete_db_record(self):
         pk, sk = self._get_pk_sk()
-        utils_db.get_customers_table().delete_item(Key={'partkey': pk, 'sortkey': sk})
+        utils_db.delete_db_record({'partkey': pk, 'sortkey': sk})
         logger.info(f"delete_db_record ::: item list in the cart was successfully updated")
@@ -2,3 +2,15 @@ UNAUTHORIZED_USER = 'unauthorized_user'
 MAIN_IMAGE_NAME = 'main.jpg'
 THUMB_IMAGE_NAME = 'thumbnail.jpg'
 ORDER_EMAIL_FROM = 'orders@restmonster.ru'
+# Orders of a restaurant are spread over order_shards partitions, the number is set when the restaurant is created
+ORDER_SHARDS_DEFAULT = 4
+ORDER_SHARDS_MAX = 32
+# Orders in one of these states (last history entry) are moved to the monthly archive partitions
+ORDER_COMPLETED_STATES = ('delivered', 'closed', 'cancelled')
+ORDERS_ARCHIVE_AFTER_DAYS_DEFAULT = 30
+# Seconds API Gateway (and the authorizer itself) caches the policy of a token
+AUTHORIZER_TTL_SECONDS = 60
+# Legacy user id tokens (AUTH_TOKEN_MODE=user_id) carry no company and the API Gateway authorizer gets no host,
+# so in that mode only users of this company pass the authorizer. Brands onboarded with companies_hosts records
+# need AUTH_TOKEN_MODE=jwt, where the company is taken from the custom:company_id claim of the token
+LEGACY_TOKEN_COMPANY_ID = 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
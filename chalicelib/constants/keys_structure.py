@@ -13,8 +13,21 @@ carts_sk = '{user_id}'
 pre_orders_pk = 'pre_order_{company_id}_{user_id}'
 pre_orders_sk = '{order_id}'
 
-orders_pk = 'orders_{company_id}'
-orders_sk = '{restaurant_id}_{order_id}'
+orders_pk = 'orders_{company_id}_{restaurant_id}_{shard}'
+orders_sk = '{order_id}'
+
+# gsi_user_orders index: partition gsi_user_orders_partkey, sort date_created
+user_orders_gsi_pk = 'user_orders_{company_id}_{user_id}'
+# archived orders of a user are kept in the same index under their own partition, queried by year_month prefix
+user_orders_archived_gsi_pk = 'user_orders_archived_{company_id}_{user_id}'
 
 orders_archived_pk = 'orders_archived_{company_id}_{year_month}'
 orders_archived_sk = '{restaurant_id}_{order_id}'
+
+# email uniqueness index, one record per lowercased email of a user of the company
+emails_pk = 'emails_{company_id}'
+emails_sk = '{email}'
+
+# host (domain of a brand) -> company, record_type company_host, main table
+company_hosts_pk = 'companies_hosts'
+company_hosts_sk = '{host}'
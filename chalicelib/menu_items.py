@@ -1,6 +1,6 @@
 from datetime import datetime
 from decimal import Decimal
-from typing import List, Dict, Tuple
+from typing import List, Dict, Tuple, Iterator
 from uuid import uuid4
 
 from boto3.dynamodb.conditions import Attr, Key
@@ -41,6 +41,13 @@ class MenuItem(EntityBase):
         'options': lambda x: isinstance(x, list)
     }
 
+    versioned = True
+    read_policy = utils_db.EVENTUAL_READ
+
+    list_fields = ('id', 'restaurant_id', 'title', 'category', 'description', 'price', 'opening_time', 'closing_time',
+                   'is_available', 'weight', 'options', 'date_created', 'date_updated', 'archived')
+    projection_required_attrs = ('company_id', 'id_', 'restaurant_id', 'version_')
+
     def __init__(self, company_id, id_, restaurant_id, **kwargs):
         EntityBase.__init__(self, company_id, id_)
 
@@ -67,6 +74,8 @@ class MenuItem(EntityBase):
         self.date_updated: str = kwargs.get('date_updated') or datetime.now().isoformat(timespec="seconds")
         self.archived: bool = kwargs.get('archived', False)
         self.record_type = 'menu_item'
+        # version_ comes from db record, version - from UI request body
+        self._set_version(kwargs.get('version_', kwargs.get('version')))
 
     @classmethod
     @utils_auth.authenticate_class
@@ -85,17 +94,42 @@ class MenuItem(EntityBase):
         c.__init__(**c._get_db_item())
         return c
 
+    @classmethod
+    def init_get_by_ids(cls, company_id, menu_item_ids, restaurant_id) -> Dict[str, 'MenuItem']:
+        """
+        Reads all requested menu items with one batch request
+        :return:
+        dict {menu_item_id: MenuItem}
+        """
+        logger.info("init_get_by_ids ::: started")
+        keys = {
+            menu_item_id: cls(company_id=company_id, id_=menu_item_id, restaurant_id=restaurant_id)._get_pk_sk()
+            for menu_item_id in menu_item_ids
+        }
+        db_items = utils_db.batch_get_items(list(keys.values()), read_policy=cls.read_policy)
+        menu_items = {}
+        for menu_item_id, (partkey, sortkey) in keys.items():
+            if (partkey, sortkey) not in db_items:
+                logger.error(f"init_get_by_ids ::: record partkey={partkey} sortkey={sortkey} not found")
+                raise exceptions.RecordNotFound(f'record partkey={partkey} sortkey={sortkey} not found')
+            menu_items[menu_item_id] = cls(**db_items[(partkey, sortkey)])
+        return menu_items
+
     @staticmethod
+    @utils_app.request_exception_handler
     @utils_app.log_start_finish
     def endpoint_get_menu_items(request, restaurant_id) -> Response:
         company_id = utils_auth.get_company_id_by_request(request)
+        fields = MenuItem.parse_fields(request)
         filter_expression = Attr('archived').eq(False)
-        menu_item_db_records: List[Dict] = utils_db.query_items_paged(
+        menu_item_db_records: Iterator[Dict] = utils_db.iter_query_items(
             Key('partkey').eq(keys_structure.menu_items_pk.format(company_id=company_id, restaurant_id=restaurant_id)),
-            filter_expression=filter_expression
+            filter_expression=filter_expression,
+            projection=MenuItem.get_projection(fields)
         )
-        menu_items: List[Dict] = [MenuItem(**record)._to_ui() for record in menu_item_db_records]
-        logger.info(f"endpoint_get_restaurants ::: returning menu items={[rest['id'] for rest in menu_items]}")
+        menu_items: List[Dict] = [MenuItem.select_fields(MenuItem(**record)._to_ui(), fields)
+                                  for record in menu_item_db_records]
+        logger.debug(lambda: f"endpoint_get_restaurants ::: returning menu items={[rest['id'] for rest in menu_items]}")
         return Response(status_code=http200, body=menu_items)
 
     @utils_app.request_exception_handler
@@ -1,9 +1,13 @@
+import heapq
 import json
 import os
+import re
 from datetime import datetime, timedelta
 from decimal import Decimal
-from typing import Tuple, Any, List, Dict
+from itertools import islice
+from typing import Tuple, Any, List, Dict, Iterator
 from uuid import uuid4
+from zlib import crc32
 
 from boto3.dynamodb.conditions import Key, Attr
 from chalice import Response
@@ -12,7 +16,8 @@ from chalicelib.base_class_entity import EntityBase
 from chalicelib.carts import Cart
 from chalicelib.companies import get_company_settings_record
 from chalicelib.constants import keys_structure
-from chalicelib.constants.constants import UNAUTHORIZED_USER, ORDER_EMAIL_FROM
+from chalicelib.constants.constants import UNAUTHORIZED_USER, ORDER_EMAIL_FROM, ORDER_COMPLETED_STATES, \
+    ORDERS_ARCHIVE_AFTER_DAYS_DEFAULT, ORDER_SHARDS_DEFAULT
 from chalicelib.constants.status_codes import http200
 from chalicelib.constants.substitute_keys import to_db, from_db
 from chalicelib.menu_items import MenuItem
@@ -24,14 +29,26 @@ from chalicelib.utils import auth as utils_auth, \
     notifications as utils_notifications, \
     exceptions, \
     email_templates
+from chalicelib.utils.cache import TTLCache
 from chalicelib.utils.exceptions import OrderNotFound
 from chalicelib.utils.logger import logger
 
+YEAR_MONTH_PATTERN = re.compile(r'^\d{4}-(0[1-9]|1[0-2])$')
+ARCHIVE_CHUNK_SIZE = 100
+
+# (company_id, restaurant_id): order_shards of restaurants whose orders this container read.
+# order_shards can't be changed after the restaurant is created, so entries are never stale,
+# the TTL only drops restaurants which are not used any more
+order_shards_cache = TTLCache(max_size=int(os.environ.get('ORDER_SHARDS_CACHE_MAX_SIZE', 1000)),
+                              ttl_seconds=float(os.environ.get('ORDER_SHARDS_CACHE_TTL_SECONDS', 3600)))
+
 
 class PreOrder(EntityBase):
     pk = keys_structure.pre_orders_pk
     sk = keys_structure.pre_orders_sk
 
+    read_policy = utils_db.STRONG_READ
+
     required_immutable_fields_validation = {
         'id_': lambda x: isinstance(x, str),
         'user_id': lambda x: isinstance(x, str) or None,
@@ -76,6 +93,8 @@ class PreOrder(EntityBase):
         self.record_type: str = 'pre_order'
         self.delivery_method: str = kwargs.get('delivery_method')
         self.payment_method: str = kwargs.get('payment_method')
+        # order_shards of the restaurant, kept with the pre-order so the order is put without reading the restaurant
+        self.order_shards: Any[int, None] = kwargs.get('order_shards')
 
     @classmethod
     def init_request_create_pre_order_unauthorized_user(cls, request, restaurant_id):
@@ -130,8 +149,10 @@ class PreOrder(EntityBase):
     @utils_app.request_exception_handler
     @utils_app.log_start_finish
     def endpoint_create_pre_order(self):
+        menu_items: Dict[str, MenuItem] = MenuItem.init_get_by_ids(
+            self.company_id, [item['id'] for item in self.menu_items.values()], self.restaurant_id)
         for item in self.menu_items.values():
-            menu_item: MenuItem = MenuItem.init_get_by_id(self.company_id, item['id'], self.restaurant_id)
+            menu_item: MenuItem = menu_items[item['id']]
             self.menu_item_list.append(menu_item)
             item['details'] = menu_item.to_ui()
         self._create_db_record()
@@ -156,12 +177,19 @@ class PreOrder(EntityBase):
             'archived': self.archived,
             "comment_": self.comment_,
             'delivery_method': self.delivery_method,
-            'payment_method': self.payment_method
+            'payment_method': self.payment_method,
+            'order_shards': self.order_shards
         }
 
     def to_dict(self):
         return self._to_dict()
 
+    def _to_ui(self) -> Dict:
+        item = EntityBase._to_ui(self)
+        # storage detail for the order, not a part of the pre-order API
+        item.pop('order_shards', None)
+        return item
+
     def _validate_mandatory_fields(self):
         logger.info(f"validate_mandatory_fields ::: started")
         for key, validator_func in {
@@ -175,8 +203,9 @@ class PreOrder(EntityBase):
         logger.info(f"validate_mandatory_fields ::: finished")
 
     def _calculate_amount(self):
-        self.delivery_price = Restaurant.init_get_by_id(
-            self.company_id, self.restaurant_id).get_delivery_price(self.delivery_address)
+        restaurant = Restaurant.init_get_by_id(self.company_id, self.restaurant_id)
+        self.order_shards = restaurant.order_shards
+        self.delivery_price = restaurant.get_delivery_price(self.delivery_address)
         self.amount = Decimal(
             sum([item['details']['price'] * item['qty'] for item in self.menu_items.values()])
         ) + self.delivery_price.quantize(Decimal('1.00'))
@@ -204,6 +233,8 @@ class Order(EntityBase):
     pk_archived = keys_structure.orders_archived_pk
     sk_archived = keys_structure.orders_archived_sk
 
+    read_policy = utils_db.STRONG_READ
+
     required_immutable_fields_validation = {
         'id_': lambda x: isinstance(x, str),
         'user_id': lambda x: isinstance(x, str),
@@ -232,12 +263,17 @@ class Order(EntityBase):
         'feedback_rate': lambda x: isinstance(x, Decimal) and 1 <= x <= 5
     }
 
+    list_fields = ('id', 'user_id', 'user_phone_number', 'user_email', 'restaurant_id', 'delivery_address',
+                   'delivery_price', 'date_created', 'menu_items', 'amount', 'paid', 'history', 'date_updated',
+                   'archived', 'comment', 'feedback', 'delivery_method', 'payment_method')
+    projection_required_attrs = ('company_id', 'id_', 'user_id', 'restaurant_id')
+
     def __init__(self, company_id, id_, user_id, **kwargs):
         EntityBase.__init__(self, company_id, id_)
 
         self.request_data = kwargs.get('request_data', {})
         self.db_record: dict = {}
-        self.pre_order: Any[PreOrder, None] = None
+        self.pre_order: Any[PreOrder, None] = kwargs.get('pre_order')
         self.menu_item_list: List[MenuItem] = []
 
         self.user_id: str = user_id or UNAUTHORIZED_USER
@@ -261,6 +297,7 @@ class Order(EntityBase):
         self.record_type = 'order'
         self.delivery_method: str = kwargs.get('delivery_method')
         self.payment_method: str = kwargs.get('payment_method')
+        self.order_shards: Any[int, None] = kwargs.get('order_shards', getattr(self, 'order_shards', None))
 
     @classmethod
     @utils_auth.authenticate_class
@@ -293,17 +330,16 @@ class Order(EntityBase):
                                      company_id=auth_result['company_id'])
 
     def fill_items_details(self):
+        menu_items: Dict[str, MenuItem] = MenuItem.init_get_by_ids(
+            self.company_id, [item['id'] for item in self.menu_items.values()], self.restaurant_id)
         for item in self.menu_items.values():
-            item['details'] = MenuItem.init_get_by_id(self.company_id, item['id'], self.restaurant_id).to_ui()
+            item['details'] = menu_items[item['id']].to_ui()
 
     @utils_app.request_exception_handler
     @utils_app.log_start_finish
     def endpoint_create_order(self):
         self.fill_items_details()
         self._create_db_record()
-        if self.user_id != UNAUTHORIZED_USER:
-            Cart.init_by_user_id(
-                company_id=self.company_id, user_id=self.user_id, restaurant_id=self.restaurant_id).delete_db_record()
         return Response(status_code=http200, body=self._to_ui())
 
     @utils_app.request_exception_handler
@@ -323,8 +359,11 @@ class Order(EntityBase):
         self.__init__(company_id=self.company_id, pre_order=self.pre_order, **pre_order_dict)
 
     def _get_pk_sk(self) -> Tuple[str, str]:
-        return self.pk.format(company_id=self.company_id), \
-            self.sk.format(restaurant_id=self.restaurant_id, order_id=self.id_)
+        # set from the pre-order for new orders and from the record for read ones, orders looked up by id
+        # and legacy orders without the attribute take it from the container cache
+        if self.order_shards is None:
+            self.order_shards = get_restaurant_order_shards(self.company_id, self.restaurant_id)
+        return get_order_pk_sk(self.company_id, self.restaurant_id, self.id_, self.order_shards)
 
     def _to_dict(self):
         return {
@@ -357,8 +396,13 @@ class Order(EntityBase):
             'sortkey': sk,
             'record_type': self.record_type,
             'company_id': self.company_id,
+            'order_shards': self.order_shards,
             **self._to_dict()
         }
+        if self.user_id != UNAUTHORIZED_USER:
+            # gsi_user_orders is sparse, orders of unauthorized users are not indexed
+            self.db_record['gsi_user_orders_partkey'] = keys_structure.user_orders_gsi_pk.format(
+                company_id=self.company_id, user_id=self.user_id)
         utils_data.substitute_keys(dict_to_process=self.db_record, base_keys=to_db)
 
     def _validate_mandatory_fields(self):
@@ -381,10 +425,27 @@ class Order(EntityBase):
                                                       'them from cart and recreate the order')
 
     def _create_db_record(self):
+        """
+        Puts the order, deletes the pre-order and user's cart in one transaction.
+        The pre-order must still exist, so the same pre-order can't be turned into an order twice
+        """
         self._init_db_record()
         self._validate_mandatory_fields()
         self._check_items_availability()
-        utils_db.put_db_record(self.db_record)
+        transact_items = [{'Put': {'Item': self.db_record}}]
+        if self.pre_order is not None:
+            pre_order_pk, pre_order_sk = self.pre_order._get_pk_sk()
+            transact_items.append({'Delete': {
+                'Key': {'partkey': pre_order_pk, 'sortkey': pre_order_sk},
+                'ConditionExpression': 'attribute_exists(partkey)'
+            }})
+        if self.user_id != UNAUTHORIZED_USER:
+            cart_pk, cart_sk = Cart(self.company_id, self.user_id, self.restaurant_id)._get_pk_sk()
+            transact_items.append({'Delete': {'Key': {'partkey': cart_pk, 'sortkey': cart_sk}}})
+        try:
+            utils_db.transact_write(transact_items)
+        except exceptions.ConditionalCheckFailed:
+            raise exceptions.VersionConflict(f'pre-order {self.id_} was already processed')
         logger.info(f"create_order ::: order {self.id_} successfully created")
 
     def _to_ui(self):
@@ -397,31 +458,83 @@ class Order(EntityBase):
         return self._to_ui()
 
 
-def get_restaurant_db_orders_paginated(company_id, restaurant_id, limit, start_key):
-    if start_key:
-        start_key = {
-            'partkey': Order.pk.format(company_id=company_id),
-            'sortkey': Order.sk.format(restaurant_id=restaurant_id, order_id=start_key)
-        }
+def get_restaurant_order_shards(company_id, restaurant_id) -> int:
+    order_shards = order_shards_cache.get((company_id, restaurant_id))
+    if order_shards is None:
+        order_shards = int(Restaurant.init_get_by_id(company_id, restaurant_id).order_shards)
+        order_shards_cache.set((company_id, restaurant_id), order_shards)
+    return order_shards
+
+
+def get_order_shard(order_id: str, order_shards: int) -> int:
+    return crc32(order_id.encode()) % int(order_shards)
+
+
+def get_order_pk_sk(company_id, restaurant_id, order_id, order_shards) -> Tuple[str, str]:
+    partkey = Order.pk.format(company_id=company_id, restaurant_id=restaurant_id,
+                              shard=get_order_shard(order_id, order_shards))
+    return partkey, Order.sk.format(order_id=order_id)
+
+
+def get_restaurant_db_orders_paginated(company_id, restaurant_id, limit, start_key, projection=None):
+    """
+    Reads one page of restaurant's orders ordered by order id: queries all order shards of the restaurant
+    and merges their results. Order ids are spread evenly over the shards, so every shard is read in pages of
+    its share of the limit and only shards which hold more of the page are queried again
+    :return:
+    orders, order id to start the next page after (None for the last page)
+    """
     if not restaurant_id:
         raise exceptions.MissingRestaurantId('restaurant_id must be provided in query parameters')
-    partkey = Order.pk.format(company_id=company_id)
-    return utils_db.query_items_paginated(
-        key_condition_expression=Key('partkey').eq(partkey) & Key('sortkey').begins_with(restaurant_id),
+    limit = int(limit or os.environ.get('DEFAULT_PAGE_SIZE', 30))
+    order_shards = get_restaurant_order_shards(company_id, restaurant_id)
+    # one extra record shows if there is the next page
+    shard_page_size = -(-(limit + 1) // order_shards)
+    shard_records = []
+    for shard in range(order_shards):
+        partkey = Order.pk.format(company_id=company_id, restaurant_id=restaurant_id, shard=shard)
+        shard_records.append(utils_db.iter_query_items(
+            key_condition_expression=Key('partkey').eq(partkey),
+            start_key={'partkey': partkey, 'sortkey': start_key} if start_key else None,
+            page_size=shard_page_size,
+            projection=projection
+        ))
+    db_records = list(islice(heapq.merge(*shard_records, key=lambda record: record['sortkey']), limit + 1))
+    if len(db_records) > limit:
+        return db_records[:limit], db_records[limit - 1]['sortkey']
+    return db_records, None
+
+
+def get_user_db_orders_paginated(company_id, restaurant_id, user_id, limit, cursor,
+                                 projection=None) -> Tuple[List[Dict], Any]:
+    """
+    Reads one page of user's orders, newest first, from gsi_user_orders
+    :return:
+    orders, opaque cursor of the next page (None for the last page)
+    """
+    gsi_partkey = keys_structure.user_orders_gsi_pk.format(company_id=company_id, user_id=user_id)
+    start_key = utils_data.decode_cursor(cursor)
+    if start_key and start_key.get('gsi_user_orders_partkey') != gsi_partkey:
+        raise exceptions.InvalidCursor(f'Page cursor does not belong to orders of user {user_id}')
+    db_records, last_key = utils_db.query_items_paginated(
+        key_condition_expression=Key('gsi_user_orders_partkey').eq(gsi_partkey),
+        filter_expression=Attr('restaurant_id').eq(restaurant_id) if restaurant_id else None,
+        index_name='gsi_user_orders',
+        limit=limit or os.environ.get('DEFAULT_PAGE_SIZE', 30),
         start_key=start_key,
-        limit=limit
+        scan_index_forward=False,
+        projection=projection
     )
+    return db_records, utils_data.encode_cursor(last_key)
 
 
-def get_user_db_orders(company_id, restaurant_id, user_id):
-    if restaurant_id:
-        filter_expression = Attr('user_id').eq(user_id) & Attr('restaurant_id').eq(restaurant_id)
-    else:
-        filter_expression = Attr('user_id').eq(user_id)
-    return utils_db.query_items_paged(
-        key_condition_expression=Key('partkey').eq(Order.pk.format(company_id=company_id)),
-        filter_expression=filter_expression,
-        index_name='date_created-index'
+def orders_response(db_records: List[Dict], new_last_key, fields: List[str] = None) -> Response:
+    return Response(
+        status_code=http200,
+        body={
+            "orders": [Order.select_fields(Order(**record).to_ui(), fields) for record in db_records],
+            "last_evaluated_key": new_last_key
+        }
     )
 
 
@@ -433,41 +546,234 @@ def endpoint_get_orders(request, entity_type=None, entity_id=None):
     company_id, user_id, user_role = auth_result['company_id'], auth_result['user_id'], auth_result['role']
     qp = request.query_params or {}
     restaurant_id, start_key, limit = qp.get('restaurant_id'), qp.get('start_key'), qp.get('page_size')
+    fields = Order.parse_fields(request)
+    projection = Order.get_projection(fields)
     new_last_key = None
     if user_role == 'user':
-        db_records = get_user_db_orders(company_id, restaurant_id, user_id)
+        db_records, new_last_key = get_user_db_orders_paginated(company_id, restaurant_id, user_id, limit, start_key,
+                                                                projection)
     elif user_role == 'restaurant_manager':
         accessible_restaurants = auth_result['permissions']['restaurants'].keys()
         if entity_id not in accessible_restaurants:
             raise exceptions.AccessDenied("Access Denied error")
-        db_records, new_last_key = get_restaurant_db_orders_paginated(company_id, entity_id, limit, start_key)
+        db_records, new_last_key = get_restaurant_db_orders_paginated(company_id, entity_id, limit, start_key,
+                                                                      projection)
     elif user_role == 'admin':
         if entity_type == 'user':
-            db_records = get_user_db_orders(company_id, restaurant_id, entity_id)
+            db_records, new_last_key = get_user_db_orders_paginated(company_id, restaurant_id, entity_id, limit,
+                                                                    start_key, projection)
         elif entity_type == 'restaurant':
-            db_records, new_last_key = get_restaurant_db_orders_paginated(company_id, entity_id, limit, start_key)
+            db_records, new_last_key = get_restaurant_db_orders_paginated(company_id, entity_id, limit, start_key,
+                                                                          projection)
         else:
             logger.exception(f'endpoint_get_orders ::: Wrong entity_type={entity_type} in case of admin user')
             raise Exception('endpoint_get_orders ::: Wrong entity_type in case of admin user')
     else:
         raise exceptions.AccessDenied(f"You don't have permissions to access this resource")
 
-    if new_last_key:
-        new_last_key = new_last_key['sortkey'].split('_')[-1]
+    return orders_response(db_records, new_last_key, fields)
 
-    return Response(
-        status_code=http200,
-        body={
-            "orders": [Order(**record).to_ui() for record in db_records],
-            "last_evaluated_key": new_last_key
-        }
+
+def get_archived_order_pk_sk(company_id, restaurant_id, order_id, date_created) -> Tuple[str, str]:
+    partkey = Order.pk_archived.format(company_id=company_id, year_month=date_created[:7])
+    return partkey, Order.sk_archived.format(restaurant_id=restaurant_id, order_id=order_id)
+
+
+def is_order_completed(db_record: Dict) -> bool:
+    history = db_record.get('history') or ['created']
+    return db_record.get('archived') is True or history[-1] in ORDER_COMPLETED_STATES
+
+
+def iter_restaurant_orders_to_archive(company_id: str, restaurant_id: str, order_shards: int,
+                                      date_before: str) -> Iterator[Dict]:
+    for shard in range(order_shards):
+        partkey = Order.pk.format(company_id=company_id, restaurant_id=restaurant_id, shard=shard)
+        # archived copies have their own record_type and partition, so they are not picked up again
+        # and don't fire the new order notification of the stream trigger
+        orders = utils_db.iter_query_items(
+            key_condition_expression=Key('partkey').eq(partkey) & Key('date_created').lt(date_before),
+            filter_expression=Attr('record_type').eq('order'),
+            index_name='date_created-index'
+        )
+        yield from (order for order in orders if is_order_completed(order))
+
+
+def iter_orders_to_archive(date_before: str) -> Iterator[Dict]:
+    """
+    Queries the order shards of every restaurant of every company by date_created-index,
+    only orders created before date_before are read
+    """
+    for company_id in sorted(utils_auth.get_company_ids()):
+        restaurants = utils_db.iter_query_items(
+            key_condition_expression=Key('partkey').eq(keys_structure.restaurants_pk.format(company_id=company_id)),
+            projection=['id_', 'order_shards']
+        )
+        for restaurant in restaurants:
+            order_shards = int(restaurant.get('order_shards') or ORDER_SHARDS_DEFAULT)
+            yield from iter_restaurant_orders_to_archive(company_id, restaurant['id_'], order_shards, date_before)
+
+
+def get_archived_order_record(db_record: Dict) -> Dict:
+    partkey, sortkey = get_archived_order_pk_sk(db_record['company_id'], db_record['restaurant_id'],
+                                                db_record['id_'], db_record['date_created'])
+    archived_record = {**db_record, 'partkey': partkey, 'sortkey': sortkey,
+                       'record_type': 'archived_order', 'archived': True}
+    # archived orders of a user are read from their own gsi_user_orders partition, not with the live ones
+    archived_record.pop('gsi_user_orders_partkey', None)
+    if db_record.get('user_id') not in (None, UNAUTHORIZED_USER):
+        archived_record['gsi_user_orders_partkey'] = keys_structure.user_orders_archived_gsi_pk.format(
+            company_id=db_record['company_id'], user_id=db_record['user_id'])
+    return archived_record
+
+
+def archive_orders(archive_after_days: int = None) -> Dict:
+    """
+    Moves completed orders older than archive_after_days (ORDERS_ARCHIVE_AFTER_DAYS env) to
+    orders_archived_{company_id}_{year_month} partitions. Every chunk of orders is copied first and deleted
+    after the copies are written, so an interrupted run can be safely started again
+    :return:
+    archiving stats {'orders': number of archived orders, 'date_before': date_created upper bound}
+    """
+    if archive_after_days is None:
+        archive_after_days = int(os.environ.get('ORDERS_ARCHIVE_AFTER_DAYS', ORDERS_ARCHIVE_AFTER_DAYS_DEFAULT))
+    date_before = (datetime.today() - timedelta(days=archive_after_days)).isoformat(timespec='seconds')
+    orders_to_archive = iter_orders_to_archive(date_before)
+    archived = 0
+    while chunk := list(islice(orders_to_archive, ARCHIVE_CHUNK_SIZE)):
+        with utils_db.batch_write() as writer:
+            for order in chunk:
+                writer.put(get_archived_order_record(order))
+        with utils_db.batch_write() as writer:
+            for order in chunk:
+                writer.delete({'partkey': order['partkey'], 'sortkey': order['sortkey']})
+        archived += len(chunk)
+    stats = {'orders': archived, 'date_before': date_before}
+    logger.info(f"archive_orders ::: {stats=}")
+    return stats
+
+
+def validate_year_month(year_month: str) -> None:
+    if not YEAR_MONTH_PATTERN.match(year_month or ''):
+        raise exceptions.InvalidYearMonth(f'year_month must be in YYYY-MM format, {year_month=}')
+
+
+def get_archived_db_orders_paginated(company_id, year_month, limit, cursor, restaurant_id=None,
+                                     projection=None) -> Tuple[List[Dict], Any]:
+    """
+    Reads one page of archived orders of the month, ordered by restaurant id and order id
+    :return:
+    orders, opaque cursor of the next page (None for the last page)
+    """
+    validate_year_month(year_month)
+    partkey = Order.pk_archived.format(company_id=company_id, year_month=year_month)
+    sortkey_prefix = Order.sk_archived.format(restaurant_id=restaurant_id, order_id='') if restaurant_id else ''
+    key_condition_expression = Key('partkey').eq(partkey)
+    if sortkey_prefix:
+        key_condition_expression &= Key('sortkey').begins_with(sortkey_prefix)
+    start_key = utils_data.decode_cursor(cursor)
+    if start_key and (start_key.get('partkey') != partkey or
+                      not str(start_key.get('sortkey', '')).startswith(sortkey_prefix)):
+        raise exceptions.InvalidCursor(f'Page cursor does not belong to archived orders of {year_month}')
+    db_records, last_key = utils_db.query_items_paginated(
+        key_condition_expression=key_condition_expression,
+        limit=limit or os.environ.get('DEFAULT_PAGE_SIZE', 30),
+        start_key=start_key,
+        projection=projection
+    )
+    return db_records, utils_data.encode_cursor(last_key)
+
+
+def get_archived_user_db_orders_paginated(company_id, user_id, year_month, limit, cursor, restaurant_id=None,
+                                          projection=None) -> Tuple[List[Dict], Any]:
+    """
+    Reads one page of user's archived orders of the month, newest first, from gsi_user_orders
+    :return:
+    orders, opaque cursor of the next page (None for the last page)
+    """
+    validate_year_month(year_month)
+    gsi_partkey = keys_structure.user_orders_archived_gsi_pk.format(company_id=company_id, user_id=user_id)
+    start_key = utils_data.decode_cursor(cursor)
+    if start_key and (start_key.get('gsi_user_orders_partkey') != gsi_partkey or
+                      not str(start_key.get('date_created', '')).startswith(year_month)):
+        raise exceptions.InvalidCursor(f'Page cursor does not belong to archived orders of {year_month}')
+    db_records, last_key = utils_db.query_items_paginated(
+        key_condition_expression=Key('gsi_user_orders_partkey').eq(gsi_partkey) &
+        Key('date_created').begins_with(year_month),
+        filter_expression=Attr('restaurant_id').eq(restaurant_id) if restaurant_id else None,
+        index_name='gsi_user_orders',
+        limit=limit or os.environ.get('DEFAULT_PAGE_SIZE', 30),
+        start_key=start_key,
+        scan_index_forward=False,
+        projection=projection
+    )
+    return db_records, utils_data.encode_cursor(last_key)
+
+
+@utils_app.log_start_finish
+@utils_auth.authenticate
+@utils_app.request_exception_handler
+def get_archived_orders(request, year_month):
+    auth_result = request.auth_result
+    company_id, user_id, user_role = auth_result['company_id'], auth_result['user_id'], auth_result['role']
+    qp = request.query_params or {}
+    restaurant_id, cursor, limit = qp.get('restaurant_id'), qp.get('start_key'), qp.get('page_size')
+    fields = Order.parse_fields(request)
+    if user_role == 'user':
+        db_records, new_last_key = get_archived_user_db_orders_paginated(
+            company_id, user_id, year_month, limit, cursor, restaurant_id=restaurant_id,
+            projection=Order.get_projection(fields)
+        )
+    elif user_role == 'restaurant_manager':
+        if not restaurant_id:
+            raise exceptions.MissingRestaurantId('restaurant_id must be provided in query parameters')
+        if restaurant_id not in auth_result['permissions']['restaurants'].keys():
+            raise exceptions.AccessDenied("Access Denied error")
+        db_records, new_last_key = get_archived_db_orders_paginated(company_id, year_month, limit, cursor,
+                                                                    restaurant_id=restaurant_id,
+                                                                    projection=Order.get_projection(fields))
+    else:
+        raise exceptions.AccessDenied(f"You don't have permissions to access this resource")
+    return orders_response(db_records, new_last_key, fields)
+
+
+@utils_app.log_start_finish
+@utils_auth.authenticate
+@utils_app.request_exception_handler
+def get_restaurant_archived_orders(request, restaurant_id, year_month):
+    auth_result = request.auth_result
+    if auth_result['role'] != 'admin':
+        raise exceptions.AccessDenied(f"You don't have permissions to access this resource")
+    qp = request.query_params or {}
+    fields = Order.parse_fields(request)
+    db_records, new_last_key = get_archived_db_orders_paginated(
+        auth_result['company_id'], year_month, qp.get('page_size'), qp.get('start_key'), restaurant_id=restaurant_id,
+        projection=Order.get_projection(fields)
+    )
+    return orders_response(db_records, new_last_key, fields)
+
+
+@utils_app.log_start_finish
+@utils_auth.authenticate
+@utils_app.request_exception_handler
+def get_user_archived_orders(request, user_id, year_month):
+    auth_result = request.auth_result
+    if auth_result['role'] != 'admin':
+        raise exceptions.AccessDenied(f"You don't have permissions to access this resource")
+    qp = request.query_params or {}
+    fields = Order.parse_fields(request)
+    db_records, new_last_key = get_archived_user_db_orders_paginated(
+        auth_result['company_id'], user_id, year_month, qp.get('page_size'), qp.get('start_key'),
+        restaurant_id=qp.get('restaurant_id'), projection=Order.get_projection(fields)
     )
+    return orders_response(db_records, new_last_key, fields)
 
 
 @utils_app.log_start_finish
 def db_trigger_order_record(record_old: dict, record_new: dict, event_id: str, event_name: str):
     logger.info(f'db_trigger_order_record ::: {record_new=}, {record_old=}, {event_id=}, {event_name=}')
-    if event_name.lower() == 'insert':
+    if event_name.lower() == 'insert' and record_new.get('migrated_from'):
+        logger.info(f"db_trigger_order_record ::: order moved from {record_new['migrated_from']}, no notification")
+    elif event_name.lower() == 'insert':
         logger.info(f'db_trigger_order_record ::: insert')
         company_id = record_new.get('company_id')
         settings_record: Dict = get_company_settings_record(company_id)
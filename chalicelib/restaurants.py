@@ -1,6 +1,6 @@
 from datetime import datetime
 from decimal import Decimal
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Iterator
 from uuid import uuid4
 
 from boto3.dynamodb.conditions import Attr, Key
@@ -8,6 +8,7 @@ from chalice import Response
 
 from chalicelib.base_class_entity import EntityBase
 from chalicelib.constants import keys_structure
+from chalicelib.constants.constants import ORDER_SHARDS_DEFAULT, ORDER_SHARDS_MAX
 from chalicelib.constants.status_codes import http200
 from chalicelib.constants.substitute_keys import from_db
 from chalicelib.utils import auth as utils_auth, data as utils_data, db as utils_db, app as utils_app, exceptions
@@ -21,7 +22,8 @@ class Restaurant(EntityBase):
     required_immutable_fields_validation = {
         'id_': lambda x: isinstance(x, str),
         'created_by': lambda x: isinstance(x, str),
-        "date_created": lambda x: isinstance(x, str)
+        "date_created": lambda x: isinstance(x, str),
+        'order_shards': lambda x: isinstance(x, int) and 1 <= x <= ORDER_SHARDS_MAX
     }
 
     required_mutable_fields_validation = {
@@ -38,6 +40,11 @@ class Restaurant(EntityBase):
         "archived": lambda x: isinstance(x, bool)
     }
 
+    read_policy = utils_db.EVENTUAL_READ
+
+    list_fields = ('id', 'title', 'address', 'description', 'cuisine', 'opening_time', 'closing_time', 'settings',
+                   'status', 'date_created', 'date_updated', 'archived')
+
     def __init__(self, company_id, id_, **kwargs):
         EntityBase.__init__(self, company_id, id_)
 
@@ -59,6 +66,8 @@ class Restaurant(EntityBase):
         self.date_created: str = kwargs.get('date_created') or datetime.now().isoformat(timespec="seconds")
         self.date_updated: str = kwargs.get('date_updated') or datetime.now().isoformat(timespec="seconds")
         self.archived: bool = kwargs.get('archived', False)
+        order_shards = kwargs.get('order_shards', ORDER_SHARDS_DEFAULT)
+        self.order_shards: int = int(order_shards) if isinstance(order_shards, Decimal) else order_shards
         self.record_type = 'restaurant'
 
     @classmethod
@@ -78,17 +87,22 @@ class Restaurant(EntityBase):
         return c
 
     @staticmethod
+    @utils_app.request_exception_handler
     @utils_app.log_start_finish
     def endpoint_get_all(request) -> Response:
         logger.info("endpoint_get_all ::: started")
         company_id = utils_auth.get_company_id_by_request(request)
+        fields = Restaurant.parse_fields(request)
         filter_expression = Attr('archived').eq(False)
-        restaurant_db_records: List[Dict] = utils_db.query_items_paged(
+        restaurant_db_records: Iterator[Dict] = utils_db.iter_query_items(
             Key('partkey').eq(keys_structure.restaurants_pk.format(company_id=company_id)),
-            filter_expression=filter_expression
+            filter_expression=filter_expression,
+            projection=Restaurant.get_projection(fields)
         )
-        restaurants: List[Dict] = [Restaurant(**record)._to_ui() for record in restaurant_db_records]
-        logger.info(f"endpoint_get_restaurants ::: returning restaurants={[rest['id'] for rest in restaurants]}")
+        restaurants: List[Dict] = [Restaurant.select_fields(Restaurant(**record)._to_ui(), fields)
+                                   for record in restaurant_db_records]
+        logger.debug(lambda: f"endpoint_get_restaurants ::: "
+                             f"returning restaurants={[rest['id'] for rest in restaurants]}")
         return Response(status_code=http200, body=restaurants)
 
     @utils_app.request_exception_handler
@@ -136,7 +150,8 @@ class Restaurant(EntityBase):
             "date_updated": self.date_updated,
             'created_by': self.created_by,
             'updated_by': self.updated_by,
-            "archived": self.archived
+            "archived": self.archived,
+            'order_shards': self.order_shards
         }
 
     def _validate_mandatory_fields(self):
@@ -153,6 +168,8 @@ class Restaurant(EntityBase):
 
     def _to_ui(self):
         item = self._to_dict()
+        # storage detail of the orders partitions, not a part of the restaurant API
+        item.pop('order_shards', None)
         item['settings']['category_sequence'] = {
             int(key): value for key, value in item.get('settings', {}).get('category_sequence', {}).items()
         }
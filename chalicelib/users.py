@@ -1,16 +1,15 @@
-import os
 import secrets
 import uuid
-from typing import Tuple, List, Dict
+from typing import Tuple, List, Dict, Iterator
 
 from boto3.dynamodb.conditions import Key, Attr
 from chalice import Response
-from pycognito import Cognito
 
 from chalicelib.base_class_entity import EntityBase
 from chalicelib.constants import keys_structure
 from chalicelib.constants.status_codes import http200
-from chalicelib.utils import auth as utils_auth, app as utils_app, data as utils_data, db as utils_db
+from chalicelib.utils import auth as utils_auth, app as utils_app, data as utils_data, db as utils_db, \
+    cognito as utils_cognito
 from chalicelib.utils.logger import logger
 
 
@@ -98,7 +97,7 @@ class User(EntityBase):
     @utils_auth.authenticate
     def endpoint_get_managers(self, request) -> Response:
         logger.info("endpoint_get_list_of_managers ::: started")
-        manager_db_records: list = utils_db.query_items_paged(
+        manager_db_records: Iterator[Dict] = utils_db.iter_query_items(
             Key('partkey').eq(self.pk.format(company_id=request.auth_result['company_id'])),
             filter_expression=Attr('role').eq('restaurant_manager')
         )
@@ -108,8 +107,7 @@ class User(EntityBase):
     @utils_app.request_exception_handler
     @utils_app.log_start_finish
     def endpoint_create_manager(self) -> Response:
-        cognito = Cognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'],
-                          user_pool_region=os.environ['DEFAULT_REGION'])
+        cognito = utils_cognito.get_cognito()
         cognito_resp = cognito.admin_create_user(
             self.email,
             temporary_password=secrets.token_urlsafe(8),
@@ -122,11 +120,11 @@ class User(EntityBase):
     @utils_app.request_exception_handler
     @utils_app.log_start_finish
     def endpoint_delete_manager(self) -> Response:
-        cognito = Cognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'],
-                          user_pool_region=os.environ['DEFAULT_REGION'], username=self.email)
+        cognito = utils_cognito.get_cognito(username=self.email)
         cognito.admin_delete_user()
         partkey, sortkey = self._get_pk_sk()
         utils_db.delete_db_record({"partkey": partkey, "sortkey": sortkey})
+        utils_auth.invalidate_user_permissions(self.company_id, self.id_)
         return Response(status_code=http200, body={'message': 'user was deleted successfully'})
 
     def _get_pk_sk(self) -> Tuple[str, str]:
@@ -3,7 +3,8 @@ from typing import Callable
 
 from chalice import Response
 
-from chalicelib.utils.exceptions import MandatoryFieldsAreNotFilled, OrderNotFound, AccessDenied
+from chalicelib.utils.exceptions import MandatoryFieldsAreNotFilled, OrderNotFound, AccessDenied, VersionConflict, \
+    InvalidCursor, InvalidYearMonth, InvalidFields
 from chalicelib.utils.logger import logger, log_exception
 
 
@@ -38,11 +39,31 @@ def request_exception_handler(func: Callable):
                 error=order_not_found,
                 msg=f'function = {func.__name__} , error = {order_not_found}',
                 status_code=400)
+        except InvalidCursor as invalid_cursor:
+            return error_response(
+                error=invalid_cursor,
+                msg=f'function = {func.__name__} , error = {invalid_cursor}',
+                status_code=400)
+        except InvalidYearMonth as invalid_year_month:
+            return error_response(
+                error=invalid_year_month,
+                msg=f'function = {func.__name__} , error = {invalid_year_month}',
+                status_code=400)
+        except InvalidFields as invalid_fields:
+            return error_response(
+                error=invalid_fields,
+                msg=f'function = {func.__name__} , error = {invalid_fields}',
+                status_code=400)
         except AccessDenied as access_denied:
             return error_response(
                 error=access_denied,
                 msg="You don't have permissions to access this restaurant",
                 status_code=401)
+        except VersionConflict as version_conflict:
+            return error_response(
+                error=version_conflict,
+                msg=f'function = {func.__name__} , error = {version_conflict}',
+                status_code=409)
         except Exception as exception:
             return error_response(
                 error=exception,
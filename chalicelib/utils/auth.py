@@ -1,42 +1,132 @@
+import copy
 import os
 import uuid
 import jwt
 import json
 
+from boto3.dynamodb.conditions import Key
 from chalice import Response
 from chalice.app import Request
 
 # from chalicelib.constants.auth import COGNITO_JWK_URL, COGNITO_IDP_URL
 from chalicelib.constants import status_codes, keys_structure
-from chalicelib.utils import exceptions as utils_exceptions, db as utils_db
+from chalicelib.utils import exceptions as utils_exceptions, db as utils_db, jwt_verifier
 from chalicelib.utils.app import error_response
+from chalicelib.utils.cache import TTLCache
 from chalicelib.utils.logger import log_request, logger, log_exception
 
+# Fallback for hosts which have no companies_hosts record yet
 host_company_id_map = {
     'b10phnjz64.execute-api.eu-central-1.amazonaws.com': 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a',
     'test-domain.com': 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a',
     '127.0.0.1:8000': 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
 }
 
+# host: company_id of hosts resolved by this container, unknown hosts are kept in their own shorter cache.
+# companies_hosts records (main table) are not invalidated, so a new or changed record is seen after
+# UNKNOWN_HOSTS_CACHE_TTL_SECONDS / COMPANY_HOSTS_CACHE_TTL_SECONDS at the latest
+company_hosts_cache = TTLCache(max_size=int(os.environ.get('COMPANY_HOSTS_CACHE_MAX_SIZE', 1000)),
+                               ttl_seconds=float(os.environ.get('COMPANY_HOSTS_CACHE_TTL_SECONDS', 60)))
+unknown_hosts_cache = TTLCache(max_size=int(os.environ.get('COMPANY_HOSTS_CACHE_MAX_SIZE', 1000)),
+                               ttl_seconds=float(os.environ.get('UNKNOWN_HOSTS_CACHE_TTL_SECONDS', 30)))
+
 
 def get_company_id_by_host(host: str):
-    try:
-        return host_company_id_map[host]
-    except Exception as error:
-        logger.exception(f'Error occurred while trying to get company id by {host=}, {error=}')
-        raise Exception(f'Unknown domain {host}')
+    company_id = company_hosts_cache.get(host)
+    if company_id is not None:
+        return company_id
+    if unknown_hosts_cache.get(host) is None:
+        try:
+            company_id = utils_db.get_db_item(
+                partkey=keys_structure.company_hosts_pk,
+                sortkey=keys_structure.company_hosts_sk.format(host=host),
+                table=utils_db.get_main_table
+            )['company_id']
+        except utils_exceptions.RecordNotFound:
+            company_id = host_company_id_map.get(host)
+        if company_id is not None:
+            company_hosts_cache.set(host, company_id)
+            return company_id
+        unknown_hosts_cache.set(host, True)
+    logger.error(f'get_company_id_by_host ::: unknown {host=}')
+    raise Exception(f'Unknown domain {host}')
 
 
 def get_company_id_by_request(request: Request):
     return get_company_id_by_host(request.headers['host'])
 
 
+def get_company_ids() -> set:
+    """
+    Companies which have a host, read from the companies_hosts partition (not from the cache),
+    for jobs which go over all companies
+    :return:
+    set of company ids
+    """
+    host_records = utils_db.iter_query_items(Key('partkey').eq(keys_structure.company_hosts_pk),
+                                             projection=['company_id'], table=utils_db.get_main_table)
+    return {record['company_id'] for record in host_records if record.get('company_id')} | \
+        set(host_company_id_map.values())
+
+
+# (company_id, user_id): (role, permissions) of users authenticated by this container.
+# AUTH_CACHE_TTL_SECONDS is the only staleness bound: a container which changes a user drops its own entry,
+# there is no cross-container invalidation, so other warm containers see a role or permissions change
+# after AUTH_CACHE_TTL_SECONDS at the latest
+user_permissions_cache = TTLCache(max_size=int(os.environ.get('AUTH_CACHE_MAX_SIZE', 1000)),
+                                  ttl_seconds=float(os.environ.get('AUTH_CACHE_TTL_SECONDS', 60)))
+
+
+# Roles whose endpoints check permissions_ of the user record
+ROLES_WITH_PERMISSIONS = ('restaurant_manager',)
+
+
 def get_user_role_and_permissions(company_id, user_id):
+    cached = user_permissions_cache.get((company_id, user_id))
+    if cached is not None:
+        role, permissions = cached
+        return role, copy.deepcopy(permissions)
     user_item = utils_db.get_db_item(
         partkey=keys_structure.users_pk.format(company_id=company_id),
         sortkey=keys_structure.users_sk.format(user_id=user_id)
     )
-    return user_item.get('role'), user_item.get('permissions_', {})
+    role, permissions = user_item.get('role'), user_item.get('permissions_', {})
+    user_permissions_cache.set((company_id, user_id), (role, copy.deepcopy(permissions)))
+    return role, permissions
+
+
+def invalidate_user_permissions(company_id, user_id) -> None:
+    logger.info(f"invalidate_user_permissions ::: {company_id=} {user_id=}")
+    user_permissions_cache.invalidate((company_id, user_id))
+
+
+def get_auth_result(request: Request) -> dict:
+    """
+    Identifies the user of the request by the authorization header, see jwt_verifier for the token modes.
+    In jwt mode only restaurant managers need a (cached) db read for their permissions
+    :return:
+    {'user_id', 'role', 'company_id', 'permissions'}
+    """
+    token = request.headers.get('authorization')
+    if not token:
+        raise utils_exceptions.NotAuthorizedException('Error occurred in authorization process')
+    if jwt_verifier.get_token_mode() == jwt_verifier.TOKEN_MODE_JWT:
+        identity = jwt_verifier.get_identity(jwt_verifier.verify_token(token))
+        user_id, role = identity['user_id'], identity['role']
+        company_id = identity['company_id'] or get_company_id_by_request(request)
+        permissions = get_user_role_and_permissions(company_id, user_id)[1] \
+            if role in ROLES_WITH_PERMISSIONS else {}
+    else:
+        company_id = get_company_id_by_request(request)
+        user_id = token
+        role, permissions = get_user_role_and_permissions(company_id, user_id)
+    return {'user_id': user_id, 'role': role, 'company_id': company_id, 'permissions': permissions}
+
+
+def get_auth_error_status_code(error: Exception) -> int:
+    if isinstance(error, (utils_exceptions.AuthorizationException, utils_exceptions.NotAuthorizedException)):
+        return status_codes.http401
+    return 400
 
 
 def authenticate(func):
@@ -47,23 +137,18 @@ def authenticate(func):
     def result_auth(*args, **kwargs):
         try:
             request = args[0]
+            utils_db.reset_identity_map()
             logger.current_request_id = request.lambda_context.aws_request_id.split('-')[4]
             log_request(request)
-            # body, username, groups, user_id, user_email = auth_result_cognito_v1(request)  # Todo: test auth added
-            company_id = 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
-            user_id = request.headers['authorization']
-            user_role, permissions = get_user_role_and_permissions(company_id, user_id)
-            if user_id:
-                setattr(request, 'auth_result', {'user_id': user_id, 'role': user_role,
-                                                 'company_id': company_id, 'permissions': permissions})
-                result = func(*args, **kwargs)
-                logger.info(f'authenticate ::: SUCCESS, func.__name__ {func.__name__}')
-                return result
-            else:
-                raise utils_exceptions.NotAuthorizedException('Error occurred in authorization process')
+            setattr(request, 'auth_result', get_auth_result(request))
+            result = func(*args, **kwargs)
+            logger.info(f'authenticate ::: SUCCESS, func.__name__ {func.__name__}, '
+                        f'identity map hits={utils_db.get_identity_map_hits()}, '
+                        f'auth cache stats={user_permissions_cache.stats}')
+            return result
         except Exception as err:
             logger.error(f"authenticate ::: {str(err)}")
-            return error_response(err, msg=f'{func.__name__}')
+            return error_response(err, msg=f'{func.__name__}', status_code=get_auth_error_status_code(err))
 
     return result_auth
 
@@ -77,67 +162,18 @@ def authenticate_class(func):
         try:
             instance = args[0]
             request = args[1]
+            utils_db.reset_identity_map()
             logger.current_request_id = request.lambda_context.aws_request_id.split('-')[4]
             log_request(request)
-            # body, username, groups, user_id, user_email = auth_result_cognito_v1(request)  # Todo: test auth added
-            company_id = 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
-            user_id = request.headers['authorization']
-            user_role, permissions = get_user_role_and_permissions(company_id, user_id)
-            if user_id:
-                setattr(request, 'auth_result', {'user_id': user_id, 'role': user_role,
-                                                 'company_id': company_id, 'permissions': permissions})
-                setattr(instance, 'user_id', user_id)
-                setattr(instance, 'role', user_role)
-                setattr(instance, 'company_id', company_id)
-                setattr(instance, 'permissions', permissions)
-                return func(*args, **kwargs)
-            else:
-                raise utils_exceptions.NotAuthorizedException('Error occurred in authorization process')
+            auth_result = get_auth_result(request)
+            setattr(request, 'auth_result', auth_result)
+            setattr(instance, 'user_id', auth_result['user_id'])
+            setattr(instance, 'role', auth_result['role'])
+            setattr(instance, 'company_id', auth_result['company_id'])
+            setattr(instance, 'permissions', auth_result['permissions'])
+            return func(*args, **kwargs)
         except Exception as err:
             logger.error(f"authenticate_class ::: {str(err)}")
-            return error_response(err, msg=f'{func.__name__}')
+            return error_response(err, msg=f'{func.__name__}', status_code=get_auth_error_status_code(err))
 
     return result_auth
-
-
-# def auth_result_cognito_v1(current_request):
-#     """ This function shall replace the above function soon """
-#     try:
-#         current_request_id = str(uuid.uuid4()).split('-')[4]
-#         logger.current_request_id = current_request_id
-#         setattr(current_request, 'short_request_id', current_request_id)
-#         logger.debug(f'auth_result_cognito: current_request={current_request.to_dict()}')
-#         token = current_request.headers['authorization']
-#         print(f'auth_result_cognito: current_request={current_request.to_dict()}')
-#         jwks_client = jwt.PyJWKClient(COGNITO_JWK_URL)
-#         signing_key = jwks_client.get_signing_key_from_jwt(token)
-#         decoded_jwt_token = jwt.decode(
-#             token,
-#             signing_key.key,
-#             algorithms=['RS256'],
-#             audience=os.environ['COGNITO_CLIENT_ID_WEB'],
-#             issuer=COGNITO_IDP_URL)
-#         logger.debug(f'auth_result_cognito: token decoded={decoded_jwt_token}')
-#
-#         username = decoded_jwt_token['cognito:username']
-#         groups = decoded_jwt_token.get('cognito:groups', [])
-#         user_id = decoded_jwt_token['sub']
-#         user_email = decoded_jwt_token['email']
-#         logger.debug('username is taken from decoded id_token')
-#         body = {'message': 'auth_result_cognito no errors'}
-#         log_message = {
-#             'auth_result_cognito': {
-#                 'username': username,
-#                 'groups': groups,
-#                 'user_id': user_id,
-#                 'user_email': user_email
-#             }
-#         }
-#         logger.info(json.dumps(log_message))
-#
-#     except Exception as error:
-#         setattr(error, 'LEVEL', 'error')
-#         log_exception(error, 401, f"auth_result_cognito_v1 ::: {error}")
-#         raise utils_exceptions.AuthorizationException(error)
-#     else:
-#         return body, username, groups, user_id, user_email
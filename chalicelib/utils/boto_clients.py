@@ -5,7 +5,9 @@ from botocore.config import Config
 
 main_boto_region = os.environ.get('DEFAULT_REGION', 'eu-central-1')
 aws_config = Config(retries={'max_attempts': 30}, region_name=main_boto_region)
-aws_config_ddb = Config(retries={'max_attempts': 30}, region_name=main_boto_region)
+# throttling is retried by db.exp_db_backoff within the request retry budget, botocore only retries
+# transient errors a couple of times, so its retries don't multiply ours
+aws_config_ddb = Config(retries={'max_attempts': 2}, region_name=main_boto_region)
 
 # Cognito Client.
 cognito_client = boto3.client('cognito-idp', region_name=main_boto_region)
@@ -0,0 +1,67 @@
+"""
+Cognito user handles for the container.
+pycognito.Cognito builds a new boto3 cognito-idp client for every object and downloads the pool JWKS again
+for every token it verifies. get_cognito gives per-call user handles (username, tokens) of the admin pool
+which share one client per region and the rate-limited signing key cache of jwt_verifier.
+"""
+import os
+
+import boto3
+from pycognito import Cognito
+
+from chalicelib.utils import boto_clients, jwt_verifier
+
+# region: cognito-idp client
+_cognito_clients = {}
+
+
+class _SharedClientSession:
+    """
+    Stands in for the boto3 session of pycognito, so Cognito objects take the container's client
+    """
+    def __init__(self, client):
+        self._client = client
+
+    def client(self, service_name, **kwargs):
+        return self._client
+
+
+class SharedCognito(Cognito):
+    def get_key(self, kid):
+        # keys of the admin pool, jwt_verifier reloads them on rotation at most once per refresh interval
+        return jwt_verifier.get_signing_jwk(kid)
+
+
+def get_cognito_client(region: str = None):
+    region = region or os.environ.get('DEFAULT_REGION', boto_clients.main_boto_region)
+    client = _cognito_clients.get(region)
+    if client is None:
+        client = boto_clients.cognito_client if region == boto_clients.main_boto_region \
+            else boto3.client('cognito-idp', region_name=region)
+        _cognito_clients[region] = client
+    return client
+
+
+def get_cognito(**user_kwargs) -> Cognito:
+    """
+    user_kwargs - username, id_token, refresh_token, access_token of pycognito.Cognito
+    :return:
+    Cognito user handle of the admin pool on the shared client
+    """
+    region = os.environ.get('DEFAULT_REGION', boto_clients.main_boto_region)
+    return SharedCognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'],
+                         user_pool_region=region, session=_SharedClientSession(get_cognito_client(region)),
+                         **user_kwargs)
+
+
+def get_writable_trusted_claims(user_pool_client: dict) -> list:
+    """
+    user_pool_client - UserPoolClient of the describe_user_pool_client response
+    :return:
+    jwt_verifier.TRUSTED_CLAIMS which users of the client can change, a client without WriteAttributes
+    may write all attributes
+    """
+    write_attributes = user_pool_client.get('WriteAttributes')
+    if not write_attributes:
+        return list(jwt_verifier.TRUSTED_CLAIMS)
+    return [claim for claim in jwt_verifier.TRUSTED_CLAIMS if claim in write_attributes]
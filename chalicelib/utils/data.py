@@ -1,8 +1,12 @@
+import base64
+import binascii
 import json
 from datetime import datetime, date
 from decimal import Decimal
 from time import struct_time, mktime
 
+from chalicelib.utils.exceptions import InvalidCursor
+
 
 def replace_dict_key(item, orig_key, new_key):
     if orig_key in item:
@@ -84,3 +88,28 @@ def cleanup_dict(item: dict, list_of_values: list):
         elif v not in list_of_values:
             clean[k] = v
     return clean
+
+
+def encode_cursor(last_evaluated_key: dict):
+    """
+    Opaque page cursor for the client: urlsafe base64 of LastEvaluatedKey json, None if there are no more pages
+    """
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key, sort_keys=True).encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    """
+    :return:
+    LastEvaluatedKey dict encoded with encode_cursor, None for empty cursor
+    """
+    if not cursor:
+        return None
+    try:
+        last_evaluated_key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise InvalidCursor(f'Invalid page cursor {cursor}') from error
+    if not isinstance(last_evaluated_key, dict):
+        raise InvalidCursor(f'Invalid page cursor {cursor}')
+    return last_evaluated_key
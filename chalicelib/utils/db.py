@@ -1,20 +1,186 @@
+import copy
 import functools
+import json
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from random import uniform
+from types import SimpleNamespace
+from typing import NamedTuple
 
 import boto3 as boto3
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from botocore.exceptions import ClientError
 
 from chalicelib.constants import substitute_keys
 from chalicelib.utils import data
+from chalicelib.utils import db_types
 from chalicelib.utils import exceptions
-from chalicelib.utils.boto_clients import aws_config_ddb
+from chalicelib.utils import memory_db
+from chalicelib.utils.boto_clients import aws_config_ddb, dynamodb_client
 from chalicelib.utils.logger import logger, log_exception
 
 # For safe db operations
 RETRY_EXCEPTIONS = ('ProvisionedThroughputExceededException', 'ThrottlingException')
-need_return_capacity = ('put_item', 'get_item', 'update_item', 'delete_item')
+need_return_capacity = ('put_item', 'get_item', 'update_item', 'delete_item', 'batch_get_item', 'batch_write_item',
+                        'transact_write_items')
+
+DB_MAX_RETRIES = 15
+BATCH_GET_MAX_KEYS = 100
+BATCH_WRITE_MAX_ITEMS = 25
+TRANSACT_WRITE_MAX_ITEMS = 100
+# Backoff settings (seconds): delay before retry N is random in [0, min(DB_BACKOFF_CAP, DB_BACKOFF_BASE * 2**N)]
+DB_BACKOFF_BASE = float(os.environ.get('DB_BACKOFF_BASE', '0.05'))
+DB_BACKOFF_CAP = float(os.environ.get('DB_BACKOFF_CAP', '2'))
+# Max time (seconds) which one request may spend on db retries before giving up, shared by all db calls of an
+# http request (start_request_retry_budget), db calls outside of a request get it per call
+DB_RETRY_TIME_BUDGET = float(os.environ.get('DB_RETRY_TIME_BUDGET', '5'))
+
+# retries of the current request, updated by parallel_scan worker threads too, so only under the lock
+db_retry_stats = {'retries': 0, 'sleep_time': 0.0}
+_db_retry_stats_lock = threading.Lock()
+# monotonic time after which db calls of the current request are not retried, None - outside of a request
+db_request_retry = {'deadline': None}
+
+PARALLEL_SCAN_SEGMENTS_DEFAULT = 4
+# Seconds a parallel_scan worker waits for a free place in the pages queue before checking the stop flag again
+PARALLEL_SCAN_PUT_TIMEOUT = 0.1
+SCAN_SEGMENT_DONE = 'done'
+
+# DB_BACKEND=memory switches all db operations to the in-process tables of utils/memory_db.py
+MEMORY_DB_BACKEND = 'memory'
+
+
+class ReadPolicy(NamedTuple):
+    """
+    consistent - strongly consistent read (twice the RCU of an eventually consistent one)
+    cacheable - an item already read in this request (identity map) may be returned instead of reading the db
+    """
+    consistent: bool = False
+    cacheable: bool = True
+
+
+# catalogue data (restaurants, menu items) which tolerates replication lag of the eventually consistent read
+EVENTUAL_READ = ReadPolicy(consistent=False, cacheable=True)
+# data which is written and read back within one user flow (carts, pre-orders, orders)
+STRONG_READ = ReadPolicy(consistent=True, cacheable=False)
+
+# Per-container registry: one dynamodb resource (and connection pool) per endpoint url,
+# tables are keyed by (table_name, endpoint_url) and their methods are wrapped only once
+_db_resources = {}
+_db_tables = {}
+_db_clients = {}
+
+# Consumed capacity units of the current request: {operation: {table_name: units}},
+# added to capacity_totals {route: {operation: {table_name: units}}} when the request ends
+capacity_request = {'route': None, 'operations': {}}
+capacity_totals = {}
+
+# Request-scoped identity map: {(table_name, partkey, sortkey): item} of items already read in this invocation,
+# cleared at request start by reset_identity_map, entries are dropped on every write to the key
+_identity_map = {}
+identity_map_stats = {'hits': 0}
+
+
+def get_backoff_delay(attempt: int) -> float:
+    """
+    Capped exponential backoff with full jitter
+    """
+    return uniform(0, min(DB_BACKOFF_CAP, DB_BACKOFF_BASE * 2 ** attempt))
+
+
+def backoff_sleep(delay: float) -> None:
+    time.sleep(delay)
+    with _db_retry_stats_lock:
+        db_retry_stats['retries'] += 1
+        db_retry_stats['sleep_time'] += delay
+
+
+def is_retryable_error(error: Exception) -> bool:
+    return isinstance(error, ClientError) and error.response.get('Error', {}).get('Code') in RETRY_EXCEPTIONS
+
+
+def get_db_retry_stats() -> dict:
+    with _db_retry_stats_lock:
+        return dict(db_retry_stats)
+
+
+def reset_db_retry_stats() -> None:
+    with _db_retry_stats_lock:
+        db_retry_stats['retries'] = 0
+        db_retry_stats['sleep_time'] = 0.0
+
+
+def start_request_retry_budget() -> None:
+    """
+    Resets db_retry_stats and starts the DB_RETRY_TIME_BUDGET which all db calls of the request share
+    """
+    reset_db_retry_stats()
+    db_request_retry['deadline'] = time.monotonic() + DB_RETRY_TIME_BUDGET
+
+
+def finish_request_retry_budget() -> dict:
+    """
+    :return:
+    db retry stats of the request {'retries': number of retries, 'sleep_time': seconds slept before retries}
+    """
+    db_request_retry['deadline'] = None
+    return get_db_retry_stats()
+
+
+def record_consumed_capacity(operation: str, consumed_capacity) -> None:
+    """
+    Adds ConsumedCapacity of a db response (dict or list of dicts for batch operations) to the current request
+    """
+    if not consumed_capacity:
+        return
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    operation_capacity = capacity_request['operations'].setdefault(operation, {})
+    for capacity in consumed_capacity:
+        table_name = capacity.get('TableName')
+        operation_capacity[table_name] = operation_capacity.get(table_name, 0.0) + \
+            float(capacity.get('CapacityUnits', 0))
+
+
+def start_capacity_accounting(route: str) -> None:
+    capacity_request['route'] = route
+    capacity_request['operations'] = {}
 
-_DB = None
+
+def finish_capacity_accounting() -> dict:
+    """
+    Logs consumed capacity of the request as one json line and adds it to capacity_totals
+    :return:
+    consumed capacity of the request {'route': route, 'capacity_units': total, 'operations': {...}}
+    """
+    route, operations = capacity_request['route'], capacity_request['operations']
+    route_totals = capacity_totals.setdefault(route, {})
+    for operation, tables in operations.items():
+        operation_totals = route_totals.setdefault(operation, {})
+        for table_name, units in tables.items():
+            operation_totals[table_name] = operation_totals.get(table_name, 0.0) + units
+
+    summary = {
+        'route': route,
+        'capacity_units': sum(units for tables in operations.values() for units in tables.values()),
+        'operations': operations
+    }
+    logger.info(json.dumps({'db_consumed_capacity': summary}))
+    start_capacity_accounting(None)
+    return summary
+
+
+def get_capacity_totals() -> dict:
+    return {route: {operation: dict(tables) for operation, tables in operations.items()}
+            for route, operations in capacity_totals.items()}
+
+
+def reset_capacity_totals() -> None:
+    capacity_totals.clear()
+    start_capacity_accounting(None)
 
 
 def exp_db_backoff(func):
@@ -25,140 +191,510 @@ def exp_db_backoff(func):
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        logger.debug(f'{func.__name__}:: args={args}, kwargs={kwargs}')
-        max_retries = 15
-        timeout_seed = uniform(0.1, 0.99)
+        logger.debug(lambda: f'{func.__name__}:: args={args}, kwargs={kwargs}')
+        if func.__name__ not in need_return_capacity:
+            raise RuntimeError("This decorator only for DynamoDB methods")
+        kwargs.update({'ReturnConsumedCapacity': 'TOTAL'})
+        deadline = db_request_retry['deadline'] or time.monotonic() + DB_RETRY_TIME_BUDGET
 
-        for retries in range(max_retries):
+        for retries in range(DB_MAX_RETRIES):
             try:
-                if func.__name__ in need_return_capacity:
-                    kwargs.update({'ReturnConsumedCapacity': 'TOTAL'})
-                else:
-                    raise RuntimeError("This decorator only for DynamoDB methods")
                 result = func(*args, **kwargs)
                 logger.info(f'{func.__name__}:: SUCCESS')
+                record_consumed_capacity(func.__name__, result.get('ConsumedCapacity'))
 
                 return result
 
             except Exception as e:
-                log_exception(e, msg=f'Got exception while trying to {func.__name__}: ')
-                raise
+                if not is_retryable_error(e):
+                    log_exception(e, msg=f'Got exception while trying to {func.__name__}: ')
+                    raise
+                delay = get_backoff_delay(retries)
+                if time.monotonic() + delay > deadline:
+                    log_exception(e, msg=f'{func.__name__}:: retry time budget {DB_RETRY_TIME_BUDGET}s exceeded: ')
+                    raise exceptions.NumberOfRetriesExceeded(
+                        f"Retry time budget={DB_RETRY_TIME_BUDGET}s of DB retries has exceeded"
+                    ) from e
+                logger.warning(f'{func.__name__}:: throttled, retry #{retries + 1} in {delay:.3f}s')
+                backoff_sleep(delay)
 
         raise exceptions.NumberOfRetriesExceeded(
-            f"MaxNumber={max_retries} of DB retries has exceeded"
+            f"MaxNumber={DB_MAX_RETRIES} of DB retries has exceeded"
         )
 
     return wrapper
 
 
-def get_table(gl_table: boto3.session.Session.resource, table_name: str) -> boto3.session.Session.resource:
-    if gl_table is None:
-        if os.environ.get('ENDPOINT_URL'):
-            gl_table = boto3.resource('dynamodb', endpoint_url=os.environ.get('ENDPOINT_URL')).Table(table_name)
-        else:
-            gl_table = boto3.resource('dynamodb', config=aws_config_ddb).Table(table_name)
+def get_db_location():
+    """
+    :return:
+    key of the current db in the registry: MEMORY_DB_BACKEND for the in-memory backend, else ENDPOINT_URL
+    """
+    if os.environ.get('DB_BACKEND') == MEMORY_DB_BACKEND:
+        return MEMORY_DB_BACKEND
+    return os.environ.get('ENDPOINT_URL')
 
-        gl_table.put_item = exp_db_backoff(gl_table.put_item)
-        gl_table.get_item = exp_db_backoff(gl_table.get_item)
-        gl_table.update_item = exp_db_backoff(gl_table.update_item)
-        gl_table.delete_item = exp_db_backoff(gl_table.delete_item)
 
-    return gl_table
+def create_db_resource(db_location):
+    """
+    :return:
+    new dynamodb resource (not registered and not wrapped with retries) for the db location of get_db_location
+    """
+    endpoint_url = os.environ.get('ENDPOINT_URL')
+    if db_location == MEMORY_DB_BACKEND:
+        return memory_db.MemoryResource()
+    elif endpoint_url:
+        return boto3.resource('dynamodb', endpoint_url=endpoint_url)
+    return boto3.resource('dynamodb', config=aws_config_ddb)
+
+
+def get_db_resource():
+    db_location = get_db_location()
+    if db_location not in _db_resources:
+        resource = create_db_resource(db_location)
+
+        resource.batch_get_item = exp_db_backoff(resource.batch_get_item)
+        resource.batch_write_item = exp_db_backoff(resource.batch_write_item)
+        resource.meta.client.transact_write_items = exp_db_backoff(resource.meta.client.transact_write_items)
+
+        _db_resources[db_location] = resource
+    return _db_resources[db_location]
+
+
+def get_table(table_name: str) -> boto3.session.Session.resource:
+    table_key = (table_name, get_db_location())
+    if table_key not in _db_tables:
+        table = get_db_resource().Table(table_name)
+
+        table.put_item = exp_db_backoff(table.put_item)
+        table.get_item = exp_db_backoff(table.get_item)
+        table.update_item = exp_db_backoff(table.update_item)
+        table.delete_item = exp_db_backoff(table.delete_item)
+
+        _db_tables[table_key] = table
+
+    return _db_tables[table_key]
+
+
+def reset_db_registry() -> None:
+    """
+    Test hook: drops cached resources, tables and clients,
+    next get_table call creates them again using current environment
+    """
+    _db_resources.clear()
+    _db_tables.clear()
+    _db_clients.clear()
+
+
+def use_db_fast_path() -> bool:
+    """
+    DB_FAST_PATH=true sends get_db_item, put_db_record and query_items_paginated through the low-level client
+    with the db_types converter instead of the Table resource (TypeSerializer/TypeDeserializer).
+    The memory backend has no low-level client, so it always uses the Table resource
+    """
+    return os.environ.get('DB_FAST_PATH', '').lower() in ('1', 'true') and get_db_location() != MEMORY_DB_BACKEND
+
+
+def get_db_client():
+    """
+    :return:
+    low-level dynamodb client without the Table resource transformations, the shared boto_clients.dynamodb_client
+    for AWS and a client of ENDPOINT_URL for a local db
+    """
+    db_location = get_db_location()
+    if db_location not in _db_clients:
+        endpoint_url = os.environ.get('ENDPOINT_URL')
+        client = boto3.client('dynamodb', endpoint_url=endpoint_url) if endpoint_url else dynamodb_client
+        _db_clients[db_location] = SimpleNamespace(
+            get_item=exp_db_backoff(client.get_item),
+            put_item=exp_db_backoff(client.put_item),
+            query=client.query
+        )
+    return _db_clients[db_location]
+
+
+def build_fast_path_expressions(expressions: dict, names: dict = None, key_condition: str = None) -> dict:
+    """
+    Turns boto3 condition objects of {'KeyConditionExpression': ..., 'FilterExpression': ...} into expression
+    strings with ExpressionAttributeNames and serialized ExpressionAttributeValues, as the Table resource does
+    :return:
+    request params
+    """
+    builder = ConditionExpressionBuilder()
+    params = {}
+    attr_names = dict(names or {})
+    attr_values = {}
+    for param_name, expression in expressions.items():
+        if expression is None:
+            continue
+        if isinstance(expression, ConditionBase):
+            built = builder.build_expression(expression, is_key_condition=param_name == key_condition)
+            attr_names.update(built.attribute_name_placeholders)
+            attr_values.update(built.attribute_value_placeholders)
+            expression = built.condition_expression
+        params[param_name] = expression
+    if attr_names:
+        params['ExpressionAttributeNames'] = attr_names
+    if attr_values:
+        params['ExpressionAttributeValues'] = db_types.serialize_item(attr_values)
+    return params
+
+
+def reset_identity_map() -> None:
+    """
+    Should be called at the start of every request,
+    so items read by a previous invocation of a warm container are never returned
+    """
+    _identity_map.clear()
+    identity_map_stats['hits'] = 0
+
+
+def get_identity_map_hits() -> int:
+    return identity_map_stats['hits']
+
+
+def _identity_key(table_name: str, key: dict) -> tuple:
+    return table_name, key['partkey'], key['sortkey']
+
+
+def _forget_item(table_name: str, key: dict) -> None:
+    _identity_map.pop(_identity_key(table_name, key), None)
 
 
 def get_customers_table():
-    return get_table(_DB, os.environ.get('CUSTOMERS_TABLE_NAME'))
+    return get_table(os.environ.get('CUSTOMERS_TABLE_NAME'))
 
 
 def get_main_table():
-    return get_table(_DB, os.environ.get('MAIN_TABLE_NAME'))
+    return get_table(os.environ.get('MAIN_TABLE_NAME'))
+
+
+def is_conditional_check_failed(error: Exception) -> bool:
+    return isinstance(error, ClientError) and \
+        error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def put_db_record(item: dict, table=get_customers_table, condition_expression=None):
+    put_item_dict = {'Item': item}
+    if condition_expression is not None:
+        put_item_dict['ConditionExpression'] = condition_expression
+    db_table = table()
+    _forget_item(db_table.name, item)
+    try:
+        if use_db_fast_path():
+            get_db_client().put_item(
+                TableName=db_table.name,
+                Item=db_types.serialize_item(item),
+                **build_fast_path_expressions({'ConditionExpression': condition_expression})
+            )
+        else:
+            db_table.put_item(**put_item_dict)
+    except ClientError as error:
+        if is_conditional_check_failed(error):
+            raise exceptions.ConditionalCheckFailed(
+                f"put_db_record ::: condition failed for partkey={item.get('partkey')} sortkey={item.get('sortkey')}"
+            ) from error
+        raise
 
 
-def put_db_record(item: dict, table=get_customers_table):
-    table().put_item(Item=item)
+def delete_db_record(key: dict, table=get_customers_table):
+    db_table = table()
+    _forget_item(db_table.name, key)
+    db_table.delete_item(Key=key)
 
 
-def delete_db_record(key: dict, table=get_customers_table):
-    table().delete_item(Key=key)
+class BatchWriter:
+    """
+    Buffers put and delete requests and sends them with BatchWriteItem in chunks of BATCH_WRITE_MAX_ITEMS.
+    UnprocessedItems are re-submitted with backoff, consumed write capacity is summed up in consumed_capacity
+    """
+
+    def __init__(self, table=get_customers_table):
+        self.table_name: str = table().name
+        self.consumed_capacity: float = 0.0
+        self.requests_sent: int = 0
+        # DynamoDB rejects a batch with the same key twice, so requests are keyed by (partkey, sortkey)
+        # and the last request for a key wins
+        self._buffer: dict = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
+        logger.info(f"batch_write ::: {self.table_name=} {self.requests_sent=} {self.consumed_capacity=}")
+
+    def put(self, item: dict) -> None:
+        self._add_request((item['partkey'], item['sortkey']), {'PutRequest': {'Item': item}})
+
+    def delete(self, key: dict) -> None:
+        self._add_request((key['partkey'], key['sortkey']), {'DeleteRequest': {'Key': key}})
+
+    def _add_request(self, key: tuple, request: dict) -> None:
+        _forget_item(self.table_name, {'partkey': key[0], 'sortkey': key[1]})
+        self._buffer.pop(key, None)
+        self._buffer[key] = request
+        if len(self._buffer) >= BATCH_WRITE_MAX_ITEMS:
+            self.flush()
+
+    def flush(self) -> None:
+        requests, self._buffer = list(self._buffer.values()), {}
+        for i in range(0, len(requests), BATCH_WRITE_MAX_ITEMS):
+            self._write_chunk(requests[i:i + BATCH_WRITE_MAX_ITEMS])
+
+    def _write_chunk(self, requests: list) -> None:
+        request_items = {self.table_name: requests}
+        for attempt in range(DB_MAX_RETRIES):
+            resp = get_db_resource().batch_write_item(RequestItems=request_items)
+            for capacity in resp.get('ConsumedCapacity', []):
+                self.consumed_capacity += float(capacity.get('CapacityUnits', 0))
+            request_items = resp.get('UnprocessedItems')
+            if not request_items:
+                self.requests_sent += len(requests)
+                return
+            logger.warning(f"batch_write ::: {len(request_items[self.table_name])} unprocessed items, "
+                           f"retry #{attempt + 1}")
+            backoff_sleep(get_backoff_delay(attempt))
+
+        raise exceptions.NumberOfRetriesExceeded(
+            f"MaxNumber={DB_MAX_RETRIES} of DB retries has exceeded for unprocessed items"
+        )
+
+
+def batch_write(table=get_customers_table) -> BatchWriter:
+    """
+    Usage:
+        with batch_write() as writer:
+            writer.put(item)
+            writer.delete({'partkey': pk, 'sortkey': sk})
+    """
+    return BatchWriter(table)
+
+
+def transact_write(transact_items: list, table=get_customers_table):
+    """
+    Applies all write actions in one TransactWriteItems call - either all of them succeed or none.
+    transact_items - TransactItems with plain python values, e.g.
+        [{'Put': {'Item': item}}, {'Delete': {'Key': key, 'ConditionExpression': 'attribute_exists(partkey)'}}]
+    TableName of the table is set for actions where it is not set.
+    Conditions must be expression strings, boto3 condition objects are not supported inside TransactItems
+    """
+    if len(transact_items) > TRANSACT_WRITE_MAX_ITEMS:
+        raise ValueError(f'transact_write ::: max {TRANSACT_WRITE_MAX_ITEMS} items in one transaction')
+    table_name = table().name
+    for transact_item in transact_items:
+        for action_params in transact_item.values():
+            action_params.setdefault('TableName', table_name)
+            key = action_params.get('Key') or action_params.get('Item')
+            if key:
+                _forget_item(action_params['TableName'], key)
+
+    try:
+        return get_db_resource().meta.client.transact_write_items(TransactItems=transact_items)
+    except ClientError as error:
+        cancellation_reasons = error.response.get('CancellationReasons', [])
+        if any(reason.get('Code') == 'ConditionalCheckFailed' for reason in cancellation_reasons):
+            raise exceptions.ConditionalCheckFailed(
+                f"transact_write ::: condition failed, reasons={cancellation_reasons}"
+            ) from error
+        raise
 
 
 def update_db_record(key: dict, update_body: dict, allowed_attrs_to_update: list,
-                     allowed_attrs_to_delete: list, table=get_customers_table):
+                     allowed_attrs_to_delete: list, table=get_customers_table,
+                     increment_attrs: list = None, condition_expression=None):
     data.substitute_keys(dict_to_process=update_body, base_keys=substitute_keys.to_db)
-    set_expr, expr_attr_values, remove_expr = generate_update_expression(
+    update_expr, expr_attr_names, expr_attr_values = generate_update_expression(
         update_body=update_body,
         allowed_attrs_to_update=allowed_attrs_to_update,
-        allowed_attrs_to_delete=allowed_attrs_to_delete
+        allowed_attrs_to_delete=allowed_attrs_to_delete,
+        increment_attrs=increment_attrs
     )
-    update_item_dict = {"Key": key, "ReturnValues": "UPDATED_NEW", }
-
-    set_response = None
-    if set_expr:
-        set_item_dict = {
-            **update_item_dict,
-            "UpdateExpression": set_expr,
-            "ExpressionAttributeValues": expr_attr_values
-        }
-        set_response = table().update_item(**set_item_dict)
-
-    remove_response = None
-    if remove_expr:
-        remove_item_dict = {
-            **update_item_dict,
-            "UpdateExpression": remove_expr
-        }
-        remove_response = table().update_item(**remove_item_dict)
-
-    return set_response, remove_response
-
-
-def generate_update_expression(update_body: dict, allowed_attrs_to_update: list, allowed_attrs_to_delete: list):
+    if not update_expr:
+        return None
+
+    update_item_dict = {
+        "Key": key,
+        "ReturnValues": "UPDATED_NEW",
+        "UpdateExpression": update_expr,
+        "ExpressionAttributeNames": expr_attr_names
+    }
+    if expr_attr_values:
+        update_item_dict["ExpressionAttributeValues"] = expr_attr_values
+    if condition_expression is not None:
+        update_item_dict["ConditionExpression"] = condition_expression
+
+    db_table = table()
+    _forget_item(db_table.name, key)
+    try:
+        return db_table.update_item(**update_item_dict)
+    except ClientError as error:
+        if is_conditional_check_failed(error):
+            raise exceptions.ConditionalCheckFailed(
+                f"update_db_record ::: condition failed for partkey={key.get('partkey')} sortkey={key.get('sortkey')}"
+            ) from error
+        raise
+
+
+def generate_update_expression(update_body: dict, allowed_attrs_to_update: list, allowed_attrs_to_delete: list,
+                               increment_attrs: list = None):
     """
-    Generate expressions to update and delete attributes.
-    if a key of update_body is empty - the attribute is deleted, else - attribute is updated
+    Generate one expression to update and delete attributes.
+    if a key of update_body is empty - the attribute is deleted, else - attribute is updated.
+    Attributes from increment_attrs are atomically incremented by 1 (initialized with 1 if absent).
+    Attribute names are always passed as #placeholders, so DynamoDB reserved words can be used as names
+    :return:
+    update_expression (None if nothing to update), expression_attribute_names, expression_attribute_values
     """
+    expr_attr_names = {}
     expr_attr_values = {}
-    set_expr = 'SET '
-    remove_expr = 'REMOVE '
-    return_value = [None, None, None]
+    set_parts = []
+    remove_parts = []
     for field in allowed_attrs_to_update:
         field_value = update_body.get(field, None)
         if field_value is not None:
+            expr_attr_names[f'#{field}'] = field
             # if field is in update_body but is equal to empty string, list etc. - delete field
             if field_value in ['', [], {}] and field in allowed_attrs_to_delete:
-                remove_expr += f'{field}, '
+                remove_parts.append(f'#{field}')
             else:
                 # if field is in update_body and has a real value - update field
-                expr_attr_values[f':{field}'] = update_body.get(field)
-                set_expr += f'{field}=:{field}, '
+                expr_attr_values[f':{field}'] = field_value
+                set_parts.append(f'#{field}=:{field}')
         else:
             continue
 
-    if set_expr != 'SET ':
-        return_value[0] = set_expr[:-2]
-        return_value[1] = expr_attr_values
+    add_parts = []
+    for field in increment_attrs or []:
+        expr_attr_names[f'#{field}'] = field
+        expr_attr_values[f':{field}_increment'] = 1
+        add_parts.append(f'#{field} :{field}_increment')
 
-    if remove_expr != 'REMOVE ':
-        return_value[2] = remove_expr[:-2]
+    update_expr = []
+    if set_parts:
+        update_expr.append(f"SET {', '.join(set_parts)}")
+    if remove_parts:
+        update_expr.append(f"REMOVE {', '.join(remove_parts)}")
+    if add_parts:
+        update_expr.append(f"ADD {', '.join(add_parts)}")
 
-    return return_value
+    return ' '.join(update_expr) or None, expr_attr_names, expr_attr_values
 
 
-def get_db_item(partkey, sortkey, table=get_customers_table):
-    result = table().get_item(
-        Key={
-            'partkey': partkey,
-            'sortkey': sortkey
-        }
-    )
+def get_read_kwargs(read_policy: ReadPolicy) -> dict:
+    """
+    :return:
+    ConsistentRead request param, eventual read is the DynamoDB default and is not sent
+    """
+    return {'ConsistentRead': True} if read_policy.consistent else {}
+
+
+def get_db_item(partkey, sortkey, table=get_customers_table, read_policy: ReadPolicy = EVENTUAL_READ):
+    """
+    Reads an item by key, with cacheable read_policy an item which was already read in this request
+    is returned from the identity map
+    :return:
+    copy of the item, so callers can change it without affecting the identity map
+    """
+    db_table = table()
+    identity_key = (db_table.name, partkey, sortkey)
+    if read_policy.cacheable and identity_key in _identity_map:
+        identity_map_stats['hits'] += 1
+        logger.debug(f"get_db_item ::: identity map hit partkey={partkey} sortkey={sortkey}")
+        return copy.deepcopy(_identity_map[identity_key])
+
+    read_kwargs = get_read_kwargs(read_policy)
+    if use_db_fast_path():
+        result = get_db_client().get_item(
+            TableName=db_table.name,
+            Key={'partkey': {'S': partkey}, 'sortkey': {'S': sortkey}},
+            **read_kwargs
+        )
+        if 'Item' in result:
+            result['Item'] = db_types.deserialize_item(result['Item'])
+    else:
+        result = db_table.get_item(
+            Key={
+                'partkey': partkey,
+                'sortkey': sortkey
+            },
+            **read_kwargs
+        )
 
     if result.__contains__('Item'):
-        return result['Item']
+        _identity_map[identity_key] = result['Item']
+        return copy.deepcopy(result['Item'])
     else:
         logger.error(f"get_db_item ::: record partkey={partkey} sortkey={sortkey} not found")
         raise exceptions.RecordNotFound(f'record partkey={partkey} sortkey={sortkey} not found')
 
 
+def get_projection_params(projection: list = None, expr_attr_names: dict = None) -> dict:
+    """
+    partkey and sortkey are always projected, so keys and page cursors can be built from projected items
+    :return:
+    ProjectionExpression and ExpressionAttributeNames (merged with expr_attr_names) for the list of attributes,
+    empty dict without projection
+    """
+    if not projection:
+        return {}
+    attrs = list(dict.fromkeys(['partkey', 'sortkey', *projection]))
+    attr_names = {f'#attr{i}': attr for i, attr in enumerate(attrs)}
+    return {
+        'ProjectionExpression': ', '.join(attr_names.keys()),
+        'ExpressionAttributeNames': {**(expr_attr_names or {}), **attr_names}
+    }
+
+
+def batch_get_items(keys: list, projection: list = None, table=get_customers_table,
+                    read_policy: ReadPolicy = EVENTUAL_READ) -> dict:
+    """
+    Reads items by (partkey, sortkey) pairs with BatchGetItem.
+    Keys are requested in chunks of BATCH_GET_MAX_KEYS, UnprocessedKeys are re-requested with backoff.
+    Items already read in this request are taken from the identity map, full items (without projection)
+    are added to it
+    :return:
+    dict {(partkey, sortkey): item}, keys of not existing items are absent
+    """
+    table_name = table().name
+    result = {}
+    unique_keys = []
+    for pk, sk in dict.fromkeys(keys):
+        if read_policy.cacheable and (table_name, pk, sk) in _identity_map:
+            identity_map_stats['hits'] += 1
+            result[(pk, sk)] = copy.deepcopy(_identity_map[(table_name, pk, sk)])
+        else:
+            unique_keys.append((pk, sk))
+    projection_params = get_projection_params(projection)
+
+    for i in range(0, len(unique_keys), BATCH_GET_MAX_KEYS):
+        request_items = {
+            table_name: {
+                'Keys': [{'partkey': pk, 'sortkey': sk} for pk, sk in unique_keys[i:i + BATCH_GET_MAX_KEYS]],
+                **get_read_kwargs(read_policy),
+                **projection_params
+            }
+        }
+        for attempt in range(DB_MAX_RETRIES):
+            resp = get_db_resource().batch_get_item(RequestItems=request_items)
+            for item in resp.get('Responses', {}).get(table_name, []):
+                if not projection:
+                    _identity_map[(table_name, item['partkey'], item['sortkey'])] = copy.deepcopy(item)
+                result[(item['partkey'], item['sortkey'])] = item
+            request_items = resp.get('UnprocessedKeys')
+            if not request_items:
+                break
+            logger.warning(f"batch_get_items ::: {len(request_items[table_name]['Keys'])} unprocessed keys, "
+                           f"retry #{attempt + 1}")
+            backoff_sleep(get_backoff_delay(attempt))
+        else:
+            raise exceptions.NumberOfRetriesExceeded(
+                f"MaxNumber={DB_MAX_RETRIES} of DB retries has exceeded for unprocessed keys"
+            )
+
+    return result
+
+
 def query_items_paginated(
         key_condition_expression,
         filter_expression=None,
@@ -167,9 +703,16 @@ def query_items_paginated(
         index_name=None,
         expr_attr_names=None,
         limit=None,
-        start_key=None
+        start_key=None,
+        scan_index_forward=True,
+        projection: list = None,
+        read_policy: ReadPolicy = EVENTUAL_READ
 ):
-    kwargs = {'KeyConditionExpression': key_condition_expression}
+    """
+    projection - list of attributes to read instead of whole items, replaces projection_expression
+    read_policy - consistent read is not supported by global secondary indexes, eventual read is used for them
+    """
+    kwargs = {'KeyConditionExpression': key_condition_expression, 'ReturnConsumedCapacity': 'TOTAL'}
     if filter_expression:
         kwargs.update({'FilterExpression': filter_expression})
 
@@ -179,6 +722,9 @@ def query_items_paginated(
     if expr_attr_names:
         kwargs.update({'ExpressionAttributeNames': expr_attr_names})
 
+    if projection:
+        kwargs.update(get_projection_params(projection, expr_attr_names))
+
     if limit:
         kwargs.update({'Limit': int(limit)})
 
@@ -188,35 +734,198 @@ def query_items_paginated(
     if start_key:
         kwargs.update({'ExclusiveStartKey': start_key})
 
+    if not scan_index_forward:
+        kwargs.update({'ScanIndexForward': False})
+
+    if read_policy.consistent and index_name:
+        logger.warning(f"query_items_paginated ::: consistent read is not supported by {index_name=}, "
+                       f"using eventual read")
+    elif read_policy.consistent:
+        kwargs.update(get_read_kwargs(read_policy))
+
+    if use_db_fast_path():
+        return query_items_paginated_fast_path(kwargs, table)
+
     resp = table().query(**kwargs)
+    record_consumed_capacity('query', resp.get('ConsumedCapacity'))
     return resp['Items'], resp.get('LastEvaluatedKey')
 
 
+def query_items_paginated_fast_path(kwargs: dict, table=get_customers_table):
+    """
+    query_items_paginated through the low-level client, kwargs are the Table.query params
+    """
+    expressions = {param: kwargs.pop(param) for param in ['KeyConditionExpression', 'FilterExpression']
+                   if param in kwargs}
+    kwargs.update(build_fast_path_expressions(expressions, names=kwargs.pop('ExpressionAttributeNames', None),
+                                              key_condition='KeyConditionExpression'))
+    if 'ExclusiveStartKey' in kwargs:
+        kwargs['ExclusiveStartKey'] = db_types.serialize_item(kwargs['ExclusiveStartKey'])
+
+    resp = get_db_client().query(TableName=table().name, **kwargs)
+    record_consumed_capacity('query', resp.get('ConsumedCapacity'))
+    last_key = resp.get('LastEvaluatedKey')
+    return [db_types.deserialize_item(item) for item in resp['Items']], \
+        db_types.deserialize_item(last_key) if last_key else None
+
+
+def iter_query_items(key_condition_expression, filter_expression=None, projection_expression=None,
+                     table=get_customers_table, index_name=None, expr_attr_names=None, max_items=None, page_size=None,
+                     start_key=None, projection: list = None, read_policy: ReadPolicy = EVENTUAL_READ):
+    """ Generator which yields queried items page by page, the next page is requested
+        only after the previous one is consumed. Stops after max_items items
+        or as soon as the caller stops iterating"""
+    if max_items is not None and max_items <= 0:
+        return
+    yielded = 0
+    while True:
+        items, start_key = query_items_paginated(
+            key_condition_expression,
+            filter_expression=filter_expression,
+            projection_expression=projection_expression,
+            table=table,
+            index_name=index_name,
+            expr_attr_names=expr_attr_names,
+            limit=page_size,
+            start_key=start_key,
+            projection=projection,
+            read_policy=read_policy
+        )
+        for item in items:
+            yield item
+            yielded += 1
+            if max_items is not None and yielded >= max_items:
+                return
+        if start_key is None:
+            return
+
+
+def iter_scan_items(filter_expression=None, projection_expression=None, table=get_customers_table,
+                    expr_attr_names=None, page_size=None):
+    """ Generator which scans the whole table page by page, the next page is requested
+        only after the previous one is consumed"""
+    kwargs = {'ReturnConsumedCapacity': 'TOTAL'}
+    if filter_expression:
+        kwargs.update({'FilterExpression': filter_expression})
+    if projection_expression:
+        kwargs.update({'ProjectionExpression': projection_expression})
+    if expr_attr_names:
+        kwargs.update({'ExpressionAttributeNames': expr_attr_names})
+    if page_size:
+        kwargs.update({'Limit': int(page_size)})
+
+    while True:
+        resp = table().scan(**kwargs)
+        record_consumed_capacity('scan', resp.get('ConsumedCapacity'))
+        yield from resp['Items']
+        if not resp.get('LastEvaluatedKey'):
+            return
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def _scan_segment(db_location, table_name: str, scan_kwargs: dict, start_key, pages: queue.Queue,
+                  stop: threading.Event) -> None:
+    """
+    parallel_scan worker: scans one segment page by page and puts (segment, items, last_key, capacity, error)
+    to pages. Boto3 resources are not thread safe, so every worker creates its own one
+    """
+    segment = scan_kwargs['Segment']
+
+    def put_page(page) -> bool:
+        while not stop.is_set():
+            try:
+                pages.put(page, timeout=PARALLEL_SCAN_PUT_TIMEOUT)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        table = create_db_resource(db_location).Table(table_name)
+        kwargs = dict(scan_kwargs)
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+        attempt = 0
+        while not stop.is_set():
+            try:
+                resp = table.scan(**kwargs)
+            except Exception as e:
+                if not is_retryable_error(e) or attempt >= DB_MAX_RETRIES:
+                    raise
+                logger.warning(f'_scan_segment ::: {segment=} throttled, retry #{attempt + 1}')
+                backoff_sleep(get_backoff_delay(attempt))
+                attempt += 1
+                continue
+            attempt = 0
+            last_key = resp.get('LastEvaluatedKey')
+            if not put_page((segment, resp['Items'], last_key, resp.get('ConsumedCapacity'), None)) or not last_key:
+                return
+            kwargs['ExclusiveStartKey'] = last_key
+    except Exception as e:
+        put_page((segment, [], None, None, e))
+
+
+def parallel_scan(segments: int = PARALLEL_SCAN_SEGMENTS_DEFAULT, filter_expression=None,
+                  projection_expression=None, table=get_customers_table, expr_attr_names=None, page_size=None,
+                  checkpoints: dict = None, on_checkpoint=None):
+    """
+    Generator which scans the whole table with `segments` parallel Segment/TotalSegments scans in a thread pool.
+    Items of different segments are interleaved, the order inside a segment is kept.
+
+    checkpoints {segment: LastEvaluatedKey of the last consumed page or SCAN_SEGMENT_DONE} is updated after
+    all items of a page are consumed and passed to on_checkpoint(checkpoints). Passing saved checkpoints
+    (with the same number of segments) resumes the scan, items of a partly consumed page are returned again
+    """
+    scan_kwargs = {'ReturnConsumedCapacity': 'TOTAL', 'TotalSegments': segments}
+    if filter_expression:
+        scan_kwargs.update({'FilterExpression': filter_expression})
+    if projection_expression:
+        scan_kwargs.update({'ProjectionExpression': projection_expression})
+    if expr_attr_names:
+        scan_kwargs.update({'ExpressionAttributeNames': expr_attr_names})
+    if page_size:
+        scan_kwargs.update({'Limit': int(page_size)})
+
+    checkpoints = {} if checkpoints is None else checkpoints
+    pending = [segment for segment in range(segments) if checkpoints.get(segment) != SCAN_SEGMENT_DONE]
+    if not pending:
+        return
+    db_location, table_name = get_db_location(), table().name
+    # a few pages per segment are buffered, workers wait while the consumer is behind
+    pages = queue.Queue(maxsize=2 * len(pending))
+    stop = threading.Event()
+    logger.info(f"parallel_scan ::: started {table_name=} {segments=} {pending=}")
+    with ThreadPoolExecutor(max_workers=len(pending)) as executor:
+        for segment in pending:
+            executor.submit(_scan_segment, db_location, table_name, {**scan_kwargs, 'Segment': segment},
+                            checkpoints.get(segment), pages, stop)
+        try:
+            running = set(pending)
+            while running:
+                segment, items, last_key, consumed_capacity, error = pages.get()
+                if error is not None:
+                    raise error
+                record_consumed_capacity('scan', consumed_capacity)
+                yield from items
+                checkpoints[segment] = last_key or SCAN_SEGMENT_DONE
+                if not last_key:
+                    running.discard(segment)
+                if on_checkpoint:
+                    on_checkpoint(checkpoints)
+        finally:
+            stop.set()
+    logger.info(f"parallel_scan ::: finished {table_name=} {segments=}")
+
+
 def query_items_paged(key_condition_expression, filter_expression=None, projection_expression=None,
                       table=get_customers_table, index_name=None, expr_attr_names=None):
     """ This method shall be used whenever you think the query will
         return more than 1mb of data at once"""
-    all_items = []
-    items, last_evaluated_key = query_items_paginated(
+    return list(iter_query_items(
         key_condition_expression,
         filter_expression=filter_expression,
         projection_expression=projection_expression,
         table=table,
         index_name=index_name,
         expr_attr_names=expr_attr_names
-    )
-    all_items.extend(items)
-
-    while last_evaluated_key is not None:
-        items, last_evaluated_key = query_items_paginated(
-            key_condition_expression,
-            filter_expression=filter_expression,
-            projection_expression=projection_expression,
-            table=table,
-            index_name=index_name,
-            expr_attr_names=expr_attr_names,
-            start_key=last_evaluated_key
-        )
-        all_items.extend(items)
-
-    return all_items
+    ))
@@ -0,0 +1,56 @@
+"""
+Lightweight converter between python values and DynamoDB wire format (AttributeValue dicts) for the attribute
+shapes of our records: str, Decimal/int, bool, None and nested dicts/lists.
+Other types (sets, binary) and invalid numbers are delegated to boto3 TypeSerializer/TypeDeserializer,
+so the result is always the same as of the boto3 Table resource
+"""
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+_type_serializer = TypeSerializer()
+_type_deserializer = TypeDeserializer()
+
+
+def serialize(value) -> dict:
+    value_type = type(value)
+    if value_type is str:
+        return {'S': value}
+    if value_type is dict:
+        return {'M': {key: serialize(item) for key, item in value.items()}}
+    if value_type is Decimal and value.is_finite():
+        return {'N': str(value)}
+    if value_type is bool:
+        return {'BOOL': value}
+    if value_type is list:
+        return {'L': [serialize(item) for item in value]}
+    if value_type is int:
+        return {'N': str(value)}
+    if value is None:
+        return {'NULL': True}
+    return _type_serializer.serialize(value)
+
+
+def deserialize(attribute_value: dict):
+    (dynamodb_type, value), = attribute_value.items()
+    if dynamodb_type == 'S':
+        return value
+    if dynamodb_type == 'M':
+        return {key: deserialize(item) for key, item in value.items()}
+    if dynamodb_type == 'N':
+        return Decimal(value)
+    if dynamodb_type == 'BOOL':
+        return value
+    if dynamodb_type == 'L':
+        return [deserialize(item) for item in value]
+    if dynamodb_type == 'NULL':
+        return None
+    return _type_deserializer.deserialize(attribute_value)
+
+
+def serialize_item(item: dict) -> dict:
+    return {key: serialize(value) for key, value in item.items()}
+
+
+def deserialize_item(item: dict) -> dict:
+    return {key: deserialize(value) for key, value in item.items()}
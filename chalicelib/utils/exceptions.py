@@ -1,6 +1,7 @@
 __all__ = ["NotAuthorizedException", "AccessDenied", "RecordNotFound", "NumberOfRetriesExceeded",
            "MandatoryFieldsAreNotFilled", "WrongDeliveryAddress", "SomeItemsAreNotAvailable", "OrderNotFound",
-           "AuthorizationException", "MissingRestaurantId"]
+           "AuthorizationException", "MissingRestaurantId", "ConditionalCheckFailed", "VersionConflict",
+           "InvalidCursor", "InvalidYearMonth", "InvalidFields"]
 
 
 class NotAuthorizedException(Exception):
@@ -21,6 +22,14 @@ class RecordNotFound(Exception):
     pass
 
 
+class ConditionalCheckFailed(Exception):
+    pass
+
+
+class VersionConflict(Exception):
+    pass
+
+
 # DB Performance Exception
 class NumberOfRetriesExceeded(Exception):
     pass
@@ -31,6 +40,18 @@ class ValidationException(Exception):
     pass
 
 
+class InvalidCursor(Exception):
+    pass
+
+
+class InvalidYearMonth(Exception):
+    pass
+
+
+class InvalidFields(Exception):
+    pass
+
+
 class AuthorizationException(Exception):
     pass
 
@@ -0,0 +1,157 @@
+"""
+In-process verification of Cognito RS256 id tokens.
+The JWKS of the user pool is loaded once per container (from COGNITO_JWKS_FILE if it is set, e.g. in tests,
+otherwise from the pool's well-known url) and signing keys are kept by kid. A token signed with an unknown kid
+reloads the JWKS, at most once per JWKS_REFRESH_MIN_INTERVAL_SECONDS, so rotated keys are picked up
+without letting forged kids hammer Cognito. A failed load is retried after JWKS_RETRY_AFTER_ERROR_SECONDS.
+
+AUTH_TOKEN_MODE selects how the authorization header is read:
+    user_id - legacy mode, the header is the user id (default, used by tests and local development)
+    jwt     - the header is a Cognito id token, user id, role and company are taken from its claims
+
+Role and company are trusted without a db lookup, which is only safe while the app client can't write
+TRUSTED_CLAIMS (WriteAttributes of the client, see tools/check_cognito_client.py, run by build-dev.sh),
+otherwise a user could make themselves admin with UpdateUserAttributes.
+"""
+import json
+import os
+import time
+import urllib.request
+
+import jwt
+
+from chalicelib.utils import exceptions as utils_exceptions
+from chalicelib.utils.boto_clients import main_boto_region
+from chalicelib.utils.logger import logger
+
+TOKEN_MODE_USER_ID = 'user_id'
+TOKEN_MODE_JWT = 'jwt'
+TOKEN_ALGORITHM = 'RS256'
+JWKS_REFRESH_MIN_INTERVAL_SECONDS = 300
+# a failed load is retried soon, so one timeout on a cold container doesn't deny all tokens for minutes
+JWKS_RETRY_AFTER_ERROR_SECONDS = 5
+JWKS_FETCH_TIMEOUT_SECONDS = 3
+REQUIRED_CLAIMS = ['exp', 'iat', 'iss', 'aud', 'sub', 'token_use']
+# attributes which only the backend (admin API) may set, the app client must not have them in WriteAttributes
+TRUSTED_CLAIMS = ('custom:role', 'custom:company_id')
+
+# kid: PyJWK of the signing keys of the user pool and kid: JWK dict of the same keys (for pycognito),
+# both filled by refresh_signing_keys
+_signing_keys = {}
+_signing_jwks = {}
+# monotonic time before which an unknown kid doesn't reload the JWKS, None - the JWKS was never loaded
+_jwks_refresh = {'not_before': None}
+
+
+def get_token_mode() -> str:
+    return os.environ.get('AUTH_TOKEN_MODE', TOKEN_MODE_USER_ID)
+
+
+def get_issuer() -> str:
+    return os.environ.get('COGNITO_ISSUER') or \
+        f"https://cognito-idp.{os.environ.get('DEFAULT_REGION', main_boto_region)}.amazonaws.com/" \
+        f"{os.environ['COGNITO_ADMIN_POOL_ID']}"
+
+
+def get_jwks_url() -> str:
+    return f'{get_issuer()}/.well-known/jwks.json'
+
+
+def load_jwks() -> dict:
+    jwks_file = os.environ.get('COGNITO_JWKS_FILE')
+    if jwks_file:
+        with open(jwks_file) as jwks:
+            return json.load(jwks)
+    with urllib.request.urlopen(get_jwks_url(), timeout=JWKS_FETCH_TIMEOUT_SECONDS) as response:
+        return json.loads(response.read())
+
+
+def refresh_signing_keys() -> None:
+    try:
+        signing_jwks = {jwk['kid']: jwk for jwk in load_jwks().get('keys', [])
+                        if jwk.get('kid') and jwk.get('use', 'sig') == 'sig'}
+        signing_keys = {kid: jwt.PyJWK(jwk, algorithm=TOKEN_ALGORITHM) for kid, jwk in signing_jwks.items()}
+    except Exception as error:
+        _jwks_refresh['not_before'] = time.monotonic() + JWKS_RETRY_AFTER_ERROR_SECONDS
+        logger.error(f"refresh_signing_keys ::: JWKS is not loaded, {error=}")
+        raise utils_exceptions.AuthorizationException('Signing keys are not available')
+    _jwks_refresh['not_before'] = time.monotonic() + JWKS_REFRESH_MIN_INTERVAL_SECONDS
+    _signing_keys.clear()
+    _signing_keys.update(signing_keys)
+    _signing_jwks.clear()
+    _signing_jwks.update(signing_jwks)
+    logger.info(f"refresh_signing_keys ::: loaded kids={list(signing_keys)}")
+
+
+def reset_signing_keys() -> None:
+    _signing_keys.clear()
+    _signing_jwks.clear()
+    _jwks_refresh['not_before'] = None
+
+
+def _get_cached_key(kid: str, keys: dict):
+    signing_key = keys.get(kid)
+    if signing_key is None:
+        not_before = _jwks_refresh['not_before']
+        if not_before is None or time.monotonic() >= not_before:
+            refresh_signing_keys()
+            signing_key = keys.get(kid)
+    if signing_key is None:
+        raise utils_exceptions.AuthorizationException(f'Unknown signing key {kid=}')
+    return signing_key
+
+
+def get_signing_key(kid: str) -> jwt.PyJWK:
+    return _get_cached_key(kid, _signing_keys)
+
+
+def get_signing_jwk(kid: str) -> dict:
+    """
+    :return:
+    JWK dict of the signing key, the form pycognito (python-jose) verifies tokens with
+    """
+    return _get_cached_key(kid, _signing_jwks)
+
+
+def verify_token(token: str) -> dict:
+    """
+    Checks signature, expiration, issuer, audience (COGNITO_ADMIN_POOL_CLIENT_ID) and token_use of the id token
+    :return:
+    claims of the token
+    """
+    if token.startswith('Bearer '):
+        token = token[len('Bearer '):]
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.PyJWTError as error:
+        raise utils_exceptions.AuthorizationException(f'Invalid token: {error}')
+    if header.get('alg') != TOKEN_ALGORITHM:
+        raise utils_exceptions.AuthorizationException(f"Token algorithm {header.get('alg')} is not allowed")
+
+    signing_key = get_signing_key(header.get('kid'))
+    audience = os.environ.get('COGNITO_ADMIN_POOL_CLIENT_ID')
+    if not audience:
+        logger.error("verify_token ::: COGNITO_ADMIN_POOL_CLIENT_ID is not set, tokens can't be verified")
+        raise utils_exceptions.AuthorizationException('Token audience is not configured')
+    try:
+        claims = jwt.decode(token, signing_key.key, algorithms=[TOKEN_ALGORITHM], audience=audience,
+                            issuer=get_issuer(), options={'require': REQUIRED_CLAIMS})
+    except jwt.PyJWTError as error:
+        raise utils_exceptions.AuthorizationException(f'Invalid token: {error}')
+    if claims.get('token_use') != 'id':
+        raise utils_exceptions.AuthorizationException(f"Token use {claims.get('token_use')} is not allowed")
+    return claims
+
+
+def get_identity(claims: dict) -> dict:
+    """
+    Role and company come from TRUSTED_CLAIMS, they are not checked against the db, so the app client
+    must not be able to write them
+    :return:
+    {'user_id', 'role', 'company_id'} of the token, company_id is None for users without custom:company_id
+    """
+    return {
+        'user_id': claims['sub'],
+        'role': claims.get('custom:role'),
+        'company_id': claims.get('custom:company_id')
+    }
@@ -1,40 +1,53 @@
 import json
 import os
-from copy import deepcopy
 from datetime import datetime, date
 from decimal import Decimal
-from logging import setLoggerClass, Logger, NOTSET, getLogger, StreamHandler, Formatter
+from logging import setLoggerClass, Logger, NOTSET, DEBUG, INFO, WARNING, ERROR, getLogger, StreamHandler, \
+    Formatter
 from time import mktime, struct_time
 
 from chalice.app import Request
 
 
 class CustomLogger(Logger):
+    """
+    Prefixes messages with the current request id. msg may be a callable without arguments which returns
+    the message - it is called only if the level is enabled, so expensive messages cost nothing when filtered:
+        logger.debug(lambda: f"items={[item['id'] for item in items]}")
+    """
 
     def __init__(self, name, level=NOTSET):
         self.current_request_id = None
         super(CustomLogger, self).__init__(name, level)
 
     def __change_msg(self, msg):
+        if callable(msg):
+            msg = msg()
         return f'[{self.current_request_id}] : {msg}'
 
     def debug(self, msg, *args, **kwargs):
-        super(CustomLogger, self).debug(self.__change_msg(msg), *args, **kwargs)
+        if self.isEnabledFor(DEBUG):
+            super(CustomLogger, self).debug(self.__change_msg(msg), *args, **kwargs)
 
     def info(self, msg, *args, **kwargs):
-        super(CustomLogger, self).info(self.__change_msg(msg), *args, **kwargs)
+        if self.isEnabledFor(INFO):
+            super(CustomLogger, self).info(self.__change_msg(msg), *args, **kwargs)
 
     def warning(self, msg, *args, **kwargs):
-        super(CustomLogger, self).warning(self.__change_msg(msg), *args, **kwargs)
+        if self.isEnabledFor(WARNING):
+            super(CustomLogger, self).warning(self.__change_msg(msg), *args, **kwargs)
 
     def error(self, msg, *args, **kwargs):
-        super(CustomLogger, self).error(self.__change_msg(msg), *args, **kwargs)
+        if self.isEnabledFor(ERROR):
+            super(CustomLogger, self).error(self.__change_msg(msg), *args, **kwargs)
 
     def log(self, level, msg, *args, **kwargs):
-        super(CustomLogger, self).log(level, self.__change_msg(msg), *args, **kwargs)
+        if self.isEnabledFor(level):
+            super(CustomLogger, self).log(level, self.__change_msg(msg), *args, **kwargs)
 
     def exception(self, msg, *args, exc_info=True, **kwargs):
-        super(CustomLogger, self).exception(self.__change_msg(msg), *args, exc_info=exc_info, **kwargs)
+        if self.isEnabledFor(ERROR):
+            super(CustomLogger, self).exception(self.__change_msg(msg), *args, exc_info=exc_info, **kwargs)
 
 
 def conf_logger(level):
@@ -51,15 +64,18 @@ def conf_logger(level):
     return logger_
 
 
-logger = conf_logger(os.environ.get('LOG_LEVEL', 'DEBUG').upper())
+logger = conf_logger(os.environ.get('LOG_LEVEL', 'INFO').upper())
 
 
 def log_request(request: Request):
-    request_dict = deepcopy(request.to_dict())
-    request_dict['headers'].pop('authorization')
+    if not logger.isEnabledFor(INFO):
+        return
+    # to_dict makes a new headers dict, the rest of the request is not changed, so no copy is needed
+    request_dict = request.to_dict()
+    request_dict['headers'].pop('authorization', None)
     logger.info(f"Request: {json.dumps(request_dict)}")
     if request_dict['headers'].get('content-type', '') == 'application/json':
-        logger.debug(f"Request body: {str(request.raw_body)}")
+        logger.debug(lambda: f"Request body: {str(request.raw_body)}")
 
 
 class CustomJSONEncoder(json.JSONEncoder):
@@ -86,7 +102,7 @@ def log_exception(error: Exception, status_code: int = 400, msg: str = "", *args
     }
     level = getattr(error, 'LEVEL', 'exception')
     log_level = 'exception' if level not in allowed_log_levels.keys() else level
-    allowed_log_levels[log_level](msg=json.dumps({
+    allowed_log_levels[log_level](msg=lambda: json.dumps({
         'error': str(error),
         'exception': error.__class__.__name__,
         'message': str(msg),
@@ -98,4 +114,4 @@ def log_exception(error: Exception, status_code: int = 400, msg: str = "", *args
 
 
 def log_message(*args):
-    logger.debug(msg=f'{", ".join([str(i) for i in args])}')
+    logger.debug(msg=lambda: ", ".join([str(i) for i in args]))
@@ -0,0 +1,691 @@
+"""
+Pure python in-memory implementation of the DynamoDB resource and table methods used by utils/db.py.
+It is selected with DB_BACKEND=memory and lets the whole test suite and load benchmarks run in-process,
+without dynamodb-local in docker.
+
+Supported:
+    get_item, put_item, update_item, delete_item, query, scan (with Segment/TotalSegments),
+    batch_get_item, batch_write_item, transact_write_items
+    key, filter and condition expressions as boto3 condition objects (Key/Attr) or expression strings,
+    SET/REMOVE/ADD/DELETE update expressions, ProjectionExpression, Limit/ExclusiveStartKey/LastEvaluatedKey,
+    ScanIndexForward and the indexes from INDEXES
+Items are normalized with the boto3 type (de)serializer on write, so numbers are read back as Decimal
+and floats are rejected just like with the real DynamoDB
+"""
+import copy
+import re
+from types import SimpleNamespace
+from zlib import crc32
+
+from boto3.dynamodb import conditions
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+from chalicelib.utils.logger import logger
+
+PARTITION_KEY = 'partkey'
+SORT_KEY = 'sortkey'
+# index name: (partition key attribute, sort key attribute), same for all tables as in docker.sh
+INDEXES = {
+    'date_created-index': (PARTITION_KEY, 'date_created'),
+    'gsi_user_orders': ('gsi_user_orders_partkey', 'date_created'),
+}
+# Approximate capacity units, item size is not taken into account
+READ_CAPACITY_UNITS = 0.5
+WRITE_CAPACITY_UNITS = 1.0
+
+# {table_name: {partkey: {sortkey: item}}}
+_tables = {}
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def reset_memory_db() -> None:
+    """
+    Test hook: drops all tables with their items
+    """
+    _tables.clear()
+
+
+def load_items(table_name: str, items: list) -> None:
+    """
+    Puts items to the table without conditions, used to seed test data
+    """
+    table = MemoryTable(table_name)
+    for item in items:
+        table.put_item(Item=item)
+
+
+def client_error(code: str, message: str, operation_name: str, **response) -> ClientError:
+    return ClientError({'Error': {'Code': code, 'Message': message}, **response}, operation_name)
+
+
+def _normalize(value):
+    return _deserializer.deserialize(_serializer.serialize(value))
+
+
+def _normalize_item(item: dict) -> dict:
+    return {attr: _normalize(value) for attr, value in item.items()}
+
+
+def _get_partitions(table_name: str) -> dict:
+    return _tables.setdefault(table_name, {})
+
+
+def _get_key(item: dict, operation_name: str) -> tuple:
+    try:
+        partkey, sortkey = item[PARTITION_KEY], item[SORT_KEY]
+    except KeyError:
+        raise client_error('ValidationException', 'The provided key element does not match the schema',
+                           operation_name)
+    if not isinstance(partkey, str) or not isinstance(sortkey, str) or not partkey or not sortkey:
+        raise client_error('ValidationException', 'Key attributes must be not empty strings', operation_name)
+    return partkey, sortkey
+
+
+def _capacity(table_name: str, units: float) -> dict:
+    return {'TableName': table_name, 'CapacityUnits': units}
+
+
+# Attribute paths
+
+def _split_path(path: str) -> list:
+    parts = []
+    for name in path.split('.'):
+        match = re.fullmatch(r'([^\[\]]+)((?:\[\d+\])*)', name)
+        if not match:
+            raise ValueError(f'Invalid attribute path {path}')
+        parts.append(match.group(1))
+        parts.extend(int(index) for index in re.findall(r'\[(\d+)\]', match.group(2)))
+    return parts
+
+
+_MISSING = object()
+
+
+def _get_path(item: dict, path: str):
+    value = item
+    for part in _split_path(path):
+        try:
+            value = value[part]
+        except (KeyError, IndexError, TypeError):
+            return _MISSING
+    return value
+
+
+def _set_path(item: dict, path: str, value) -> None:
+    parts = _split_path(path)
+    container = item
+    for part in parts[:-1]:
+        container = container[part]
+    if isinstance(parts[-1], int) and parts[-1] >= len(container):
+        container.append(value)
+    else:
+        container[parts[-1]] = value
+
+
+def _remove_path(item: dict, path: str) -> None:
+    parts = _split_path(path)
+    container = item
+    try:
+        for part in parts[:-1]:
+            container = container[part]
+        del container[parts[-1]]
+    except (KeyError, IndexError, TypeError):
+        pass
+
+
+def _resolve_names(path: str, names: dict) -> str:
+    return '.'.join(
+        re.sub(r'#\w+', lambda match: names[match.group(0)], part) for part in path.split('.')
+    )
+
+
+def _project(item: dict, projection_expression: str, names: dict) -> dict:
+    if not projection_expression:
+        return copy.deepcopy(item)
+    result = {}
+    for path in projection_expression.split(','):
+        path = _resolve_names(path.strip(), names)
+        value = _get_path(item, path)
+        if value is not _MISSING:
+            top_attr = _split_path(path)[0]
+            result[top_attr] = copy.deepcopy(item[top_attr])
+    return result
+
+
+# Condition expressions
+
+def _operand(value, item: dict):
+    if isinstance(value, conditions.Size):
+        attr_value = _operand(value.get_expression()['values'][0], item)
+        return len(attr_value) if attr_value is not _MISSING else _MISSING
+    if isinstance(value, conditions.AttributeBase):
+        return _get_path(item, value.name)
+    return value
+
+
+def _type_of(value) -> str:
+    return next(iter(_serializer.serialize(value)))
+
+
+def _compare(operator: str, left, right) -> bool:
+    if left is _MISSING or right is _MISSING:
+        return operator == '<>' and left is not right
+    try:
+        return {
+            '=': lambda: left == right,
+            '<>': lambda: left != right,
+            '<': lambda: left < right,
+            '<=': lambda: left <= right,
+            '>': lambda: left > right,
+            '>=': lambda: left >= right,
+        }[operator]()
+    except TypeError:
+        return False
+
+
+def evaluate_condition(condition, item: dict) -> bool:
+    """
+    Evaluates boto3 condition object (Key/Attr conditions combined with &, |, ~) against the item
+    """
+    expression = condition.get_expression()
+    operator, values = expression['operator'], expression['values']
+    if operator == 'AND':
+        return evaluate_condition(values[0], item) and evaluate_condition(values[1], item)
+    if operator == 'OR':
+        return evaluate_condition(values[0], item) or evaluate_condition(values[1], item)
+    if operator == 'NOT':
+        return not evaluate_condition(values[0], item)
+    if operator == 'attribute_exists':
+        return _operand(values[0], item) is not _MISSING
+    if operator == 'attribute_not_exists':
+        return _operand(values[0], item) is _MISSING
+
+    operands = [_operand(value, item) for value in values]
+    if operator == 'IN':
+        return operands[0] is not _MISSING and any(_compare('=', operands[0], value) for value in operands[1])
+    if operator == 'BETWEEN':
+        return _compare('>=', operands[0], operands[1]) and _compare('<=', operands[0], operands[2])
+    if operator == 'begins_with':
+        return isinstance(operands[0], str) and isinstance(operands[1], str) and operands[0].startswith(operands[1])
+    if operator == 'contains':
+        try:
+            return operands[0] is not _MISSING and operands[1] in operands[0]
+        except TypeError:
+            return False
+    if operator == 'attribute_type':
+        return operands[0] is not _MISSING and _type_of(operands[0]) == operands[1]
+    return _compare(operator, operands[0], operands[1])
+
+
+class _ExpressionParser:
+    """
+    Parses condition expression strings, e.g. 'attribute_exists(partkey) AND #status = :status',
+    into boto3 condition objects
+    """
+    token_re = re.compile(r'\s*(<>|<=|>=|[=<>(),]|[#:]?[\w.\[\]-]+)')
+    functions = {
+        'attribute_exists': conditions.AttributeExists,
+        'attribute_not_exists': conditions.AttributeNotExists,
+        'attribute_type': conditions.AttributeType,
+        'begins_with': conditions.BeginsWith,
+        'contains': conditions.Contains,
+    }
+    comparators = {
+        '=': conditions.Equals, '<>': conditions.NotEquals, '<': conditions.LessThan,
+        '<=': conditions.LessThanEquals, '>': conditions.GreaterThan, '>=': conditions.GreaterThanEquals
+    }
+
+    def __init__(self, expression: str, names: dict, values: dict):
+        self.tokens = self.token_re.findall(expression)
+        if ''.join(self.tokens).replace(' ', '') != expression.replace(' ', ''):
+            raise ValueError(f'Invalid expression {expression}')
+        self.position = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    def parse(self):
+        condition = self._or()
+        if self._peek() is not None:
+            raise ValueError(f'Unexpected token {self._peek()}')
+        return condition
+
+    def _peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def _next(self, expected: str = None) -> str:
+        token = self._peek()
+        if token is None or (expected is not None and token.upper() != expected):
+            raise ValueError(f'Expected {expected}, got {token}')
+        self.position += 1
+        return token
+
+    def _is_keyword(self, keyword: str) -> bool:
+        token = self._peek()
+        return token is not None and token.upper() == keyword
+
+    def _or(self):
+        condition = self._and()
+        while self._is_keyword('OR'):
+            self._next()
+            condition = conditions.Or(condition, self._and())
+        return condition
+
+    def _and(self):
+        condition = self._not()
+        while self._is_keyword('AND'):
+            self._next()
+            condition = conditions.And(condition, self._not())
+        return condition
+
+    def _not(self):
+        if self._is_keyword('NOT'):
+            self._next()
+            return conditions.Not(self._not())
+        return self._primary()
+
+    def _primary(self):
+        if self._peek() == '(':
+            self._next()
+            condition = self._or()
+            self._next(')')
+            return condition
+        if self._peek() in self.functions:
+            function = self.functions[self._next()]
+            self._next('(')
+            args = [self._operand()]
+            while self._peek() == ',':
+                self._next()
+                args.append(self._operand())
+            self._next(')')
+            return function(*args)
+
+        left = self._operand()
+        if self._is_keyword('BETWEEN'):
+            self._next()
+            low = self._operand()
+            self._next('AND')
+            return conditions.Between(left, low, self._operand())
+        if self._is_keyword('IN'):
+            self._next()
+            self._next('(')
+            options = [self._operand()]
+            while self._peek() == ',':
+                self._next()
+                options.append(self._operand())
+            self._next(')')
+            return conditions.In(left, options)
+        comparator = self.comparators[self._next()]
+        return comparator(left, self._operand())
+
+    def _operand(self):
+        token = self._next()
+        if token.startswith(':'):
+            return _normalize(self.values[token])
+        if token == 'size':
+            self._next('(')
+            size = conditions.Size(conditions.Attr(_resolve_names(self._next(), self.names)))
+            self._next(')')
+            return size
+        return conditions.Attr(_resolve_names(token, self.names))
+
+
+def parse_condition(expression, names: dict = None, values: dict = None):
+    """
+    :return:
+    boto3 condition object for expression string, condition objects are returned as is
+    """
+    if expression is None or isinstance(expression, conditions.ConditionBase):
+        return expression
+    return _ExpressionParser(expression, names, values).parse()
+
+
+# Update expressions
+
+def _split_top_level(expression: str) -> list:
+    parts, depth, current = [], 0, ''
+    for char in expression:
+        if char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def _update_operand(operand: str, item: dict, names: dict, values: dict):
+    operand = operand.strip()
+    function = re.fullmatch(r'(if_not_exists|list_append)\s*\((.*)\)', operand)
+    if function:
+        first, second = _split_top_level(function.group(2))
+        if function.group(1) == 'if_not_exists':
+            existing = _get_path(item, _resolve_names(first, names))
+            return existing if existing is not _MISSING else _update_operand(second, item, names, values)
+        return _update_operand(first, item, names, values) + _update_operand(second, item, names, values)
+    arithmetic = re.fullmatch(r'(.+?)\s*([+-])\s*(.+)', operand)
+    if arithmetic:
+        left = _update_operand(arithmetic.group(1), item, names, values)
+        right = _update_operand(arithmetic.group(3), item, names, values)
+        return left + right if arithmetic.group(2) == '+' else left - right
+    if operand.startswith(':'):
+        return copy.deepcopy(_normalize(values[operand]))
+    value = _get_path(item, _resolve_names(operand, names))
+    if value is _MISSING:
+        raise ValueError(f'The provided expression refers to an attribute that does not exist in the item: {operand}')
+    return copy.deepcopy(value)
+
+
+def apply_update_expression(item: dict, update_expression: str, names: dict = None, values: dict = None) -> list:
+    """
+    Applies SET/REMOVE/ADD/DELETE actions to the item in place
+    :return:
+    list of updated top level attribute names
+    """
+    names, values = names or {}, values or {}
+    original = copy.deepcopy(item)
+    updated = []
+    clauses = re.split(r'\b(SET|REMOVE|ADD|DELETE)\b', update_expression, flags=re.IGNORECASE)
+    for action, body in zip(clauses[1::2], clauses[2::2]):
+        action = action.upper()
+        for part in _split_top_level(body):
+            if action == 'SET':
+                path, operand = part.split('=', 1)
+                path = _resolve_names(path.strip(), names)
+                _set_path(item, path, _update_operand(operand, original, names, values))
+            elif action == 'REMOVE':
+                path = _resolve_names(part, names)
+                _remove_path(item, path)
+            else:
+                path, operand = part.split(None, 1)
+                path = _resolve_names(path, names)
+                value = _normalize(values[operand.strip()])
+                existing = _get_path(item, path)
+                if action == 'ADD':
+                    if existing is _MISSING:
+                        new_value = value
+                    elif isinstance(existing, set):
+                        new_value = existing | value
+                    else:
+                        new_value = existing + value
+                    _set_path(item, path, new_value)
+                elif existing is not _MISSING:
+                    new_value = existing - value
+                    if new_value:
+                        _set_path(item, path, new_value)
+                    else:
+                        _remove_path(item, path)
+            updated.append(_split_path(path)[0])
+    return list(dict.fromkeys(updated))
+
+
+# Queries
+
+def _find_hash_value(condition, hash_attr: str):
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        for value in expression['values']:
+            hash_value = _find_hash_value(value, hash_attr)
+            if hash_value is not None:
+                return hash_value
+    elif expression['operator'] == '=':
+        attr, value = expression['values']
+        if isinstance(attr, conditions.AttributeBase) and attr.name == hash_attr:
+            return value
+    return None
+
+
+def _paginate(table_name: str, items: list, key_attrs: tuple, filter_expression, limit,
+              projection_expression, names, select, operation_name: str) -> dict:
+    evaluated = 0
+    result_items = []
+    last_evaluated_key = None
+    for item in items:
+        evaluated += 1
+        if filter_expression is None or evaluate_condition(filter_expression, item):
+            result_items.append(item)
+        if limit and evaluated >= limit:
+            last_evaluated_key = {attr: item[attr] for attr in key_attrs if attr in item}
+            break
+
+    resp = {
+        'Count': len(result_items),
+        'ScannedCount': evaluated,
+        'ConsumedCapacity': _capacity(table_name, READ_CAPACITY_UNITS * max(evaluated, 1))
+    }
+    if select != 'COUNT':
+        resp['Items'] = [_project(item, projection_expression, names) for item in result_items]
+    if last_evaluated_key:
+        resp['LastEvaluatedKey'] = last_evaluated_key
+    logger.debug(f"{operation_name} ::: {table_name=} scanned={evaluated} returned={len(result_items)}")
+    return resp
+
+
+class MemoryTable:
+    def __init__(self, name: str, meta=None):
+        self.name = name
+        self.meta = meta or SimpleNamespace(client=MemoryClient())
+
+    @property
+    def _partitions(self) -> dict:
+        return _get_partitions(self.name)
+
+    def _get(self, key: tuple):
+        return self._partitions.get(key[0], {}).get(key[1])
+
+    def _check_condition(self, item, condition_expression, names, values, operation_name: str) -> None:
+        condition = parse_condition(condition_expression, names, values)
+        if condition is not None and not evaluate_condition(condition, item or {}):
+            raise client_error('ConditionalCheckFailedException', 'The conditional request failed', operation_name)
+
+    def get_item(self, Key: dict, ProjectionExpression: str = None, ExpressionAttributeNames: dict = None,
+                 **kwargs) -> dict:
+        item = self._get(_get_key(Key, 'GetItem'))
+        resp = {'ConsumedCapacity': _capacity(self.name, READ_CAPACITY_UNITS)}
+        if item is not None:
+            resp['Item'] = _project(item, ProjectionExpression, ExpressionAttributeNames or {})
+        return resp
+
+    def put_item(self, Item: dict, ConditionExpression=None, ExpressionAttributeNames: dict = None,
+                 ExpressionAttributeValues: dict = None, ReturnValues: str = 'NONE', **kwargs) -> dict:
+        item = _normalize_item(Item)
+        key = _get_key(item, 'PutItem')
+        old_item = self._get(key)
+        self._check_condition(old_item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                              'PutItem')
+        self._partitions.setdefault(key[0], {})[key[1]] = item
+        resp = {'ConsumedCapacity': _capacity(self.name, WRITE_CAPACITY_UNITS)}
+        if ReturnValues == 'ALL_OLD' and old_item is not None:
+            resp['Attributes'] = copy.deepcopy(old_item)
+        return resp
+
+    def update_item(self, Key: dict, UpdateExpression: str, ConditionExpression=None,
+                    ExpressionAttributeNames: dict = None, ExpressionAttributeValues: dict = None,
+                    ReturnValues: str = 'NONE', **kwargs) -> dict:
+        key = _get_key(Key, 'UpdateItem')
+        old_item = self._get(key)
+        self._check_condition(old_item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                              'UpdateItem')
+        item = copy.deepcopy(old_item) if old_item is not None else {PARTITION_KEY: key[0], SORT_KEY: key[1]}
+        try:
+            updated_attrs = apply_update_expression(item, UpdateExpression, ExpressionAttributeNames,
+                                                    ExpressionAttributeValues)
+        except (ValueError, KeyError, TypeError) as error:
+            raise client_error('ValidationException', str(error), 'UpdateItem')
+        if _get_key(item, 'UpdateItem') != key:
+            raise client_error('ValidationException', 'Cannot update attribute partkey or sortkey', 'UpdateItem')
+        self._partitions.setdefault(key[0], {})[key[1]] = item
+
+        resp = {'ConsumedCapacity': _capacity(self.name, WRITE_CAPACITY_UNITS)}
+        if ReturnValues == 'ALL_NEW':
+            resp['Attributes'] = copy.deepcopy(item)
+        elif ReturnValues == 'ALL_OLD' and old_item is not None:
+            resp['Attributes'] = copy.deepcopy(old_item)
+        elif ReturnValues == 'UPDATED_NEW':
+            resp['Attributes'] = {attr: copy.deepcopy(item[attr]) for attr in updated_attrs if attr in item}
+        elif ReturnValues == 'UPDATED_OLD' and old_item is not None:
+            resp['Attributes'] = {attr: copy.deepcopy(old_item[attr]) for attr in updated_attrs if attr in old_item}
+        return resp
+
+    def delete_item(self, Key: dict, ConditionExpression=None, ExpressionAttributeNames: dict = None,
+                    ExpressionAttributeValues: dict = None, ReturnValues: str = 'NONE', **kwargs) -> dict:
+        key = _get_key(Key, 'DeleteItem')
+        old_item = self._get(key)
+        self._check_condition(old_item, ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                              'DeleteItem')
+        if old_item is not None:
+            partition = self._partitions[key[0]]
+            del partition[key[1]]
+            if not partition:
+                del self._partitions[key[0]]
+        resp = {'ConsumedCapacity': _capacity(self.name, WRITE_CAPACITY_UNITS)}
+        if ReturnValues == 'ALL_OLD' and old_item is not None:
+            resp['Attributes'] = old_item
+        return resp
+
+    def query(self, KeyConditionExpression, FilterExpression=None, ProjectionExpression: str = None,
+              ExpressionAttributeNames: dict = None, ExpressionAttributeValues: dict = None, IndexName: str = None,
+              Limit: int = None, ExclusiveStartKey: dict = None, ScanIndexForward: bool = True,
+              Select: str = None, **kwargs) -> dict:
+        names = ExpressionAttributeNames or {}
+        key_condition = parse_condition(KeyConditionExpression, names, ExpressionAttributeValues)
+        filter_expression = parse_condition(FilterExpression, names, ExpressionAttributeValues)
+        if IndexName is not None and IndexName not in INDEXES:
+            raise client_error('ValidationException', f'The table does not have the specified index: {IndexName}',
+                               'Query')
+        hash_attr, range_attr = INDEXES.get(IndexName, (PARTITION_KEY, SORT_KEY))
+        hash_value = _find_hash_value(key_condition, hash_attr)
+        if hash_value is None:
+            raise client_error('ValidationException', f'Query condition missed key schema element: {hash_attr}',
+                               'Query')
+
+        if hash_attr == PARTITION_KEY:
+            candidates = self._partitions.get(hash_value, {}).values()
+        else:
+            candidates = (item for partition in self._partitions.values() for item in partition.values()
+                          if item.get(hash_attr) == hash_value)
+
+        def sort_value(item):
+            return item[range_attr], item[PARTITION_KEY], item[SORT_KEY]
+
+        items = sorted((item for item in candidates if range_attr in item and evaluate_condition(key_condition, item)),
+                       key=sort_value, reverse=not ScanIndexForward)
+        if ExclusiveStartKey:
+            start = (ExclusiveStartKey.get(range_attr), ExclusiveStartKey[PARTITION_KEY], ExclusiveStartKey[SORT_KEY])
+            items = [item for item in items if (sort_value(item) > start if ScanIndexForward
+                                                else sort_value(item) < start)]
+
+        key_attrs = tuple(dict.fromkeys((PARTITION_KEY, SORT_KEY, hash_attr, range_attr)))
+        return _paginate(self.name, items, key_attrs, filter_expression, Limit, ProjectionExpression,
+                         names, Select, 'query')
+
+    def scan(self, FilterExpression=None, ProjectionExpression: str = None, ExpressionAttributeNames: dict = None,
+             ExpressionAttributeValues: dict = None, Limit: int = None, ExclusiveStartKey: dict = None,
+             Segment: int = None, TotalSegments: int = None, Select: str = None, **kwargs) -> dict:
+        names = ExpressionAttributeNames or {}
+        filter_expression = parse_condition(FilterExpression, names, ExpressionAttributeValues)
+
+        def sort_value(item):
+            return crc32(item[PARTITION_KEY].encode()), item[PARTITION_KEY], item[SORT_KEY]
+
+        items = sorted((item for partition in self._partitions.values() for item in partition.values()),
+                       key=sort_value)
+        if TotalSegments:
+            items = [item for item in items if sort_value(item)[0] % TotalSegments == Segment]
+        if ExclusiveStartKey:
+            start = sort_value(ExclusiveStartKey)
+            items = [item for item in items if sort_value(item) > start]
+
+        return _paginate(self.name, items, (PARTITION_KEY, SORT_KEY), filter_expression, Limit,
+                         ProjectionExpression, names, Select, 'scan')
+
+
+class MemoryClient:
+    def transact_write_items(self, TransactItems: list, **kwargs) -> dict:
+        """
+        All conditions are checked before any write, so either all actions are applied or none
+        """
+        actions = []
+        reasons = []
+        for transact_item in TransactItems:
+            (action, params), = transact_item.items()
+            table = MemoryTable(params['TableName'], meta=SimpleNamespace(client=self))
+            key = params.get('Key') or params.get('Item')
+            try:
+                table._check_condition(table._get(_get_key(key, 'TransactWriteItems')),
+                                       params.get('ConditionExpression'), params.get('ExpressionAttributeNames'),
+                                       params.get('ExpressionAttributeValues'), 'TransactWriteItems')
+                reasons.append({'Code': 'None'})
+            except ClientError as error:
+                if error.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                reasons.append({'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'})
+            actions.append((action, table, params))
+
+        if any(reason['Code'] != 'None' for reason in reasons):
+            raise client_error(
+                'TransactionCanceledException',
+                f"Transaction cancelled, please refer cancellation reasons for specific reasons "
+                f"[{', '.join(reason['Code'] for reason in reasons)}]",
+                'TransactWriteItems',
+                CancellationReasons=reasons
+            )
+
+        for action, table, params in actions:
+            params = {param: value for param, value in params.items()
+                      if param not in ('TableName', 'ConditionExpression')}
+            if action == 'Put':
+                table.put_item(**params)
+            elif action == 'Update':
+                table.update_item(**params)
+            elif action == 'Delete':
+                table.delete_item(**params)
+
+        capacity = {}
+        for _, table, _ in actions:
+            capacity[table.name] = capacity.get(table.name, 0) + 2 * WRITE_CAPACITY_UNITS
+        return {'ConsumedCapacity': [_capacity(name, units) for name, units in capacity.items()]}
+
+
+class MemoryResource:
+    def __init__(self):
+        self.meta = SimpleNamespace(client=MemoryClient())
+
+    def Table(self, name: str) -> MemoryTable:
+        return MemoryTable(name, meta=self.meta)
+
+    def batch_get_item(self, RequestItems: dict, **kwargs) -> dict:
+        responses = {}
+        capacity = []
+        for table_name, request in RequestItems.items():
+            table = self.Table(table_name)
+            items = []
+            for key in request['Keys']:
+                resp = table.get_item(Key=key, ProjectionExpression=request.get('ProjectionExpression'),
+                                      ExpressionAttributeNames=request.get('ExpressionAttributeNames'))
+                if 'Item' in resp:
+                    items.append(resp['Item'])
+            responses[table_name] = items
+            capacity.append(_capacity(table_name, READ_CAPACITY_UNITS * len(request['Keys'])))
+        return {'Responses': responses, 'UnprocessedKeys': {}, 'ConsumedCapacity': capacity}
+
+    def batch_write_item(self, RequestItems: dict, **kwargs) -> dict:
+        capacity = []
+        for table_name, requests in RequestItems.items():
+            table = self.Table(table_name)
+            keys = [_get_key(request.get('PutRequest', {}).get('Item') or request['DeleteRequest']['Key'],
+                             'BatchWriteItem') for request in requests]
+            if len(set(keys)) != len(keys):
+                raise client_error('ValidationException', 'Provided list of item keys contains duplicates',
+                                   'BatchWriteItem')
+            for request in requests:
+                if 'PutRequest' in request:
+                    table.put_item(Item=request['PutRequest']['Item'])
+                else:
+                    table.delete_item(Key=request['DeleteRequest']['Key'])
+            capacity.append(_capacity(table_name, WRITE_CAPACITY_UNITS * len(requests)))
+        return {'UnprocessedItems': {}, 'ConsumedCapacity': capacity}
@@ -8,12 +8,14 @@ aws dynamodb create-table \
 AttributeName=partkey,AttributeType=S \
 AttributeName=sortkey,AttributeType=S \
 AttributeName=date_created,AttributeType=S \
+AttributeName=gsi_user_orders_partkey,AttributeType=S \
 --key-schema \
 AttributeName=partkey,KeyType=HASH \
 AttributeName=sortkey,KeyType=RANGE \
 --provisioned-throughput ReadCapacityUnits=1000,WriteCapacityUnits=1000 \
 --endpoint-url http://localhost:9000 \
 --local-secondary-indexes 'IndexName=date_created-index,KeySchema=[{AttributeName=partkey,KeyType=HASH},{AttributeName=date_created,KeyType=RANGE}],Projection={ProjectionType=ALL}' \
+--global-secondary-indexes '[{"IndexName":"gsi_user_orders", "KeySchema":[{"AttributeName":"gsi_user_orders_partkey","KeyType":"HASH"},{"AttributeName":"date_created","KeyType":"RANGE"}], "ProvisionedThroughput":{"ReadCapacityUnits":1000, "WriteCapacityUnits":1000},"Projection":{"ProjectionType":"ALL"}}]' \
 >> /dev/null
 
 aws dynamodb put-item --table-name local --item '{"company_id": {"S": "f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a"}, "addresses": {"L": []}, "role": {"S": "admin"}, "date_updated": {"S": "2022-12-03T00:26:30"}, "id_": {"S": "13303309-d941-486f-b600-3e90929ac50f"}, "date_created": {"S": "2022-12-03T00:26:30"}, "last_name": {"S": ""}, "login": {"S": "+79216146600"}, "partkey": {"S": "users_f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a"}, "sortkey": {"S": "13303309-d941-486f-b600-3e90929ac50f"}, "additional_phone_numbers": {"L": []}, "phone": {"S": "+79216146600"}, "first_name": {"S": "test admin"}, "email": {"S": "admin@test.ru"}}' --endpoint-url http://localhost:9000
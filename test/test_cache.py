@@ -0,0 +1,29 @@
+from chalicelib.utils import cache
+from chalicelib.utils.cache import TTLCache
+
+
+def test_ttl_cache_evicts_least_recently_used_and_expired_entries(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    ttl_cache = TTLCache(max_size=2, ttl_seconds=10)
+
+    ttl_cache.set('a', 1)
+    ttl_cache.set('b', 2)
+    assert ttl_cache.get('a') == 1
+    ttl_cache.set('c', 3)
+    assert ttl_cache.get('b') is None
+    assert ttl_cache.get('a') == 1
+
+    now[0] += 10
+    assert ttl_cache.get('a') is None
+    assert ttl_cache.get('c', 'default') == 'default'
+    assert len(ttl_cache) == 0
+    assert ttl_cache.stats == {'hits': 2, 'misses': 3}
+
+    ttl_cache.set('a', 1)
+    ttl_cache.invalidate('a')
+    assert ttl_cache.get('a') is None
+
+    disabled_cache = TTLCache(max_size=2, ttl_seconds=0)
+    disabled_cache.set('a', 1)
+    assert disabled_cache.get('a') is None
@@ -0,0 +1,47 @@
+import json
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from chalicelib.utils import cognito as utils_cognito, jwt_verifier
+from chalicelib.utils.exceptions import AuthorizationException
+
+
+def make_jwk(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return {**json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key())), 'kid': kid, 'use': 'sig'}
+
+
+def test_get_cognito_shares_client_and_signing_keys(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(jwt_verifier.time, 'monotonic', lambda: now[0])
+    jwks_path = tmp_path / 'jwks.json'
+    jwks_path.write_text(json.dumps({'keys': [make_jwk('kid-1')]}))
+    monkeypatch.setenv('COGNITO_JWKS_FILE', str(jwks_path))
+    monkeypatch.setenv('COGNITO_ADMIN_POOL_ID', 'eu-central-1_test')
+    monkeypatch.setenv('COGNITO_ADMIN_POOL_CLIENT_ID', 'test-client-id')
+    jwt_verifier.reset_signing_keys()
+
+    first = utils_cognito.get_cognito(username='first')
+    second = utils_cognito.get_cognito(username='second')
+    assert first.client is second.client is utils_cognito.get_cognito_client()
+    assert (first.username, second.username) == ('first', 'second')
+
+    assert first.get_key('kid-1')['kid'] == 'kid-1'
+    jwks_path.write_text(json.dumps({'keys': [make_jwk('kid-2')]}))
+    assert second.get_key('kid-1')['kid'] == 'kid-1'
+    # an unknown kid reloads the keys only once the refresh interval of jwt_verifier passed
+    with pytest.raises(AuthorizationException):
+        second.get_key('kid-2')
+    now[0] += jwt_verifier.JWKS_REFRESH_MIN_INTERVAL_SECONDS
+    assert second.get_key('kid-2')['kid'] == 'kid-2'
+    jwt_verifier.reset_signing_keys()
+
+
+def test_trusted_claims_must_not_be_writable_by_app_client():
+    assert utils_cognito.get_writable_trusted_claims(
+        {'WriteAttributes': ['email', 'phone_number', 'custom:role']}) == ['custom:role']
+    assert utils_cognito.get_writable_trusted_claims({'WriteAttributes': ['email', 'phone_number']}) == []
+    # a client without WriteAttributes can write every attribute
+    assert utils_cognito.get_writable_trusted_claims({}) == list(jwt_verifier.TRUSTED_CLAIMS)
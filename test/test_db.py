@@ -0,0 +1,458 @@
+import threading
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from boto3.dynamodb.types import Binary, TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+from chalicelib.utils import db, db_types, exceptions, memory_db
+
+
+def throttling_error(code='ProvisionedThroughputExceededException'):
+    return ClientError({'Error': {'Code': code, 'Message': 'throttled'}}, 'PutItem')
+
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(db.time, 'sleep', sleeps.append)
+    db.reset_db_retry_stats()
+    return sleeps
+
+
+def test_backoff_retries_throttled_request(no_sleep):
+    calls = []
+
+    def put_item(**kwargs):
+        calls.append(kwargs)
+        if len(calls) < 3:
+            raise throttling_error()
+        return {'ConsumedCapacity': {'CapacityUnits': 1.0}}
+
+    result = db.exp_db_backoff(put_item)(Item={'partkey': 'a', 'sortkey': 'b'})
+
+    assert result == {'ConsumedCapacity': {'CapacityUnits': 1.0}}
+    assert len(calls) == 3
+    assert calls[0]['ReturnConsumedCapacity'] == 'TOTAL'
+    assert len(no_sleep) == 2
+    stats = db.get_db_retry_stats()
+    assert stats['retries'] == 2
+    assert stats['sleep_time'] == pytest.approx(sum(no_sleep))
+
+
+def test_backoff_does_not_retry_other_errors(no_sleep):
+    calls = []
+
+    def get_item(**kwargs):
+        calls.append(kwargs)
+        raise throttling_error('ValidationException')
+
+    with pytest.raises(ClientError):
+        db.exp_db_backoff(get_item)(Key={'partkey': 'a', 'sortkey': 'b'})
+    assert len(calls) == 1
+    assert no_sleep == []
+
+
+def test_backoff_gives_up_when_time_budget_is_exceeded(no_sleep, monkeypatch):
+    monkeypatch.setattr(db, 'DB_RETRY_TIME_BUDGET', 0)
+
+    def update_item(**kwargs):
+        raise throttling_error('ThrottlingException')
+
+    with pytest.raises(exceptions.NumberOfRetriesExceeded):
+        db.exp_db_backoff(update_item)(Key={'partkey': 'a', 'sortkey': 'b'})
+
+
+def test_retry_budget_is_shared_by_db_calls_of_a_request(no_sleep, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db.time, 'monotonic', lambda: now[0])
+    monkeypatch.setattr(db, 'get_backoff_delay', lambda attempt: 1.0)
+    monkeypatch.setattr(db, 'DB_RETRY_TIME_BUDGET', 3)
+
+    def get_item(**kwargs):
+        now[0] += 1.0
+        raise throttling_error()
+
+    db.start_request_retry_budget()
+    try:
+        # the first call spends the budget of the request, the next one is not retried at all
+        with pytest.raises(exceptions.NumberOfRetriesExceeded):
+            db.exp_db_backoff(get_item)(Key={'partkey': 'a', 'sortkey': 'b'})
+        retries = db.get_db_retry_stats()['retries']
+        with pytest.raises(exceptions.NumberOfRetriesExceeded):
+            db.exp_db_backoff(get_item)(Key={'partkey': 'a', 'sortkey': 'c'})
+    finally:
+        stats = db.finish_request_retry_budget()
+    assert retries == 2
+    assert stats['retries'] == retries
+
+    # the next request starts with a new budget and new stats
+    db.start_request_retry_budget()
+    assert db.get_db_retry_stats() == {'retries': 0, 'sleep_time': 0.0}
+    assert db.finish_request_retry_budget() == {'retries': 0, 'sleep_time': 0.0}
+    assert db.db_request_retry['deadline'] is None
+
+
+def test_retry_stats_are_counted_from_parallel_threads(no_sleep):
+    threads = [threading.Thread(target=lambda: [db.backoff_sleep(0.5) for _ in range(1000)]) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert db.get_db_retry_stats() == {'retries': 8000, 'sleep_time': 4000.0}
+
+
+def test_backoff_delay_is_capped():
+    for attempt in range(30):
+        assert 0 <= db.get_backoff_delay(attempt) <= db.DB_BACKOFF_CAP
+
+
+def test_consumed_capacity_is_accumulated_per_route_and_operation(no_sleep):
+    db.reset_capacity_totals()
+
+    def batch_write_item(**kwargs):
+        return {'ConsumedCapacity': [{'TableName': 'customers', 'CapacityUnits': 2.0},
+                                     {'TableName': 'main', 'CapacityUnits': 1.0}]}
+
+    for _ in range(2):
+        db.start_capacity_accounting('POST /orders')
+        db.exp_db_backoff(batch_write_item)(RequestItems={})
+        db.record_consumed_capacity('query', {'TableName': 'customers', 'CapacityUnits': 0.5})
+        summary = db.finish_capacity_accounting()
+
+    assert summary == {'route': 'POST /orders', 'capacity_units': 3.5,
+                       'operations': {'batch_write_item': {'customers': 2.0, 'main': 1.0}, 'query': {'customers': 0.5}}}
+    assert db.get_capacity_totals() == {
+        'POST /orders': {'batch_write_item': {'customers': 4.0, 'main': 2.0}, 'query': {'customers': 1.0}}}
+    db.reset_capacity_totals()
+
+
+def test_get_table_is_cached_per_table_and_endpoint(monkeypatch):
+    monkeypatch.delenv('DB_BACKEND', raising=False)
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'eu-central-1')
+    monkeypatch.setenv('ENDPOINT_URL', 'http://localhost:9000')
+    db.reset_db_registry()
+
+    table = db.get_table('customers')
+    assert db.get_table('customers') is table
+    assert db.get_table('main') is not table
+    assert db.get_table('main').meta.client is table.meta.client
+
+    monkeypatch.setenv('ENDPOINT_URL', 'http://localhost:9001')
+    assert db.get_table('customers') is not table
+
+    db.reset_db_registry()
+    assert db.get_table('customers') is not table
+    db.reset_db_registry()
+
+
+class FakeTable:
+    name = 'customers'
+
+
+class FakeBatchResource:
+    def __init__(self, unprocessed_calls=0):
+        self.requests = []
+        self.unprocessed_calls = unprocessed_calls
+
+    def batch_get_item(self, RequestItems):
+        self.requests.append(RequestItems)
+        keys = RequestItems['customers']['Keys']
+        if self.unprocessed_calls:
+            self.unprocessed_calls -= 1
+            return {'Responses': {'customers': [{**keys[0], 'title': keys[0]['sortkey']}]},
+                    'UnprocessedKeys': {'customers': {**RequestItems['customers'], 'Keys': keys[1:]}}}
+        return {'Responses': {'customers': [{**key, 'title': key['sortkey']} for key in keys]}}
+
+
+def test_batch_get_items_chunks_and_retries_unprocessed_keys(no_sleep, monkeypatch):
+    resource = FakeBatchResource(unprocessed_calls=1)
+    monkeypatch.setattr(db, 'get_db_resource', lambda: resource)
+    keys = [('menu_items_1', str(i)) for i in range(150)]
+
+    items = db.batch_get_items(keys + keys[:5], projection=['title'], table=FakeTable)
+
+    assert len(items) == 150
+    assert items[('menu_items_1', '42')]['title'] == '42'
+    assert [len(request['customers']['Keys']) for request in resource.requests] == [100, 99, 50]
+    assert resource.requests[0]['customers']['ExpressionAttributeNames'] == {
+        '#attr0': 'partkey', '#attr1': 'sortkey', '#attr2': 'title'}
+    assert len(no_sleep) == 1
+
+
+class FakeBatchWriteResource:
+    def __init__(self, unprocessed_calls=0):
+        self.requests = []
+        self.unprocessed_calls = unprocessed_calls
+
+    def batch_write_item(self, RequestItems):
+        self.requests.append(RequestItems['customers'])
+        resp = {'ConsumedCapacity': [{'TableName': 'customers', 'CapacityUnits': 1.0}]}
+        if self.unprocessed_calls:
+            self.unprocessed_calls -= 1
+            resp['UnprocessedItems'] = {'customers': RequestItems['customers'][-2:]}
+        return resp
+
+
+def test_batch_write_flushes_in_chunks_and_resubmits_unprocessed_items(no_sleep, monkeypatch):
+    resource = FakeBatchWriteResource(unprocessed_calls=1)
+    monkeypatch.setattr(db, 'get_db_resource', lambda: resource)
+
+    with db.batch_write(table=FakeTable) as writer:
+        for i in range(30):
+            writer.put({'partkey': 'orders', 'sortkey': str(i)})
+        writer.put({'partkey': 'orders', 'sortkey': '29', 'title': 'updated'})
+        writer.delete({'partkey': 'orders_old', 'sortkey': '1'})
+
+    assert [len(requests) for requests in resource.requests] == [25, 2, 6]
+    assert resource.requests[-1][-2] == {'PutRequest': {'Item': {'partkey': 'orders', 'sortkey': '29',
+                                                                 'title': 'updated'}}}
+    assert resource.requests[-1][-1] == {'DeleteRequest': {'Key': {'partkey': 'orders_old', 'sortkey': '1'}}}
+    assert writer.requests_sent == 31
+    assert writer.consumed_capacity == 3.0
+    assert len(no_sleep) == 1
+
+
+def test_iter_query_items_requests_pages_lazily(monkeypatch):
+    pages = {None: ([1, 2], 'page_2'), 'page_2': ([3, 4], 'page_3'), 'page_3': ([5], None)}
+    requested = []
+
+    def query_items_paginated(key_condition_expression, start_key=None, **kwargs):
+        requested.append(start_key)
+        return pages[start_key]
+
+    monkeypatch.setattr(db, 'query_items_paginated', query_items_paginated)
+
+    items = db.iter_query_items('key_condition')
+    assert next(items) == 1
+    assert requested == [None]
+    assert list(items) == [2, 3, 4, 5]
+    assert requested == [None, 'page_2', 'page_3']
+
+    requested.clear()
+    assert list(db.iter_query_items('key_condition', max_items=2)) == [1, 2]
+    assert requested == [None]
+    assert db.query_items_paged('key_condition') == [1, 2, 3, 4, 5]
+
+
+def test_generate_update_expression_combines_set_and_remove():
+    update_expr, names, values = db.generate_update_expression(
+        update_body={'status': 'new', 'name': 'Burger', 'description': '', 'ignored': 'value'},
+        allowed_attrs_to_update=['status', 'name', 'description', 'price'],
+        allowed_attrs_to_delete=['description']
+    )
+
+    assert update_expr == 'SET #status=:status, #name=:name REMOVE #description'
+    assert names == {'#status': 'status', '#name': 'name', '#description': 'description'}
+    assert values == {':status': 'new', ':name': 'Burger'}
+
+
+def test_update_db_record_sends_one_request(monkeypatch):
+    class FakeUpdateTable:
+        name = 'customers'
+        requests = []
+
+        def update_item(self, **kwargs):
+            self.requests.append(kwargs)
+            return {'Attributes': {}}
+
+    table = FakeUpdateTable()
+    db.update_db_record(
+        key={'partkey': 'a', 'sortkey': 'b'},
+        update_body={'title': 'Burger', 'weight': ''},
+        allowed_attrs_to_update=['title', 'weight'],
+        allowed_attrs_to_delete=['weight'],
+        table=lambda: table
+    )
+    only_remove = db.update_db_record(
+        key={'partkey': 'a', 'sortkey': 'b'},
+        update_body={'weight': ''},
+        allowed_attrs_to_update=['weight'],
+        allowed_attrs_to_delete=['weight'],
+        table=lambda: table
+    )
+    nothing_to_update = db.update_db_record(
+        key={'partkey': 'a', 'sortkey': 'b'},
+        update_body={},
+        allowed_attrs_to_update=['weight'],
+        allowed_attrs_to_delete=['weight'],
+        table=lambda: table
+    )
+
+    assert len(table.requests) == 2
+    assert table.requests[0]['UpdateExpression'] == 'SET #title=:title REMOVE #weight'
+    assert 'ExpressionAttributeValues' not in table.requests[1]
+    assert only_remove == {'Attributes': {}}
+    assert nothing_to_update is None
+
+
+def test_generate_update_expression_increments_attrs():
+    update_expr, names, values = db.generate_update_expression(
+        update_body={'title': 'Burger'},
+        allowed_attrs_to_update=['title'],
+        allowed_attrs_to_delete=[],
+        increment_attrs=['version_']
+    )
+
+    assert update_expr == 'SET #title=:title ADD #version_ :version__increment'
+    assert names == {'#title': 'title', '#version_': 'version_'}
+    assert values == {':title': 'Burger', ':version__increment': 1}
+
+
+class FakeGetTable:
+    name = 'customers'
+
+    def __init__(self):
+        self.requests = []
+
+    def get_item(self, Key):
+        self.requests.append(Key)
+        return {'Item': {**Key, 'role': 'user'}}
+
+    def put_item(self, **kwargs):
+        self.requests.append(kwargs)
+
+
+def test_get_db_item_returns_item_from_identity_map():
+    table = FakeGetTable()
+    db.reset_identity_map()
+
+    item = db.get_db_item('users_1', 'user_1', table=lambda: table)
+    item['role'] = 'changed'
+    assert db.get_db_item('users_1', 'user_1', table=lambda: table)['role'] == 'user'
+    assert len(table.requests) == 1
+    assert db.get_identity_map_hits() == 1
+
+    db.put_db_record({'partkey': 'users_1', 'sortkey': 'user_1'}, table=lambda: table)
+    db.get_db_item('users_1', 'user_1', table=lambda: table)
+    assert len(table.requests) == 3
+
+    db.reset_identity_map()
+    db.get_db_item('users_1', 'user_1', table=lambda: table)
+    assert len(table.requests) == 4
+    assert db.get_identity_map_hits() == 0
+    db.reset_identity_map()
+
+
+def test_batch_get_items_uses_identity_map(monkeypatch):
+    resource = FakeBatchResource()
+    monkeypatch.setattr(db, 'get_db_resource', lambda: resource)
+    db.reset_identity_map()
+
+    db.batch_get_items([('menu_items_1', '1'), ('menu_items_1', '2')], table=FakeTable)
+    items = db.batch_get_items([('menu_items_1', '1'), ('menu_items_1', '3')], table=FakeTable)
+
+    assert items[('menu_items_1', '1')]['title'] == '1'
+    assert resource.requests[-1]['customers']['Keys'] == [{'partkey': 'menu_items_1', 'sortkey': '3'}]
+    assert db.get_identity_map_hits() == 1
+    db.reset_identity_map()
+
+
+def test_parallel_scan_reads_all_segments_and_resumes_from_checkpoints(monkeypatch):
+    monkeypatch.setenv('DB_BACKEND', 'memory')
+    monkeypatch.setenv('CUSTOMERS_TABLE_NAME', 'scan_test')
+    memory_db.reset_memory_db()
+    memory_db.load_items('scan_test', [{'partkey': f'orders_{i % 7}', 'sortkey': str(i), 'record_type': 'order'}
+                                       for i in range(50)])
+    db.reset_capacity_totals()
+    db.start_capacity_accounting('export')
+    saved = []
+
+    items = list(db.parallel_scan(segments=4, page_size=3,
+                                  on_checkpoint=lambda checkpoints: saved.append(dict(checkpoints))))
+
+    assert sorted(int(item['sortkey']) for item in items) == list(range(50))
+    assert saved[-1] == {segment: db.SCAN_SEGMENT_DONE for segment in range(4)}
+    assert db.finish_capacity_accounting()['operations']['scan']['scan_test'] > 0
+
+    partial = saved[len(saved) // 2]
+    resumed = list(db.parallel_scan(segments=4, page_size=3, checkpoints=dict(partial)))
+    assert 0 < len(resumed) < 50
+    assert {item['sortkey'] for item in resumed} <= {item['sortkey'] for item in items}
+    assert list(db.parallel_scan(segments=4, checkpoints=saved[-1])) == []
+    memory_db.reset_memory_db()
+
+
+order_record = {
+    'partkey': 'orders_1_rest_1_0', 'sortkey': 'a1b2c3d4', 'record_type': 'order', 'paid': False,
+    'amount': Decimal('37.00'), 'history': ['created'], 'comment_': None, 'version_': 3,
+    'menu_items': {'item_1': {'id': 'item_1', 'qty': Decimal('2'), 'details': {
+        'title': 'Burger', 'price': Decimal('18.50'), 'cuisine': ['Chinese'], 'available': True}}},
+    'tags': {'spicy', 'vegan'}, 'image': Binary(b'\x00\x01')
+}
+
+
+def test_db_types_converter_matches_boto3_type_serializer():
+    serializer, deserializer = TypeSerializer(), TypeDeserializer()
+
+    serialized = db_types.serialize_item(order_record)
+
+    assert serialized == {key: serializer.serialize(value) for key, value in order_record.items()}
+    assert db_types.deserialize_item(serialized) == {key: deserializer.deserialize(value)
+                                                     for key, value in serialized.items()}
+    with pytest.raises(TypeError):
+        db_types.serialize(1.5)
+
+
+def test_query_items_paginated_fast_path_uses_low_level_client(monkeypatch):
+    requests = []
+
+    class FakeClient:
+        def query(self, **kwargs):
+            requests.append(kwargs)
+            return {'Items': [db_types.serialize_item({**order_record, 'tags': None, 'image': None})],
+                    'LastEvaluatedKey': {'partkey': {'S': 'orders_1_rest_1_0'}, 'sortkey': {'S': 'a1b2c3d4'}},
+                    'ConsumedCapacity': {'TableName': 'customers', 'CapacityUnits': 0.5}}
+
+    monkeypatch.delenv('DB_BACKEND', raising=False)
+    monkeypatch.setenv('DB_FAST_PATH', 'true')
+    monkeypatch.setattr(db, 'get_db_client', FakeClient)
+
+    items, last_key = db.query_items_paginated(
+        key_condition_expression=Key('partkey').eq('orders_1_rest_1_0') & Key('sortkey').gt('a'),
+        filter_expression=Attr('paid').eq(False),
+        projection_expression='#id, amount',
+        expr_attr_names={'#id': 'id_'},
+        limit=1,
+        start_key={'partkey': 'orders_1_rest_1_0', 'sortkey': 'a'},
+        table=FakeTable
+    )
+
+    assert items[0]['menu_items']['item_1']['details']['price'] == Decimal('18.50')
+    assert last_key == {'partkey': 'orders_1_rest_1_0', 'sortkey': 'a1b2c3d4'}
+    request = requests[0]
+    assert request['TableName'] == 'customers'
+    assert request['KeyConditionExpression'] == '(#n0 = :v0 AND #n1 > :v1)'
+    assert request['FilterExpression'] == '#n2 = :v2'
+    assert request['ExpressionAttributeNames'] == {'#id': 'id_', '#n0': 'partkey', '#n1': 'sortkey', '#n2': 'paid'}
+    assert request['ExpressionAttributeValues'] == {':v0': {'S': 'orders_1_rest_1_0'}, ':v1': {'S': 'a'},
+                                                    ':v2': {'BOOL': False}}
+    assert request['ExclusiveStartKey'] == {'partkey': {'S': 'orders_1_rest_1_0'}, 'sortkey': {'S': 'a'}}
+
+
+def test_read_policy_controls_consistent_read_and_identity_map():
+    class FakeConsistentTable(FakeGetTable):
+        def get_item(self, Key, **kwargs):
+            self.requests.append(kwargs)
+            return {'Item': {**Key, 'role': 'user'}}
+
+        def query(self, **kwargs):
+            self.requests.append(kwargs)
+            return {'Items': []}
+
+    table = FakeConsistentTable()
+    db.reset_identity_map()
+
+    db.get_db_item('carts_1', 'user_1', table=lambda: table)
+    db.get_db_item('carts_1', 'user_1', table=lambda: table)
+    db.get_db_item('carts_1', 'user_1', table=lambda: table, read_policy=db.STRONG_READ)
+    assert table.requests == [{}, {'ConsistentRead': True}]
+
+    db.query_items_paginated(Key('partkey').eq('carts_1'), table=lambda: table, read_policy=db.STRONG_READ)
+    db.query_items_paginated(Key('gsi_user_orders_partkey').eq('user_1'), table=lambda: table,
+                             index_name='gsi_user_orders', read_policy=db.STRONG_READ)
+    assert table.requests[2]['ConsistentRead'] is True
+    assert 'ConsistentRead' not in table.requests[3]
+    db.reset_identity_map()
@@ -0,0 +1,116 @@
+import json
+import time
+
+import jwt
+import pytest
+from chalice.app import AuthRequest
+from chalice.local import ForbiddenError
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from chalicelib import auth as chalicelib_auth
+from chalicelib.utils import jwt_verifier
+from chalicelib.utils.exceptions import AuthorizationException
+from test.utils.request_utils import make_request
+
+from test.utils.fixtures import chalice_gateway
+
+test_company_id = 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
+test_user_id = 'e5b01491-e538-4be3-8d3c-a57db7fc43c1'
+test_issuer = 'https://cognito-idp.eu-central-1.amazonaws.com/eu-central-1_test'
+test_client_id = 'test-client-id'
+
+
+def make_key(kid):
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    jwk = json.loads(jwt.algorithms.RSAAlgorithm.to_jwk(private_key.public_key()))
+    jwk.update({'kid': kid, 'alg': 'RS256', 'use': 'sig'})
+    return private_key, jwk
+
+
+def make_token(private_key, kid, **claims):
+    now = int(time.time())
+    payload = {'sub': test_user_id, 'iss': test_issuer, 'aud': test_client_id, 'iat': now, 'exp': now + 3600,
+               'token_use': 'id', 'custom:role': 'user', 'custom:company_id': test_company_id, **claims}
+    payload = {claim: value for claim, value in payload.items() if value is not None}
+    return jwt.encode(payload, private_key, algorithm='RS256', headers={'kid': kid})
+
+
+@pytest.fixture
+def jwks_file(tmp_path, monkeypatch):
+    jwks_path = tmp_path / 'jwks.json'
+    monkeypatch.setenv('COGNITO_JWKS_FILE', str(jwks_path))
+    monkeypatch.setenv('COGNITO_ISSUER', test_issuer)
+    monkeypatch.setenv('COGNITO_ADMIN_POOL_CLIENT_ID', test_client_id)
+    jwt_verifier.reset_signing_keys()
+    yield jwks_path
+    jwt_verifier.reset_signing_keys()
+
+
+def test_verify_token_caches_keys_and_picks_up_rotated_key(jwks_file, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jwt_verifier.time, 'monotonic', lambda: now[0])
+    old_key, old_jwk = make_key('old')
+    jwks_file.write_text(json.dumps({'keys': [old_jwk]}))
+
+    claims = jwt_verifier.verify_token(make_token(old_key, 'old'))
+    assert jwt_verifier.get_identity(claims) == {'user_id': test_user_id, 'role': 'user', 'company_id': test_company_id}
+
+    new_key, new_jwk = make_key('new')
+    jwks_file.write_text(json.dumps({'keys': [new_jwk]}))
+    # the old key is still cached, a rotated key is loaded once the refresh interval passed
+    assert jwt_verifier.verify_token(make_token(old_key, 'old'))['sub'] == test_user_id
+    with pytest.raises(AuthorizationException):
+        jwt_verifier.verify_token(make_token(new_key, 'new'))
+    now[0] += jwt_verifier.JWKS_REFRESH_MIN_INTERVAL_SECONDS
+    assert jwt_verifier.verify_token(make_token(new_key, 'new'))['sub'] == test_user_id
+
+    for token in [make_token(new_key, 'new', exp=int(time.time()) - 10),
+                  make_token(new_key, 'new', aud='other-client'),
+                  make_token(new_key, 'new', token_use='access'),
+                  make_token(new_key, 'new', token_use=None),
+                  make_token(new_key, 'new', aud=None),
+                  make_token(old_key, 'new'),
+                  'not-a-token']:
+        with pytest.raises(AuthorizationException):
+            jwt_verifier.verify_token(token)
+
+
+def test_verify_token_fails_closed(jwks_file, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jwt_verifier.time, 'monotonic', lambda: now[0])
+    private_key, jwk = make_key('kid-1')
+    token = make_token(private_key, 'kid-1')
+
+    # a failed JWKS load is retried after a short backoff, not after the refresh interval
+    with pytest.raises(AuthorizationException, match='Signing keys are not available'):
+        jwt_verifier.verify_token(token)
+    jwks_file.write_text(json.dumps({'keys': [jwk]}))
+    with pytest.raises(AuthorizationException, match='Unknown signing key'):
+        jwt_verifier.verify_token(token)
+    now[0] += jwt_verifier.JWKS_RETRY_AFTER_ERROR_SECONDS
+    assert jwt_verifier.verify_token(token)['sub'] == test_user_id
+
+    monkeypatch.delenv('COGNITO_ADMIN_POOL_CLIENT_ID')
+    with pytest.raises(AuthorizationException, match='audience is not configured'):
+        jwt_verifier.verify_token(token)
+
+
+def test_jwt_token_mode_authenticates_request_by_claims(chalice_gateway, jwks_file, monkeypatch):
+    private_key, jwk = make_key('kid-1')
+    jwks_file.write_text(json.dumps({'keys': [jwk]}))
+    monkeypatch.setenv('AUTH_TOKEN_MODE', jwt_verifier.TOKEN_MODE_JWT)
+    chalicelib_auth.authorizer_cache.clear()
+
+    response = make_request(chalice_gateway, endpoint='/users', method='GET', token=make_token(private_key, 'kid-1'))
+    assert response['statusCode'] == 200
+    assert json.loads(response['body'])['id'] == test_user_id
+
+    with pytest.raises(ForbiddenError):
+        make_request(chalice_gateway, endpoint='/users', method='GET', token=test_user_id)
+
+    # users of other brands pass the authorizer, their company comes from the token, not from a default
+    other_brand_token = make_token(private_key, 'kid-1', **{'custom:company_id': 'other-company-id',
+                                                            'custom:role': 'restaurant_manager'})
+    auth_request = AuthRequest('TOKEN', other_brand_token, 'arn:aws:execute-api:eu-central-1:123:api-id/test/GET/users')
+    assert chalicelib_auth.role_authorizer(auth_request).principal_id == 'restaurant_manager'
+    chalicelib_auth.authorizer_cache.clear()
@@ -0,0 +1,20 @@
+from chalicelib.utils.logger import logger
+
+
+def test_lazy_message_is_built_only_for_enabled_level(caplog):
+    calls = []
+
+    def message():
+        calls.append(1)
+        return 'built message'
+
+    level = logger.level
+    try:
+        logger.setLevel('WARNING')
+        logger.info(message)
+        assert calls == []
+        logger.warning(message)
+        assert calls == [1]
+        assert 'built message' in caplog.text
+    finally:
+        logger.setLevel(level)
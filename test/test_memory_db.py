@@ -0,0 +1,137 @@
+from decimal import Decimal
+
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+from chalicelib.utils import memory_db
+
+
+@pytest.fixture
+def table():
+    memory_db.reset_memory_db()
+    yield memory_db.MemoryResource().Table('customers')
+    memory_db.reset_memory_db()
+
+
+def put_orders(table, count):
+    for i in range(count):
+        table.put_item(Item={'partkey': 'orders_1', 'sortkey': f'order_{i}', 'date_created': f'2023-01-{30 - i:02}',
+                             'amount': i, 'paid': i % 2 == 0})
+
+
+def test_put_get_normalizes_numbers_and_rejects_floats(table):
+    table.put_item(Item={'partkey': 'a', 'sortkey': 'b', 'price': 10, 'tags': ['x']})
+
+    item = table.get_item(Key={'partkey': 'a', 'sortkey': 'b'})['Item']
+    assert item == {'partkey': 'a', 'sortkey': 'b', 'price': Decimal(10), 'tags': ['x']}
+    assert isinstance(item['price'], Decimal)
+    assert 'Item' not in table.get_item(Key={'partkey': 'a', 'sortkey': 'c'})
+    with pytest.raises(TypeError):
+        table.put_item(Item={'partkey': 'a', 'sortkey': 'b', 'price': 1.5})
+
+
+def test_conditions_as_objects_and_strings(table):
+    table.put_item(Item={'partkey': 'a', 'sortkey': 'b', 'version_': 1})
+
+    with pytest.raises(ClientError) as error:
+        table.put_item(Item={'partkey': 'a', 'sortkey': 'b'}, ConditionExpression=Attr('partkey').not_exists())
+    assert error.value.response['Error']['Code'] == 'ConditionalCheckFailedException'
+    table.delete_item(Key={'partkey': 'a', 'sortkey': 'c'}, ConditionExpression='attribute_not_exists(partkey)')
+    table.delete_item(Key={'partkey': 'a', 'sortkey': 'b'},
+                      ConditionExpression='attribute_exists(partkey) AND (#v = :v OR #v > :v)',
+                      ExpressionAttributeNames={'#v': 'version_'}, ExpressionAttributeValues={':v': 1})
+    assert 'Item' not in table.get_item(Key={'partkey': 'a', 'sortkey': 'b'})
+
+
+def test_update_item_applies_set_remove_add(table):
+    table.put_item(Item={'partkey': 'a', 'sortkey': 'b', 'title': 'old', 'weight': 100, 'version_': 1})
+
+    resp = table.update_item(
+        Key={'partkey': 'a', 'sortkey': 'b'},
+        UpdateExpression='SET #title=:title, #price=:price REMOVE #weight ADD #version_ :version__increment',
+        ExpressionAttributeNames={'#title': 'title', '#price': 'price', '#weight': 'weight', '#version_': 'version_'},
+        ExpressionAttributeValues={':title': 'new', ':price': Decimal('9.99'), ':version__increment': 1},
+        ConditionExpression=Attr('version_').eq(1),
+        ReturnValues='UPDATED_NEW'
+    )
+
+    assert resp['Attributes'] == {'title': 'new', 'price': Decimal('9.99'), 'version_': Decimal(2)}
+    assert table.get_item(Key={'partkey': 'a', 'sortkey': 'b'})['Item'] == {
+        'partkey': 'a', 'sortkey': 'b', 'title': 'new', 'price': Decimal('9.99'), 'version_': Decimal(2)}
+
+
+def test_query_orders_filters_and_paginates(table):
+    put_orders(table, 5)
+    table.put_item(Item={'partkey': 'orders_2', 'sortkey': 'order_0', 'date_created': '2023-01-01'})
+
+    resp = table.query(KeyConditionExpression=Key('partkey').eq('orders_1') & Key('sortkey').begins_with('order_'),
+                       FilterExpression=Attr('paid').eq(True), Limit=3)
+    assert [item['sortkey'] for item in resp['Items']] == ['order_0', 'order_2']
+    assert resp['LastEvaluatedKey'] == {'partkey': 'orders_1', 'sortkey': 'order_2'}
+
+    resp = table.query(KeyConditionExpression=Key('partkey').eq('orders_1'), FilterExpression=Attr('paid').eq(True),
+                       Limit=3, ExclusiveStartKey=resp['LastEvaluatedKey'])
+    assert [item['sortkey'] for item in resp['Items']] == ['order_4']
+    assert 'LastEvaluatedKey' not in resp
+
+
+def test_query_local_secondary_index_in_both_directions(table):
+    put_orders(table, 4)
+
+    resp = table.query(KeyConditionExpression=Key('partkey').eq('orders_1'), IndexName='date_created-index',
+                       ProjectionExpression='#attr0', ExpressionAttributeNames={'#attr0': 'sortkey'}, Limit=2)
+    assert resp['Items'] == [{'sortkey': 'order_3'}, {'sortkey': 'order_2'}]
+    assert resp['LastEvaluatedKey'] == {'partkey': 'orders_1', 'sortkey': 'order_2', 'date_created': '2023-01-28'}
+
+    resp = table.query(KeyConditionExpression=Key('partkey').eq('orders_1') & Key('date_created').lt('2023-01-30'),
+                       IndexName='date_created-index', ScanIndexForward=False)
+    assert [item['sortkey'] for item in resp['Items']] == ['order_1', 'order_2', 'order_3']
+
+
+def test_scan_segments_cover_all_items(table):
+    put_orders(table, 1)
+    for partition in range(10):
+        table.put_item(Item={'partkey': f'partition_{partition}', 'sortkey': 'item'})
+
+    segments = [table.scan(Segment=segment, TotalSegments=3)['Items'] for segment in range(3)]
+    assert sorted(item['partkey'] for items in segments for item in items) == \
+        ['orders_1'] + [f'partition_{partition}' for partition in range(10)]
+
+
+def test_transact_write_items_is_all_or_nothing(table):
+    resource = memory_db.MemoryResource()
+    table.put_item(Item={'partkey': 'pre_orders', 'sortkey': '1'})
+    transact_items = [
+        {'Put': {'TableName': 'customers', 'Item': {'partkey': 'orders', 'sortkey': '1'}}},
+        {'Delete': {'TableName': 'customers', 'Key': {'partkey': 'pre_orders', 'sortkey': '1'},
+                    'ConditionExpression': 'attribute_exists(partkey)'}}
+    ]
+
+    resource.meta.client.transact_write_items(TransactItems=transact_items)
+    with pytest.raises(ClientError) as error:
+        resource.meta.client.transact_write_items(TransactItems=[
+            {'Put': {'TableName': 'customers', 'Item': {'partkey': 'orders', 'sortkey': '2'}}},
+            transact_items[1]
+        ])
+
+    assert error.value.response['CancellationReasons'] == [
+        {'Code': 'None'}, {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'}]
+    assert 'Item' in table.get_item(Key={'partkey': 'orders', 'sortkey': '1'})
+    assert 'Item' not in table.get_item(Key={'partkey': 'orders', 'sortkey': '2'})
+
+
+def test_batch_operations(table):
+    resource = memory_db.MemoryResource()
+    resource.batch_write_item(RequestItems={'customers': [
+        {'PutRequest': {'Item': {'partkey': 'a', 'sortkey': str(i)}}} for i in range(3)
+    ]})
+
+    resp = resource.batch_get_item(RequestItems={'customers': {
+        'Keys': [{'partkey': 'a', 'sortkey': '0'}, {'partkey': 'a', 'sortkey': 'missing'}]}})
+    assert resp['Responses'] == {'customers': [{'partkey': 'a', 'sortkey': '0'}]}
+    with pytest.raises(ClientError):
+        resource.batch_write_item(RequestItems={'customers': [
+            {'PutRequest': {'Item': {'partkey': 'a', 'sortkey': '0'}}},
+            {'DeleteRequest': {'Key': {'partkey': 'a', 'sortkey': '0'}}}
+        ]})
@@ -117,6 +117,24 @@ def test_get_menu_items(chalice_gateway, request):
     assert len([menu_item for menu_item in response_body_get if menu_item['id'] == menu_item_id]) == 1
 
 
+@pytest.mark.local_db_test
+def test_get_menu_items_sparse_fieldset(chalice_gateway, request):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id = create_test_menu_item(chalice_gateway, restaurant_id, request)
+
+    response_get = make_request(chalice_gateway, endpoint=f"/menu-items/{restaurant_id}", method="GET",
+                                query='fields=title,price')
+
+    assert response_get['statusCode'] == http200
+    menu_item = [item for item in json.loads(response_get["body"]) if item['id'] == menu_item_id][0]
+    assert set(menu_item.keys()) == {'id', 'version', 'title', 'price'}
+    assert menu_item['price'] == 130.99
+
+    response_wrong = make_request(chalice_gateway, endpoint=f"/menu-items/{restaurant_id}", method="GET",
+                                  query='fields=title,partkey')
+    assert response_wrong['statusCode'] == 400
+
+
 @pytest.mark.local_db_test
 def test_update_menu_item(chalice_gateway, request):
     restaurant_id = create_test_restaurant(chalice_gateway, request)
@@ -168,3 +186,25 @@ def test_archive_menu_item(chalice_gateway, request):
         'sortkey': keys_structure.menu_items_sk.format(menu_item_id=menu_item_id)
     })['Item']
     assert db_record['archived'] is True
+
+
+@pytest.mark.local_db_test
+def test_update_menu_item_version_conflict(chalice_gateway, request):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id = create_test_menu_item(chalice_gateway, restaurant_id, request)
+
+    response = make_request(chalice_gateway, endpoint=f"/menu-items/{restaurant_id}/{menu_item_id}", method="PUT",
+                            json_body={'title': 'first update', 'version': 1}, token=id_restaurant_manager)
+    assert response['statusCode'] == http200, f"status code not as expected"
+
+    response_stale = make_request(chalice_gateway, endpoint=f"/menu-items/{restaurant_id}/{menu_item_id}",
+                                  method="PUT", json_body={'title': 'stale update', 'version': 1},
+                                  token=id_restaurant_manager)
+    assert response_stale['statusCode'] == 409, f"status code not as expected"
+
+    db_record = db.get_customers_table().get_item(Key={
+        'partkey': keys_structure.menu_items_pk.format(company_id=test_company_id, restaurant_id=restaurant_id),
+        'sortkey': keys_structure.menu_items_sk.format(menu_item_id=menu_item_id)
+    })['Item']
+    assert db_record['title'] == 'first update'
+    assert db_record['version_'] == 2
@@ -5,10 +5,12 @@ from typing import List
 import pytest as pytest
 
 from chalicelib.constants import keys_structure
-from chalicelib.constants.constants import UNAUTHORIZED_USER
+from chalicelib.constants.constants import UNAUTHORIZED_USER, ORDER_SHARDS_DEFAULT
 from chalicelib.constants.status_codes import http200
+from chalicelib import orders
+from chalicelib.orders import get_order_pk_sk, get_archived_order_pk_sk, archive_orders
 from chalicelib.utils import db
-from chalicelib.utils.auth import host_company_id_map
+from chalicelib.utils.auth import host_company_id_map, invalidate_user_permissions
 from chalicelib.utils.db import get_customers_table
 from test.utils.request_utils import make_request
 
@@ -140,10 +142,12 @@ def create_test_order_unauthorized_user(chalice_gateway, pre_order_id, restauran
 
     id_ = json.loads(response["body"])['id']
 
+    order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, id_, ORDER_SHARDS_DEFAULT)
+
     def resource_teardown_order():
         db.get_customers_table().delete_item(Key={
-            'partkey': keys_structure.orders_pk.format(company_id=test_company_id),
-            'sortkey': keys_structure.orders_sk.format(restaurant_id=restaurant_id, order_id=id_)
+            'partkey': order_pk,
+            'sortkey': order_sk
         })
     request.addfinalizer(resource_teardown_order)
 
@@ -182,10 +186,12 @@ def create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_
 
     id_ = json.loads(response["body"])['id']
 
+    order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, id_, ORDER_SHARDS_DEFAULT)
+
     def resource_teardown_order():
         db.get_customers_table().delete_item(Key={
-            'partkey': keys_structure.orders_pk.format(company_id=test_company_id),
-            'sortkey': keys_structure.orders_sk.format(restaurant_id=restaurant_id, order_id=id_)
+            'partkey': order_pk,
+            'sortkey': order_sk
         })
     request.addfinalizer(resource_teardown_order)
 
@@ -254,8 +260,7 @@ def test_create_order_unauthorized_user(chalice_gateway, request):
     response_body = json.loads(response["body"])
     order_id = response_body['id']
 
-    order_pk = keys_structure.orders_pk.format(company_id=test_company_id)
-    order_sk = keys_structure.orders_sk.format(restaurant_id=restaurant_id, order_id=order_id)
+    order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, order_id, ORDER_SHARDS_DEFAULT)
 
     def resource_teardown():
         db.get_customers_table().delete_item(Key={'partkey': order_pk, 'sortkey': order_sk})
@@ -362,8 +367,7 @@ def test_create_order_authorized_user(chalice_gateway, request):
     response_body = json.loads(response["body"])
     order_id = response_body['id']
 
-    order_pk = keys_structure.orders_pk.format(company_id=test_company_id)
-    order_sk = keys_structure.orders_sk.format(restaurant_id=restaurant_id, order_id=order_id)
+    order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, order_id, ORDER_SHARDS_DEFAULT)
 
     def resource_teardown():
         db.get_customers_table().delete_item(Key={'partkey': order_pk, 'sortkey': order_sk})
@@ -448,6 +452,136 @@ def test_admin_get_user_orders(chalice_gateway, request):
     get_orders_base(chalice_gateway, request, f"/orders/user/{id_user}", id_admin)
 
 
+@pytest.mark.local_db_test
+def test_get_user_orders_pages_with_cursor(chalice_gateway, request):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id, menu_item_id_2 = create_test_menu_items(chalice_gateway, restaurant_id, request)
+    order_ids = []
+    for menu_item in [menu_item_id, menu_item_id_2]:
+        add_test_items_to_cart(chalice_gateway, restaurant_id, [[menu_item, 1]], request)
+        pre_order_id = create_test_pre_order_authorized_user(chalice_gateway, request, restaurant_id)
+        order_ids.append(create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_id, request))
+    # orders created in the same second have equal date_created, make the newest-first order deterministic
+    for order_id, date_created in zip(order_ids, ['2023-01-01T10:00:00', '2023-01-02T10:00:00']):
+        order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, order_id, ORDER_SHARDS_DEFAULT)
+        get_customers_table().update_item(Key={'partkey': order_pk, 'sortkey': order_sk},
+                                          UpdateExpression="set date_created=:d",
+                                          ExpressionAttributeValues={':d': date_created})
+
+    pages = []
+    cursor = None
+    for _ in range(3):
+        query = f'page_size=1&start_key={cursor}' if cursor else 'page_size=1'
+        response = make_request(chalice_gateway, endpoint="/orders", method="GET", query=query, token=id_user)
+        assert response['statusCode'] == http200
+        response_body = json.loads(response["body"])
+        pages.append([order['id'] for order in response_body['orders']])
+        cursor = response_body['last_evaluated_key']
+        if not cursor:
+            break
+
+    assert [page for page in pages if page] == [[order_ids[1]], [order_ids[0]]]
+
+    response = make_request(chalice_gateway, endpoint="/orders", method="GET", query='start_key=not-a-cursor',
+                            token=id_user)
+    assert response['statusCode'] == 400
+
+
+@pytest.mark.local_db_test
+def test_get_restaurant_orders_merges_order_shards(chalice_gateway, request, monkeypatch):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id, menu_item_id_2 = create_test_menu_items(chalice_gateway, restaurant_id, request)
+    order_ids = []
+    for menu_item in [menu_item_id, menu_item_id_2, menu_item_id]:
+        add_test_items_to_cart(chalice_gateway, restaurant_id, [[menu_item, 1]], request)
+        pre_order_id = create_test_pre_order_authorized_user(chalice_gateway, request, restaurant_id)
+        order_ids.append(create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_id, request))
+
+    page_sizes = []
+    iter_query_items = db.iter_query_items
+
+    def iter_query_items_spy(*args, **kwargs):
+        page_sizes.append(kwargs.get('page_size'))
+        return iter_query_items(*args, **kwargs)
+    monkeypatch.setattr(db, 'iter_query_items', iter_query_items_spy)
+
+    pages = []
+    cursor = None
+    while len(pages) < 3:
+        query = f'page_size=2&start_key={cursor}' if cursor else 'page_size=2'
+        response = make_request(chalice_gateway, endpoint=f"/orders/restaurant/{restaurant_id}", method="GET",
+                                query=query, token=id_admin)
+        assert response['statusCode'] == http200
+        response_body = json.loads(response["body"])
+        pages.append([order['id'] for order in response_body['orders']])
+        cursor = response_body['last_evaluated_key']
+        if not cursor:
+            break
+
+    assert [len(page) for page in pages] == [2, 1]
+    # the page limit is split across the shards instead of reading a whole page from every shard
+    assert set(page_sizes) == {-(-3 // ORDER_SHARDS_DEFAULT)}
+    assert [order_id for page in pages for order_id in page] == sorted(order_ids)
+
+
+@pytest.mark.local_db_test
+def test_order_reads_take_order_shards_from_record_and_cache(chalice_gateway, request, monkeypatch):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id, menu_item_id_2 = create_test_menu_items(chalice_gateway, restaurant_id, request)
+    add_test_items_to_cart(chalice_gateway, restaurant_id, [[menu_item_id, 1]], request)
+    pre_order_id = create_test_pre_order_authorized_user(chalice_gateway, request, restaurant_id)
+    order_id = create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_id, request)
+    order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, order_id, ORDER_SHARDS_DEFAULT)
+    assert get_customers_table().get_item(Key={'partkey': order_pk,
+                                               'sortkey': order_sk})['Item']['order_shards'] == ORDER_SHARDS_DEFAULT
+
+    # a cold container reads the restaurant once, later pages and order reads take the cached order_shards
+    orders.order_shards_cache.invalidate((test_company_id, restaurant_id))
+    response = make_request(chalice_gateway, endpoint=f"/orders/restaurant/{restaurant_id}", method="GET",
+                            token=id_admin)
+    assert response['statusCode'] == http200
+    monkeypatch.setattr(orders.Restaurant, 'init_get_by_id',
+                        classmethod(lambda cls, *args: pytest.fail('restaurant is read')))
+    for endpoint, token in [(f"/orders/restaurant/{restaurant_id}", id_admin),
+                            (f"/orders/id/{restaurant_id}/{order_id}", id_user)]:
+        response = make_request(chalice_gateway, endpoint=endpoint, method="GET", token=token)
+        assert response['statusCode'] == http200
+
+
+@pytest.mark.local_db_test
+def test_get_orders_sparse_fieldset(chalice_gateway, request):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id, menu_item_id_2 = create_test_menu_items(chalice_gateway, restaurant_id, request)
+    add_test_items_to_cart(chalice_gateway, restaurant_id, [[menu_item_id, 2], [menu_item_id_2, 1]], request)
+    pre_order_id = create_test_pre_order_authorized_user(chalice_gateway, request, restaurant_id)
+    order_id = create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_id, request)
+
+    response = make_request(chalice_gateway, endpoint=f"/orders/restaurant/{restaurant_id}", method="GET",
+                            query='fields=amount,date_created,comment', token=id_admin)
+
+    assert response['statusCode'] == http200
+    orders = json.loads(response["body"])['orders']
+    assert orders == [{'id': order_id, 'amount': orders[0]['amount'], 'date_created': orders[0]['date_created'],
+                       'comment': 'Please deliver my order ASAP'}]
+
+    response = make_request(chalice_gateway, endpoint="/orders", method="GET", query='fields=menu_items,items',
+                            token=id_user)
+    assert response['statusCode'] == 400
+
+
+@pytest.mark.local_db_test
+def test_get_orders_consumed_capacity(chalice_gateway, request):
+    db.reset_capacity_totals()
+    # cold container: role and permissions are read from the db
+    invalidate_user_permissions(test_company_id, id_user)
+    response = make_request(chalice_gateway, endpoint="/orders", method="GET", token=id_user)
+
+    assert response['statusCode'] == http200
+    route_totals = db.get_capacity_totals()['GET /orders']
+    assert route_totals['query'][db.get_customers_table().name] > 0
+    assert route_totals['get_item'][db.get_customers_table().name] > 0
+
+
 @pytest.mark.local_db_test
 def test_rest_manager_get_restaurant_orders(chalice_gateway, request):
     restaurant_id = create_test_restaurant(chalice_gateway, request)
@@ -456,5 +590,77 @@ def test_rest_manager_get_restaurant_orders(chalice_gateway, request):
         UpdateExpression="set permissions_.restaurants=:r",
         ExpressionAttributeValues={':r': {restaurant_id: 'all'}}
     )
+    # the permissions TTL cache would otherwise return the entry cached before the update
+    invalidate_user_permissions(test_company_id, id_restaurant_manager)
     get_orders_base(chalice_gateway, request, f"/orders/restaurant/{restaurant_id}",
                     id_restaurant_manager, restaurant_id=restaurant_id)
+
+
+@pytest.mark.local_db_test
+def test_create_order_deletes_cart_and_pre_order(chalice_gateway, request, monkeypatch):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id, menu_item_id_2 = create_test_menu_items(chalice_gateway, restaurant_id, request)
+    add_test_items_to_cart(chalice_gateway, restaurant_id, [[menu_item_id, 2], [menu_item_id_2, 1]], request)
+    pre_order_id = create_test_pre_order_authorized_user(chalice_gateway, request, restaurant_id)
+
+    # order_shards come with the pre-order, the restaurant is not read again
+    monkeypatch.setattr(orders.Restaurant, 'init_get_by_id',
+                        classmethod(lambda cls, *args: pytest.fail('restaurant is read')))
+    order_id = create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_id, request)
+
+    assert order_id == pre_order_id
+    cart_record = db.get_customers_table().get_item(Key={
+        'partkey': keys_structure.carts_pk.format(company_id=test_company_id, restaurant_id=restaurant_id),
+        'sortkey': keys_structure.carts_sk.format(user_id=id_user)
+    })
+    pre_order_record = db.get_customers_table().get_item(Key={
+        'partkey': keys_structure.pre_orders_pk.format(company_id=test_company_id, user_id=id_user),
+        'sortkey': keys_structure.pre_orders_sk.format(order_id=pre_order_id)
+    })
+    assert 'Item' not in cart_record
+    assert 'Item' not in pre_order_record
+
+
+@pytest.mark.local_db_test
+def test_archive_orders_moves_completed_orders(chalice_gateway, request, monkeypatch):
+    restaurant_id = create_test_restaurant(chalice_gateway, request)
+    menu_item_id, menu_item_id_2 = create_test_menu_items(chalice_gateway, restaurant_id, request)
+    order_ids = []
+    for menu_item in [menu_item_id, menu_item_id_2]:
+        add_test_items_to_cart(chalice_gateway, restaurant_id, [[menu_item, 1]], request)
+        pre_order_id = create_test_pre_order_authorized_user(chalice_gateway, request, restaurant_id)
+        order_ids.append(create_test_order_authorized_user(chalice_gateway, pre_order_id, restaurant_id, request))
+    completed_order_id, active_order_id = order_ids
+    for order_id, history in [(completed_order_id, ['created', 'delivered']), (active_order_id, ['created'])]:
+        order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, order_id, ORDER_SHARDS_DEFAULT)
+        get_customers_table().update_item(
+            Key={'partkey': order_pk, 'sortkey': order_sk},
+            UpdateExpression="set date_created=:d, history=:h",
+            ExpressionAttributeValues={':d': '2022-05-10T10:00:00', ':h': history}
+        )
+    archived_pk, archived_sk = get_archived_order_pk_sk(test_company_id, restaurant_id, completed_order_id,
+                                                        '2022-05-10T10:00:00')
+    request.addfinalizer(lambda: get_customers_table().delete_item(Key={'partkey': archived_pk,
+                                                                        'sortkey': archived_sk}))
+
+    # the job queries order shards of the restaurants by date_created-index, it never scans the table
+    monkeypatch.setattr(db, 'iter_scan_items', lambda *args, **kwargs: pytest.fail('archive_orders scans'))
+    assert archive_orders(archive_after_days=30)['orders'] == 1
+    assert archive_orders(archive_after_days=30)['orders'] == 0
+
+    order_pk, order_sk = get_order_pk_sk(test_company_id, restaurant_id, completed_order_id, ORDER_SHARDS_DEFAULT)
+    assert 'Item' not in get_customers_table().get_item(Key={'partkey': order_pk, 'sortkey': order_sk})
+    archived_record = get_customers_table().get_item(Key={'partkey': archived_pk, 'sortkey': archived_sk})['Item']
+    assert archived_record['archived'] is True
+    assert archived_record['gsi_user_orders_partkey'] == keys_structure.user_orders_archived_gsi_pk.format(
+        company_id=test_company_id, user_id=id_user)
+
+    for endpoint, token in [("/orders/archived/2022-05", id_user),
+                            (f"/orders/archived/restaurant/{restaurant_id}/2022-05", id_admin),
+                            (f"/orders/archived/user/{id_user}/2022-05", id_admin)]:
+        response = make_request(chalice_gateway, endpoint=endpoint, method="GET", token=token)
+        assert response['statusCode'] == http200
+        assert [order['id'] for order in json.loads(response["body"])['orders']] == [completed_order_id]
+
+    response = make_request(chalice_gateway, endpoint="/orders/archived/2022-13", method="GET", token=id_user)
+    assert response['statusCode'] == 400
@@ -5,6 +5,8 @@ from uuid import uuid4
 import pytest
 
 from chalicelib.constants import keys_structure
+from chalicelib.constants.constants import ORDER_SHARDS_DEFAULT
+from chalicelib.orders import get_order_pk_sk
 from chalicelib.utils import db
 from test.utils.regression_test_data import get_company_admin_record, get_restaurant_manager_record, get_user_record
 from test.utils.request_utils import make_request
@@ -225,10 +227,12 @@ def create_order_authorized_user(chalice_gateway, request, pre_order_id, id_user
 
     id_ = json.loads(response["body"])['id']
 
+    order_pk, order_sk = get_order_pk_sk(company_id, restaurant_id, id_, ORDER_SHARDS_DEFAULT)
+
     def resource_teardown_order():
         db.get_customers_table().delete_item(Key={
-            'partkey': keys_structure.orders_pk.format(company_id=company_id),
-            'sortkey': keys_structure.orders_sk.format(restaurant_id=restaurant_id, order_id=id_)
+            'partkey': order_pk,
+            'sortkey': order_sk
         })
     request.addfinalizer(resource_teardown_order)
 
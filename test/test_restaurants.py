@@ -114,6 +114,7 @@ def test_get_restaurant_by_id(chalice_gateway, request):
     assert response_get['statusCode'] == http200, f"status code not as expected"
     assert isinstance(response_body, dict)
     assert restaurant_id == response_body['id']
+    assert 'order_shards' not in response_body
 
 
 @pytest.mark.local_db_test
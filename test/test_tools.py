@@ -0,0 +1,124 @@
+import gzip
+import json
+from decimal import Decimal
+
+import pytest
+
+from chalicelib.auth import create_db_user, get_email_index_key
+from chalicelib.constants.constants import ORDER_SHARDS_DEFAULT, UNAUTHORIZED_USER
+from chalicelib import orders
+from chalicelib.orders import get_order_pk_sk, get_user_db_orders_paginated
+from chalicelib.utils import db, memory_db
+from tools import backfill_email_index, backfill_user_orders_gsi, export_table, migrate_orders_to_shards
+
+company_id = 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a'
+
+
+@pytest.fixture
+def memory_table(monkeypatch):
+    monkeypatch.setenv('DB_BACKEND', 'memory')
+    monkeypatch.setenv('CUSTOMERS_TABLE_NAME', 'tools_test')
+    memory_db.reset_memory_db()
+    db.reset_identity_map()
+    yield db.get_customers_table()
+    memory_db.reset_memory_db()
+    db.reset_identity_map()
+
+
+def test_migrate_orders_to_shards(memory_table):
+    memory_db.load_items('tools_test', [
+        {'partkey': f'restaurants_{company_id}', 'sortkey': 'rest_1', 'id_': 'rest_1'},
+        {'partkey': f'restaurants_{company_id}', 'sortkey': 'rest_2', 'id_': 'rest_2', 'order_shards': 2},
+        *[{'partkey': f'orders_{company_id}', 'sortkey': f'{restaurant_id}_{order_id}', 'id_': order_id,
+           'restaurant_id': restaurant_id, 'record_type': 'order'}
+          for restaurant_id in ['rest_1', 'rest_2'] for order_id in ['order_1', 'order_2', 'order_3']],
+        {'partkey': f'orders_archived_{company_id}_2023_01', 'sortkey': 'rest_1_order_0', 'id_': 'order_0',
+         'restaurant_id': 'rest_1', 'record_type': 'order'}
+    ])
+
+    assert migrate_orders_to_shards.migrate_orders(dry_run=True) == {'orders': 6, 'restaurants': 2}
+    assert 'order_shards' not in db.get_db_item(f'restaurants_{company_id}', 'rest_1')
+    assert migrate_orders_to_shards.migrate_orders() == {'orders': 6, 'restaurants': 2}
+    assert migrate_orders_to_shards.migrate_orders() == {'orders': 0, 'restaurants': 0}
+
+    assert db.get_db_item(f'restaurants_{company_id}', 'rest_1')['order_shards'] == ORDER_SHARDS_DEFAULT
+    for restaurant_id, order_shards in [('rest_1', ORDER_SHARDS_DEFAULT), ('rest_2', 2)]:
+        for order_id in ['order_1', 'order_2', 'order_3']:
+            order = db.get_db_item(*get_order_pk_sk(company_id, restaurant_id, order_id, order_shards))
+            assert order['id_'] == order_id
+    assert len(list(db.iter_scan_items(filter_expression=None))) == 2 + 6 + 1
+
+
+def test_migrated_orders_send_no_new_order_emails(memory_table, monkeypatch):
+    memory_db.load_items('tools_test', [
+        {'partkey': f'orders_{company_id}', 'sortkey': f'rest_1_order_{order_no}', 'id_': f'order_{order_no}',
+         'company_id': company_id, 'restaurant_id': 'rest_1', 'record_type': 'order', 'menu_items': {}}
+        for order_no in range(3)
+    ])
+    emails = []
+    monkeypatch.setattr(orders.utils_notifications, 'send_email_ses', lambda *args: emails.append(args))
+
+    assert migrate_orders_to_shards.migrate_orders()['orders'] == 3
+    # the stream delivers every copy as an INSERT of a new order record
+    for order_no in range(3):
+        copy = db.get_db_item(*get_order_pk_sk(company_id, 'rest_1', f'order_{order_no}', ORDER_SHARDS_DEFAULT))
+        assert copy['migrated_from'] == f'orders_{company_id}'
+        orders.db_trigger_order_record({}, copy, f'event_{order_no}', 'INSERT')
+    assert emails == []
+
+    new_order = {key: value for key, value in copy.items() if key != 'migrated_from'}
+    orders.db_trigger_order_record({}, new_order, 'event_new', 'INSERT')
+    assert len(emails) == 1
+
+
+def test_export_table_writes_gzip_ndjson_and_resumes(memory_table, tmp_path):
+    memory_db.load_items('tools_test', [
+        {'partkey': f'orders_{company_id}_rest_1_{shard}', 'sortkey': f'order_{i}', 'company_id': company_id,
+         'record_type': 'order', 'amount': Decimal('9.99'), 'qty': 2}
+        for shard in range(4) for i in range(5)
+    ] + [{'partkey': 'orders_other_company', 'sortkey': 'order_1', 'company_id': 'other', 'record_type': 'order'}])
+    output_path, checkpoint_path = tmp_path / 'export.ndjson.gz', tmp_path / 'export.checkpoint.json'
+
+    stats = export_table.export_table(str(output_path), segments=3, company_id=company_id,
+                                      checkpoint_path=str(checkpoint_path))
+
+    with gzip.open(output_path, 'rt') as output:
+        records = [json.loads(line) for line in output]
+    assert stats == {'records': 20, 'segments': 3}
+    assert len({(record['partkey'], record['sortkey']) for record in records}) == 20
+    assert records[0]['amount'] == 9.99 and records[0]['qty'] == 2
+    assert export_table.load_checkpoints(str(checkpoint_path)) == {segment: db.SCAN_SEGMENT_DONE
+                                                                   for segment in range(3)}
+    assert export_table.export_table(str(output_path), segments=3, company_id=company_id,
+                                     checkpoint_path=str(checkpoint_path))['records'] == 0
+
+
+def test_backfill_email_index(memory_table, monkeypatch):
+    monkeypatch.setenv('MAIN_TABLE_NAME', 'tools_test')
+    # users signed up before the index existed: records of create_db_user without their email index records
+    for user_id, email in [('user_1', 'User@Test.ru'), ('user_2', 'user@test.ru'), ('user_3', '')]:
+        create_db_user(user_id=user_id, username=user_id, email=email, phone='', role='user', company_id=company_id)
+        if email:
+            db.delete_db_record(get_email_index_key(company_id, email), table=db.get_main_table)
+    assert 'company_id' not in db.get_db_item(f'users_{company_id}', 'user_1', table=db.get_main_table)
+
+    assert backfill_email_index.backfill_email_index(segments=2) == {'indexed': 1, 'conflicts': 1}
+    assert db.get_db_item(f'emails_{company_id}', 'user@test.ru')['user_id'] in ('user_1', 'user_2')
+
+
+def test_backfill_user_orders_gsi(memory_table):
+    memory_db.load_items('tools_test', [
+        {'partkey': f'orders_{company_id}_rest_1_{order_no % 2}', 'sortkey': f'order_{order_no}',
+         'id_': f'order_{order_no}', 'company_id': company_id, 'restaurant_id': 'rest_1', 'record_type': 'order',
+         'user_id': user_id, 'date_created': f'2023-01-0{order_no}T10:00:00'}
+        for order_no, user_id in [(1, 'user_1'), (2, 'user_1'), (3, UNAUTHORIZED_USER), (4, 'user_2')]
+    ])
+    assert get_user_db_orders_paginated(company_id, None, 'user_1', 10, None) == ([], None)
+
+    assert backfill_user_orders_gsi.backfill_user_orders_gsi(segments=2, dry_run=True) == {'indexed': 3, 'skipped': 0}
+    assert backfill_user_orders_gsi.backfill_user_orders_gsi(segments=2) == {'indexed': 3, 'skipped': 0}
+    assert backfill_user_orders_gsi.backfill_user_orders_gsi(segments=2) == {'indexed': 0, 'skipped': 0}
+
+    db_records, _ = get_user_db_orders_paginated(company_id, None, 'user_1', 10, None)
+    assert [record['id_'] for record in db_records] == ['order_2', 'order_1']
+    assert 'gsi_user_orders_partkey' not in db.get_db_item(f'orders_{company_id}_rest_1_1', 'order_3')
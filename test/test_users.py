@@ -1,7 +1,13 @@
 import json
 
+import pytest
+from chalice.app import AuthRequest
+
+from chalicelib import auth as chalicelib_auth
 from chalicelib.constants import keys_structure
+from chalicelib.utils import auth, cache
 from chalicelib.utils.auth import host_company_id_map
+from chalicelib.utils.exceptions import ValidationException
 from test.utils.request_utils import make_request
 from chalicelib.utils import db
 
@@ -82,3 +88,101 @@ def test_user_update(chalice_gateway, request):
     assert response_body['addresses'] == ['Kaliningrad']
     assert response_body['additional_phone_numbers'] == ['+37066042239', '+79216146600']
     assert 'unexpected_field' not in response_body
+
+
+def test_permissions_cache_is_bounded_by_ttl(chalice_gateway, request, monkeypatch):
+    now = [cache.time.monotonic()]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    user_id = create_test_user(request)
+    auth.invalidate_user_permissions(test_company_id, user_id)
+    make_request(chalice_gateway, endpoint="/users", method="GET", token=user_id)
+    assert (test_company_id, user_id) in auth.user_permissions_cache._entries
+
+    db.get_customers_table().update_item(
+        Key={'partkey': f'users_{test_company_id}', 'sortkey': user_id},
+        UpdateExpression="set #role=:r", ExpressionAttributeNames={'#role': 'role'},
+        ExpressionAttributeValues={':r': 'restaurant_manager'}
+    )
+    db.reset_identity_map()
+    assert auth.get_user_role_and_permissions(test_company_id, user_id)[0] == 'user'
+
+    now[0] += auth.user_permissions_cache.ttl_seconds
+    assert auth.get_user_role_and_permissions(test_company_id, user_id)[0] == 'restaurant_manager'
+    auth.invalidate_user_permissions(test_company_id, user_id)
+
+
+def test_role_authorizer_caches_auth_response(chalice_gateway, request):
+    user_id = create_test_user(request)
+    chalicelib_auth.authorizer_cache.clear()
+    auth_request = AuthRequest('TOKEN', user_id, 'arn:aws:execute-api:eu-central-1:123:api-id/test/GET/users')
+
+    auth_response = chalicelib_auth.role_authorizer(auth_request)
+    assert auth_response.principal_id == 'user'
+    assert auth_response.routes == list(chalicelib_auth.ROLE_ROUTES['user'])
+
+    db.get_customers_table().delete_item(Key={'partkey': f'users_{test_company_id}', 'sortkey': user_id})
+    auth.invalidate_user_permissions(test_company_id, user_id)
+    assert chalicelib_auth.role_authorizer(auth_request) is auth_response
+    assert chalicelib_auth.authorizer_cache.stats == {'hits': 1, 'misses': 1}
+
+    chalicelib_auth.authorizer_cache.clear()
+    denied = chalicelib_auth.role_authorizer(auth_request)
+    assert denied.routes == [] and denied.principal_id == ''
+    assert user_id not in chalicelib_auth.authorizer_cache._entries
+
+
+def test_create_db_user_indexes_email_for_pre_signup_check(chalice_gateway, request):
+    user_id = 'c0d9a4c2-61b5-4f5e-9d0c-0b8d6bd2a1f0'
+
+    def resource_teardown_user():
+        db.delete_db_record({'partkey': keys_structure.users_pk.format(company_id=test_company_id),
+                             'sortkey': keys_structure.users_sk.format(user_id=user_id)}, table=db.get_main_table)
+        db.delete_db_record(chalicelib_auth.get_email_index_key(test_company_id, 'new.user@test.ru'),
+                            table=db.get_main_table)
+    request.addfinalizer(resource_teardown_user)
+    signup_event = {'request': {'userAttributes': {'email': 'New.User@Test.ru', 'custom:company_id': test_company_id}}}
+    assert chalicelib_auth.cognito_pre_signup(signup_event, None) == signup_event
+
+    chalicelib_auth.create_db_user(user_id=user_id, username='new_user', email='New.User@Test.ru', phone='',
+                                   role='user', company_id=test_company_id)
+    email_record = db.get_db_item(f'emails_{test_company_id}', 'new.user@test.ru', table=db.get_main_table)
+    assert email_record['user_id'] == user_id
+
+    signup_event['request']['userAttributes']['email'] = 'new.user@test.ru '
+    with pytest.raises(ValidationException):
+        chalicelib_auth.cognito_pre_signup(signup_event, None)
+    # a retried confirmation of the same user succeeds, another user with the email is rejected
+    chalicelib_auth.create_db_user(user_id=user_id, username='new_user', email='new.user@test.ru', phone='',
+                                   role='user', company_id=test_company_id)
+    with pytest.raises(ValidationException):
+        chalicelib_auth.create_db_user(user_id='6b4ad2f5-2a6c-4f2a-9a57-5cd6a4b3c2e1', username='other_user',
+                                       email='new.user@test.ru', phone='', role='user', company_id=test_company_id)
+
+
+def test_company_id_by_host_is_cached_for_ttl(chalice_gateway, request, monkeypatch):
+    now = [cache.time.monotonic()]
+    monkeypatch.setattr(cache.time, 'monotonic', lambda: now[0])
+    host = 'brand.test-domain.com'
+    host_record = {'partkey': 'companies_hosts', 'sortkey': host, 'record_type': 'company_host',
+                   'company_id': test_company_id}
+    request.addfinalizer(lambda: auth.unknown_hosts_cache.invalidate(host))
+    request.addfinalizer(lambda: auth.company_hosts_cache.invalidate(host))
+    with pytest.raises(Exception, match='Unknown domain'):
+        auth.get_company_id_by_host(host)
+
+    db.put_db_record(host_record, table=db.get_main_table)
+    request.addfinalizer(lambda: db.delete_db_record({'partkey': 'companies_hosts', 'sortkey': host},
+                                                     table=db.get_main_table))
+    # the unknown host stays in the negative cache for its TTL
+    with pytest.raises(Exception, match='Unknown domain'):
+        auth.get_company_id_by_host(host)
+    now[0] += auth.unknown_hosts_cache.ttl_seconds
+    db.reset_identity_map()
+    assert auth.get_company_id_by_host(host) == test_company_id
+
+    db.delete_db_record({'partkey': 'companies_hosts', 'sortkey': host}, table=db.get_main_table)
+    assert auth.get_company_id_by_host(host) == test_company_id
+    now[0] += auth.company_hosts_cache.ttl_seconds
+    with pytest.raises(Exception, match='Unknown domain'):
+        auth.get_company_id_by_host(host)
+    assert auth.get_company_id_by_host('test-domain.com') == host_company_id_map['test-domain.com']
@@ -1,11 +1,17 @@
+import json
 import os
+import re
 
 import pytest
+from boto3.dynamodb.types import TypeDeserializer
 from chalice.local import LocalGateway
 from chalice.cli import factory
 
+from chalicelib.utils import db, memory_db
 from chalicelib.utils.logger import log_message
 
+DOCKER_SCRIPT_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'docker.sh')
+
 
 def local_gateway() -> LocalGateway:
     config = factory.CLIFactory(
@@ -14,6 +20,23 @@ def local_gateway() -> LocalGateway:
     return LocalGateway(config.chalice_app, config)
 
 
+def seed_memory_db() -> None:
+    """
+    Loads the items which docker.sh puts to dynamodb-local into the in-memory tables
+    """
+    with open(DOCKER_SCRIPT_PATH) as docker_script:
+        raw_items = re.findall(r"^aws dynamodb put-item .*--item '(.*)' --endpoint-url", docker_script.read(),
+                               flags=re.MULTILINE)
+    deserializer = TypeDeserializer()
+    items = [{attr: deserializer.deserialize(value) for attr, value in json.loads(raw_item).items()}
+             for raw_item in raw_items]
+    for table_name in {os.environ.get('CUSTOMERS_TABLE_NAME'), os.environ.get('MAIN_TABLE_NAME')}:
+        memory_db.load_items(table_name, items)
+
+
 @pytest.fixture(scope='session')
 def chalice_gateway() -> LocalGateway:
+    if db.get_db_location() == db.MEMORY_DB_BACKEND:
+        memory_db.reset_memory_db()
+        seed_memory_db()
     yield local_gateway()
@@ -0,0 +1,57 @@
+"""
+Writes the email uniqueness index (emails_{company_id} partitions of the main table) for users which were
+created before create_db_user started to maintain it. Safe to run again: existing index records of the same
+user are overwritten, emails which are already taken by another user are reported as conflicts.
+
+Usage (table and credentials are taken from the environment, as for the app):
+    MAIN_TABLE_NAME=restmonster-main-dev python -m tools.backfill_email_index [--segments 4]
+"""
+import argparse
+from typing import Dict
+
+from boto3.dynamodb.conditions import Attr
+
+from chalicelib.auth import get_email_index_key
+from chalicelib.constants.keys_structure import users_pk
+from chalicelib.utils import db as utils_db
+from chalicelib.utils.exceptions import ConditionalCheckFailed
+from chalicelib.utils.logger import logger
+
+
+def backfill_email_index(segments: int = utils_db.PARALLEL_SCAN_SEGMENTS_DEFAULT) -> Dict:
+    """
+    :return:
+    backfill stats {'indexed': number of written index records, 'conflicts': emails used by several users}
+    """
+    stats = {'indexed': 0, 'conflicts': 0}
+    users = utils_db.parallel_scan(segments=segments,
+                                   filter_expression=Attr('partkey').begins_with(users_pk.format(company_id='')),
+                                   table=utils_db.get_main_table)
+    for user in users:
+        # users written by create_db_user have no company_id attribute, the company is a part of the partkey
+        company_id = user['partkey'][len(users_pk.format(company_id='')):]
+        email, user_id = user.get('email'), user.get('id_')
+        if not (email and company_id and user_id):
+            continue
+        try:
+            utils_db.put_db_record(
+                {**get_email_index_key(company_id, email), 'record_type': 'email', 'user_id': user_id,
+                 'company_id': company_id},
+                table=utils_db.get_main_table,
+                condition_expression=Attr('partkey').not_exists() | Attr('user_id').eq(user_id)
+            )
+            stats['indexed'] += 1
+        except ConditionalCheckFailed:
+            logger.warning(f"backfill_email_index ::: {email=} of {user_id=} is already used by another user")
+            stats['conflicts'] += 1
+
+    logger.info(f"backfill_email_index ::: {stats=}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Write the email uniqueness index for existing users')
+    parser.add_argument('--segments', type=int, default=utils_db.PARALLEL_SCAN_SEGMENTS_DEFAULT,
+                        help='number of parallel scan segments')
+    args = parser.parse_args()
+    print(backfill_email_index(segments=args.segments))
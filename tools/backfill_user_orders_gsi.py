@@ -0,0 +1,63 @@
+"""
+Sets gsi_user_orders_partkey on orders which were created before the gsi_user_orders index was introduced,
+so GET /orders of a user returns all orders of the user, not only the new ones.
+Orders of unauthorized users are not indexed (the index is sparse). Only orders without the attribute are
+updated and an order deleted (archived) after the scan is not written back, so the tool can be run again.
+
+Usage (table and credentials are taken from the environment, as for the app):
+    CUSTOMERS_TABLE_NAME=restmonster-customers-dev python -m tools.backfill_user_orders_gsi [--segments 4]
+"""
+import argparse
+from typing import Dict
+
+from boto3.dynamodb.conditions import Attr
+
+from chalicelib.constants import keys_structure
+from chalicelib.constants.constants import UNAUTHORIZED_USER
+from chalicelib.utils import db as utils_db
+from chalicelib.utils.exceptions import ConditionalCheckFailed
+from chalicelib.utils.logger import logger
+
+
+def backfill_user_orders_gsi(segments: int = utils_db.PARALLEL_SCAN_SEGMENTS_DEFAULT, dry_run: bool = False) -> Dict:
+    """
+    :return:
+    backfill stats {'indexed': number of updated orders, 'skipped': orders deleted while the backfill ran}
+    """
+    stats = {'indexed': 0, 'skipped': 0}
+    orders = utils_db.parallel_scan(
+        segments=segments,
+        filter_expression=Attr('record_type').eq('order') & Attr('gsi_user_orders_partkey').not_exists() &
+        Attr('user_id').ne(UNAUTHORIZED_USER)
+    )
+    for order in orders:
+        company_id, user_id = order.get('company_id'), order.get('user_id')
+        if not (company_id and user_id):
+            continue
+        if not dry_run:
+            try:
+                utils_db.update_db_record(
+                    key={'partkey': order['partkey'], 'sortkey': order['sortkey']},
+                    update_body={'gsi_user_orders_partkey': keys_structure.user_orders_gsi_pk.format(
+                        company_id=company_id, user_id=user_id)},
+                    allowed_attrs_to_update=['gsi_user_orders_partkey'],
+                    allowed_attrs_to_delete=[],
+                    condition_expression=Attr('partkey').exists()
+                )
+            except ConditionalCheckFailed:
+                logger.warning(f"backfill_user_orders_gsi ::: order {order['sortkey']} was deleted, skipped")
+                stats['skipped'] += 1
+                continue
+        stats['indexed'] += 1
+
+    logger.info(f"backfill_user_orders_gsi ::: {dry_run=} {stats=}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Add existing orders of users to the gsi_user_orders index')
+    parser.add_argument('--segments', type=int, default=utils_db.PARALLEL_SCAN_SEGMENTS_DEFAULT,
+                        help='number of parallel scan segments')
+    parser.add_argument('--dry-run', action='store_true', help='only count orders which would be updated')
+    args = parser.parse_args()
+    print(backfill_user_orders_gsi(segments=args.segments, dry_run=args.dry_run))
@@ -0,0 +1,52 @@
+"""
+Compares the warm cost of preparing a Cognito login: a new pycognito.Cognito per call (new boto3 client,
+JWKS downloaded again for the token check) and utils.cognito.get_cognito (shared client and JWKS).
+By default only the client side is measured, so no AWS access is needed; with --username and --password
+the full login (authenticate) against the admin pool is measured as well.
+
+Usage:
+    DEFAULT_REGION=eu-central-1 COGNITO_ADMIN_POOL_ID=<pool> COGNITO_ADMIN_POOL_CLIENT_ID=<client> \
+        python -m tools.benchmark_cognito_clients [--repeat 20] [--username <username> --password <password>]
+"""
+import argparse
+import os
+import timeit
+from typing import Dict
+
+from pycognito import Cognito
+
+from chalicelib.utils import cognito as utils_cognito
+
+
+def new_cognito(**user_kwargs) -> Cognito:
+    return Cognito(os.environ['COGNITO_ADMIN_POOL_ID'], os.environ['COGNITO_ADMIN_POOL_CLIENT_ID'],
+                   user_pool_region=os.environ['DEFAULT_REGION'], **user_kwargs)
+
+
+def run_benchmark(repeat: int = 20, username: str = None, password: str = None) -> Dict:
+    """
+    :return:
+    average time in milliseconds of one call for each way of getting a Cognito object and their ratio
+    """
+    factories = [('new_cognito', new_cognito), ('shared_cognito', utils_cognito.get_cognito)]
+    if username and password:
+        def measure(factory):
+            return lambda: factory(username=username).authenticate(password=password)
+    else:
+        def measure(factory):
+            return lambda: factory(username=username or 'benchmark')
+
+    utils_cognito.get_cognito()  # the shared client is created once per container, the benchmark measures warm calls
+    results = {name: round(timeit.timeit(measure(factory), number=repeat) / repeat * 1000, 3)
+               for name, factory in factories}
+    results['speedup'] = round(results['new_cognito'] / results['shared_cognito'], 2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark warm Cognito login preparation')
+    parser.add_argument('--repeat', type=int, default=20, help='number of calls of each way')
+    parser.add_argument('--username', help='user of the admin pool to log in with')
+    parser.add_argument('--password', help='password of the user')
+    args = parser.parse_args()
+    print(run_benchmark(repeat=args.repeat, username=args.username, password=args.password))
@@ -0,0 +1,91 @@
+"""
+Compares the (de)serialization cost of the Table resource path (boto3 TypeSerializer/TypeDeserializer)
+with the db_types converter of the DB_FAST_PATH on order records with nested menu_items.
+Network time is the same for both paths, so only the conversion is measured.
+
+Usage:
+    python -m tools.benchmark_db_serializer [--menu-items 20] [--records 100] [--repeat 5]
+"""
+import argparse
+import timeit
+from decimal import Decimal
+from typing import Dict, List
+
+from boto3.dynamodb.types import TypeSerializer, TypeDeserializer
+
+from chalicelib.utils import db_types
+
+
+def make_order_record(order_no: int, menu_items: int) -> Dict:
+    return {
+        'partkey': f'orders_f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a_rest_{order_no % 10}_{order_no % 4}',
+        'sortkey': f'{order_no:08x}',
+        'record_type': 'order',
+        'company_id': 'f770d5f7-6dd2-4cdf-842b-5fd0dd84a52a',
+        'id_': f'{order_no:08x}',
+        'user_id': 'e5b01491-e538-4be3-8d3c-a57db7fc43c1',
+        'user_phone_number': '+79216146600',
+        'user_email': 'user@example.com',
+        'restaurant_id': 'bd6ed0d2-35a8-4a4f-8fbc-2d4a1f0e6b1c',
+        'delivery_address': 'Mayskiy lane, 2, flat 119',
+        'delivery_price': Decimal('5.00'),
+        'date_created': '2023-01-15T12:30:00',
+        'date_updated': '2023-01-15T12:30:00',
+        'amount': Decimal('137.50'),
+        'paid': False,
+        'archived': False,
+        'history': ['created'],
+        'comment_': 'Please deliver my order ASAP',
+        'delivery_method': 'delivery',
+        'payment_method': 'card',
+        'menu_items': {
+            f'item_{i}': {
+                'id': f'item_{i}',
+                'qty': Decimal(i % 3 + 1),
+                'details': {
+                    'id': f'item_{i}',
+                    'title': f'Menu item {i}',
+                    'category': 'Dinner',
+                    'description': 'The best Burger in the world',
+                    'price': Decimal('18.50'),
+                    'available': True,
+                    'image': {'main': f'images/item_{i}/main.jpg', 'thumbnail': f'images/item_{i}/thumbnail.jpg'}
+                }
+            } for i in range(menu_items)
+        }
+    }
+
+
+def resource_path_round_trip(records: List[Dict]) -> None:
+    serializer, deserializer = TypeSerializer(), TypeDeserializer()
+    for record in records:
+        serialized = {key: serializer.serialize(value) for key, value in record.items()}
+        {key: deserializer.deserialize(value) for key, value in serialized.items()}
+
+
+def fast_path_round_trip(records: List[Dict]) -> None:
+    for record in records:
+        db_types.deserialize_item(db_types.serialize_item(record))
+
+
+def run_benchmark(menu_items: int = 20, records: int = 100, repeat: int = 5) -> Dict:
+    """
+    :return:
+    best time in seconds of one round trip of all records for each path and the speedup of the fast path
+    """
+    order_records = [make_order_record(order_no, menu_items) for order_no in range(records)]
+    results = {
+        path: min(timeit.repeat(lambda: func(order_records), number=1, repeat=repeat))
+        for path, func in [('resource', resource_path_round_trip), ('fast_path', fast_path_round_trip)]
+    }
+    results['speedup'] = round(results['resource'] / results['fast_path'], 2)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark DynamoDB record (de)serialization paths')
+    parser.add_argument('--menu-items', type=int, default=20, help='menu items per order')
+    parser.add_argument('--records', type=int, default=100, help='orders per round trip')
+    parser.add_argument('--repeat', type=int, default=5, help='number of measurements, the best one is taken')
+    args = parser.parse_args()
+    print(run_benchmark(menu_items=args.menu_items, records=args.records, repeat=args.repeat))
@@ -0,0 +1,85 @@
+"""
+Measures the per-request logging overhead of an authenticated GET request: log_request, the debug line of
+exp_db_backoff for a few db calls and an endpoint line with the returned ids.
+'eager' formats every message before the level check and deep-copies the request, as the logger did before
+lazy messages, 'lazy' is the current logger. Records go to a null stream, so only building them is measured.
+
+Usage:
+    python -m tools.benchmark_logging [--repeat 2000] [--items 30]
+"""
+import argparse
+import io
+import json
+import logging
+import timeit
+from copy import deepcopy
+from typing import Dict
+
+from chalice.app import Request
+
+from chalicelib.utils.logger import logger, log_request
+
+DB_CALLS_PER_REQUEST = 3
+
+
+def make_request() -> Request:
+    return Request({
+        'multiValueQueryStringParameters': {'limit': ['30']},
+        'headers': {'host': 'test-domain.com', 'content-type': 'application/json',
+                    'authorization': 'e5b01491-e538-4be3-8d3c-a57db7fc43c1', 'user-agent': 'benchmark'},
+        'pathParameters': {'restaurant_id': '3a1e6dc1-465f-4c8e-b9a5-a94de93a60c9'},
+        'requestContext': {'httpMethod': 'GET', 'resourcePath': '/menu-items/{restaurant_id}',
+                           'identity': {'sourceIp': '127.0.0.1'}},
+        'body': None,
+        'stageVariables': None,
+        'isBase64Encoded': False
+    })
+
+
+def eager_request_logging(request: Request, items: list) -> None:
+    request_dict = deepcopy(request.to_dict())
+    request_dict['headers'].pop('authorization')
+    logger.info(f"Request: {json.dumps(request_dict)}")
+    logger.debug(f"Request body: {str(request.raw_body)}")
+    for _ in range(DB_CALLS_PER_REQUEST):
+        logger.debug(f"query:: args={()}, kwargs={ {'KeyConditionExpression': 'partkey = :pk', 'Limit': 30} }")
+    logger.info(f"endpoint_get_menu_items ::: returning menu items={[item['id'] for item in items]}")
+
+
+def lazy_request_logging(request: Request, items: list) -> None:
+    log_request(request)
+    for _ in range(DB_CALLS_PER_REQUEST):
+        logger.debug(lambda: f"query:: args={()}, kwargs={ {'KeyConditionExpression': 'partkey = :pk', 'Limit': 30} }")
+    logger.debug(lambda: f"endpoint_get_menu_items ::: returning menu items={[item['id'] for item in items]}")
+
+
+def run_benchmark(repeat: int = 2000, items: int = 30) -> Dict:
+    """
+    :return:
+    {level: {'eager': microseconds per request, 'lazy': microseconds per request}}
+    """
+    request = make_request()
+    menu_items = [{'id': f'{item_no:08x}-0000-4000-8000-000000000000'} for item_no in range(items)]
+    handlers, level = logger.handlers, logger.level
+    logger.handlers = [logging.StreamHandler(io.StringIO())]
+    results = {}
+    try:
+        for level_name in ['DEBUG', 'INFO', 'WARNING']:
+            logger.setLevel(level_name)
+            results[level_name] = {
+                name: round(timeit.timeit(lambda: func(request, menu_items), number=repeat) / repeat * 1e6, 2)
+                for name, func in [('eager', eager_request_logging), ('lazy', lazy_request_logging)]
+            }
+            logger.handlers[0].stream = io.StringIO()
+    finally:
+        logger.handlers = handlers
+        logger.setLevel(level)
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark per-request logging overhead by log level')
+    parser.add_argument('--repeat', type=int, default=2000, help='number of simulated requests')
+    parser.add_argument('--items', type=int, default=30, help='number of ids in the endpoint log line')
+    args = parser.parse_args()
+    print(run_benchmark(repeat=args.repeat, items=args.items))
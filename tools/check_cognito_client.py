@@ -0,0 +1,52 @@
+"""
+Fails if the app client of the admin pool of a chalice stage can write custom:role or custom:company_id.
+The jwt token mode takes role and company from these id token claims without a db lookup, so a writable
+attribute would let a user make themselves admin with UpdateUserAttributes. Run by build-dev.sh before packaging.
+
+Usage (credentials are taken from the environment, pool and client from .chalice/config.json):
+    python -m tools.check_cognito_client [--stage dev]
+"""
+import argparse
+import json
+import sys
+from typing import Dict
+
+from chalicelib.utils import cognito as utils_cognito
+from chalicelib.utils.logger import logger
+
+CHALICE_CONFIG_PATH = '.chalice/config.json'
+
+
+def get_stage_pool_client(stage: str, config_path: str = CHALICE_CONFIG_PATH) -> Dict:
+    """
+    :return:
+    {'pool_id', 'client_id', 'region'} of the admin pool of the stage
+    """
+    with open(config_path) as config_file:
+        environment = json.load(config_file)['stages'][stage]['environment_variables']
+    return {'pool_id': environment['COGNITO_ADMIN_POOL_ID'], 'client_id': environment['COGNITO_ADMIN_POOL_CLIENT_ID'],
+            'region': environment.get('DEFAULT_REGION')}
+
+
+def check_cognito_client(stage: str, config_path: str = CHALICE_CONFIG_PATH) -> list:
+    """
+    :return:
+    trusted claims which the app client of the stage can write, empty if the client is safe
+    """
+    pool_client = get_stage_pool_client(stage, config_path)
+    user_pool_client = utils_cognito.get_cognito_client(pool_client['region']).describe_user_pool_client(
+        UserPoolId=pool_client['pool_id'], ClientId=pool_client['client_id'])['UserPoolClient']
+    writable = utils_cognito.get_writable_trusted_claims(user_pool_client)
+    logger.info(f"check_cognito_client ::: {stage=} {pool_client=} {writable=}")
+    return writable
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the app client cannot write trusted token claims')
+    parser.add_argument('--stage', default='dev', help='chalice stage of .chalice/config.json')
+    args = parser.parse_args()
+    writable_claims = check_cognito_client(args.stage)
+    if writable_claims:
+        print(f'App client of stage {args.stage} can write {writable_claims}, remove them from its WriteAttributes')
+        sys.exit(1)
+    print(f'App client of stage {args.stage} cannot write trusted claims')
@@ -0,0 +1,97 @@
+"""
+Exports the customers table (or records of one company) to gzip NDJSON - one json record per line,
+the table is read with utils_db.parallel_scan, so the export scales with the number of segments.
+
+Progress of every segment is saved to the checkpoint file, a run started again with the same output,
+checkpoint and number of segments appends the rest of records to the output (records of the page which was
+being written when the run was interrupted may be exported twice).
+
+Usage (table and credentials are taken from the environment, as for the app):
+    CUSTOMERS_TABLE_NAME=restmonster-customers-dev python -m tools.export_table customers.ndjson.gz \
+        [--segments 8] [--company-id <uuid>] [--record-type order] [--checkpoint customers.checkpoint.json]
+"""
+import argparse
+import base64
+import gzip
+import json
+import os
+from decimal import Decimal
+from typing import Dict
+
+from boto3.dynamodb.conditions import Attr
+
+from chalicelib.utils import db as utils_db
+from chalicelib.utils.logger import logger
+
+
+def json_default(value):
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(json_default(item) if isinstance(item, Decimal) else item for item in value)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode()
+    raise TypeError(f'Object of type {value.__class__.__name__} is not JSON serializable')
+
+
+def get_filter_expression(company_id: str = None, record_type: str = None):
+    filter_expression = None
+    for condition in [Attr('company_id').eq(company_id) if company_id else None,
+                      Attr('record_type').eq(record_type) if record_type else None]:
+        if condition is not None:
+            filter_expression = condition if filter_expression is None else filter_expression & condition
+    return filter_expression
+
+
+def load_checkpoints(checkpoint_path: str) -> Dict:
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return {}
+    with open(checkpoint_path) as checkpoint_file:
+        return {int(segment): last_key for segment, last_key in json.load(checkpoint_file).items()}
+
+
+def save_checkpoints(checkpoint_path: str, checkpoints: Dict) -> None:
+    tmp_path = f'{checkpoint_path}.tmp'
+    with open(tmp_path, 'w') as checkpoint_file:
+        json.dump(checkpoints, checkpoint_file, default=json_default)
+    os.replace(tmp_path, checkpoint_path)
+
+
+def export_table(output_path: str, segments: int = utils_db.PARALLEL_SCAN_SEGMENTS_DEFAULT, company_id: str = None,
+                 record_type: str = None, checkpoint_path: str = None) -> Dict:
+    """
+    :return:
+    export stats {'records': number of records written by this run, 'segments': number of segments}
+    """
+    checkpoints = load_checkpoints(checkpoint_path)
+    records = 0
+    # appending to gzip adds a new gzip member, readers decompress concatenated members as one stream
+    with gzip.open(output_path, 'at' if checkpoints else 'wt', encoding='utf-8') as output:
+        def on_checkpoint(segment_checkpoints):
+            if checkpoint_path:
+                output.flush()
+                save_checkpoints(checkpoint_path, segment_checkpoints)
+
+        for record in utils_db.parallel_scan(segments=segments,
+                                             filter_expression=get_filter_expression(company_id, record_type),
+                                             checkpoints=checkpoints, on_checkpoint=on_checkpoint):
+            output.write(json.dumps(record, default=json_default, sort_keys=True))
+            output.write('\n')
+            records += 1
+
+    stats = {'records': records, 'segments': segments}
+    logger.info(f"export_table ::: {output_path=} {company_id=} {record_type=} {stats=}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export the customers table to gzip NDJSON')
+    parser.add_argument('output', help='path of the .ndjson.gz file')
+    parser.add_argument('--segments', type=int, default=utils_db.PARALLEL_SCAN_SEGMENTS_DEFAULT,
+                        help='number of parallel scan segments')
+    parser.add_argument('--company-id', help='export only records of the company')
+    parser.add_argument('--record-type', help='export only records of the type, e.g. order')
+    parser.add_argument('--checkpoint', help='path of the checkpoint file to resume an interrupted export')
+    args = parser.parse_args()
+    print(export_table(args.output, segments=args.segments, company_id=args.company_id,
+                       record_type=args.record_type, checkpoint_path=args.checkpoint))
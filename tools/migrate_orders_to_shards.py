@@ -0,0 +1,98 @@
+"""
+Moves orders from the old orders_{company_id} partition to the sharded orders_{company_id}_{restaurant_id}_{shard}
+partitions and pins order_shards of every restaurant which has orders but no order_shards attribute yet.
+
+All orders are copied first and old records are deleted only after all copies are written,
+so an interrupted run can be safely started again. Copies carry migrated_from (the old partkey),
+so their stream INSERTs don't send new order emails.
+
+Usage (table and credentials are taken from the environment, as for the app):
+    CUSTOMERS_TABLE_NAME=restmonster-customers-dev python -m tools.migrate_orders_to_shards [--dry-run]
+"""
+import argparse
+import re
+from typing import Dict, Iterator, Tuple
+
+from boto3.dynamodb.conditions import Attr
+
+from chalicelib.constants import keys_structure
+from chalicelib.constants.constants import ORDER_SHARDS_DEFAULT
+from chalicelib.orders import get_order_pk_sk
+from chalicelib.utils import db as utils_db, exceptions
+from chalicelib.utils.logger import logger
+
+UNSHARDED_ORDERS_PK_PATTERN = re.compile(r'^orders_(?P<company_id>[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-'
+                                         r'[0-9a-f]{12})$')
+
+
+def iter_unsharded_orders() -> Iterator[Dict]:
+    orders = utils_db.iter_scan_items(
+        filter_expression=Attr('record_type').eq('order') & Attr('partkey').begins_with('orders_')
+    )
+    return (order for order in orders if UNSHARDED_ORDERS_PK_PATTERN.match(order['partkey']))
+
+
+def get_restaurant_order_shards(company_id: str, restaurant_id: str, dry_run: bool) -> int:
+    """
+    :return:
+    order_shards of the restaurant, ORDER_SHARDS_DEFAULT is written to the restaurant if it is not set yet
+    """
+    partkey = keys_structure.restaurants_pk.format(company_id=company_id)
+    sortkey = keys_structure.restaurants_sk.format(restaurant_id=restaurant_id)
+    try:
+        restaurant = utils_db.get_db_item(partkey, sortkey)
+    except exceptions.RecordNotFound:
+        logger.warning(f"get_restaurant_order_shards ::: restaurant {restaurant_id} not found, "
+                       f"using {ORDER_SHARDS_DEFAULT=}")
+        return ORDER_SHARDS_DEFAULT
+    if restaurant.get('order_shards') is not None:
+        return int(restaurant['order_shards'])
+    if not dry_run:
+        utils_db.update_db_record(
+            key={'partkey': partkey, 'sortkey': sortkey},
+            update_body={'order_shards': ORDER_SHARDS_DEFAULT},
+            allowed_attrs_to_update=['order_shards'],
+            allowed_attrs_to_delete=[]
+        )
+    return ORDER_SHARDS_DEFAULT
+
+
+def get_sharded_key(order: Dict, restaurant_shards: Dict[Tuple[str, str], int], dry_run: bool) -> Tuple[str, str]:
+    company_id = UNSHARDED_ORDERS_PK_PATTERN.match(order['partkey']).group('company_id')
+    restaurant_id = order['restaurant_id']
+    if (company_id, restaurant_id) not in restaurant_shards:
+        restaurant_shards[(company_id, restaurant_id)] = get_restaurant_order_shards(company_id, restaurant_id,
+                                                                                     dry_run)
+    return get_order_pk_sk(company_id, restaurant_id, order['id_'], restaurant_shards[(company_id, restaurant_id)])
+
+
+def migrate_orders(dry_run: bool = False) -> Dict:
+    """
+    :return:
+    migration stats {'orders': number of moved orders, 'restaurants': number of restaurants}
+    """
+    restaurant_shards = {}
+    old_keys = []
+    with utils_db.batch_write() as writer:
+        for order in iter_unsharded_orders():
+            partkey, sortkey = get_sharded_key(order, restaurant_shards, dry_run)
+            old_keys.append({'partkey': order['partkey'], 'sortkey': order['sortkey']})
+            if not dry_run:
+                # the stream trigger sends no new order email for copies marked with migrated_from
+                writer.put({**order, 'partkey': partkey, 'sortkey': sortkey, 'migrated_from': order['partkey']})
+
+    if not dry_run:
+        with utils_db.batch_write() as writer:
+            for key in old_keys:
+                writer.delete(key)
+
+    stats = {'orders': len(old_keys), 'restaurants': len(restaurant_shards)}
+    logger.info(f"migrate_orders ::: {dry_run=} {stats=}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Move orders to sharded orders partitions')
+    parser.add_argument('--dry-run', action='store_true', help='only count orders which would be moved')
+    args = parser.parse_args()
+    print(migrate_orders(dry_run=args.dry_run))